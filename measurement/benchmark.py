@@ -0,0 +1,515 @@
+"""
+This module contains benchmarks for writing and reading measurements with the IO implementations.
+
+Run the benchmarks and save the results as a JSON baseline:
+python -m measurement.benchmark run --output baseline.json
+
+Run them again after a change and compare, flagging results that are worse than the baseline by more than 20%:
+python -m measurement.benchmark run --output current.json
+python -m measurement.benchmark compare baseline.json current.json --threshold 0.2
+
+Each benchmark is a function registered with the @benchmark decorator that returns a flat dict mapping result names
+to numbers. Result names end with a suffix that determines whether larger is better: '_seconds' and '_bytes' are
+costs, and '_per_second' is a rate. The --quick option uses smaller sizes for a fast smoke test.
+
+The generate command writes a synthetic dataset of roughly the requested size using bounded memory, for testing on
+multi-gigabyte files:
+python -m measurement.benchmark generate /path/to/root.npj --backend NpyJsonIO --gigabytes 4
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import builtins
+from collections import OrderedDict
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from measurement import core, measurements
+from measurement.io import chunked, dictionary, npyjson, packed, sqlite
+from measurement.test import utilities
+
+try:
+    from measurement.io import netcdf
+except ImportError:  # netCDF4 is an optional dependency.
+    netcdf = None
+
+# These are the filesystem calls counted by count_calls(), as (module, function name) pairs.
+COUNTED_CALLS = ((os, 'stat'), (os, 'listdir'), (os, 'scandir'), (builtins, 'open'))
+
+# Results with names that end with these suffixes are better when smaller or larger, respectively.
+COST_SUFFIXES = ('_seconds', '_bytes', '_calls')
+RATE_SUFFIXES = ('_per_second',)
+
+# This maps benchmark name to benchmark function, in the order in which they run.
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(function):
+    """
+    Register the given function, which takes the argument `quick` and returns a dict of results, as a benchmark.
+    """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+# Backends
+
+def backends():
+    """
+    Return an OrderedDict that maps backend name to a function that takes a directory and returns a new, empty IO
+    instance that stores its data in that directory.
+    """
+    factories = OrderedDict([('Dictionary', lambda directory: dictionary.Dictionary()),
+                             ('NpyJsonIO', lambda directory: npyjson.NpyJsonIO(os.path.join(directory, 'root.npj'))),
+                             ('NpyJsonIO_consolidated',
+                              lambda directory: npyjson.NpyJsonIO(os.path.join(directory, 'root.npj'),
+                                                                  consolidate=True)),
+                             ('ChunkedIO', lambda directory: chunked.ChunkedIO(os.path.join(directory, 'root.chk'))),
+                             ('PackedIO', lambda directory: packed.PackedIO(os.path.join(directory, 'root.pak'))),
+                             ('SqliteIO', lambda directory: sqlite.SqliteIO(os.path.join(directory, 'root.sqlite')))])
+    if netcdf is not None:
+        factories['NetcdfIO'] = lambda directory: netcdf.NetcdfIO(os.path.join(directory, 'root.nc'))
+    return factories
+
+
+def reopen(io):
+    """
+    Close the given IO instance and return a new instance that reads the same root, so that reads are not served from
+    anything the writing instance holds in memory. Dictionary instances are returned unchanged.
+    """
+    if isinstance(io, dictionary.Dictionary):
+        return io
+    io.close()
+    return io.__class__(io.root_path)
+
+
+# Timing
+
+def best_time(function, repeat):
+    """
+    Call the given function `repeat` times and return the shortest wall time in seconds and the last return value.
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_memory(function):
+    """
+    Call the given function and return the peak memory in bytes allocated through Python and numpy while it ran.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def count_calls(function):
+    """
+    Call the given function and return an OrderedDict that maps the name of each function in COUNTED_CALLS to the
+    number of times it was called, including calls made through os.path.
+    """
+    counts = OrderedDict((name, 0) for module, name in COUNTED_CALLS)
+    originals = [(module, name, getattr(module, name)) for module, name in COUNTED_CALLS]
+
+    def counting(name, original):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return original(*args, **kwargs)
+        return wrapper
+
+    for module, name, original in originals:
+        setattr(module, name, counting(name, original))
+    try:
+        function()
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+    return counts
+
+
+def nbytes(node):
+    """
+    Return the total size of the arrays in the given node and all the nodes that it contains.
+    """
+    total = 0
+    if isinstance(node, core.MeasurementList):
+        total += sum(nbytes(child) for child in node)
+    for name, value in node.__dict__.items():
+        if name.startswith('_'):
+            continue
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, core.Node):
+            total += nbytes(value)
+    return total
+
+
+def measure(backend, io_factory, node, partial_read, repeat, buffered=False):
+    """
+    Write the given node with a new IO instance and measure write throughput, full and partial read latency, and the
+    peak memory of a full read.
+
+    Parameters
+    ----------
+    backend : str
+        The backend name, used as a prefix for the result names.
+    io_factory : callable
+        A function that takes a directory and returns a new IO instance.
+    node : Node
+        The node to write and read.
+    partial_read : callable
+        A function that takes an IO instance and a node path and reads part of the node.
+    repeat : int
+        The number of repetitions; the best time is reported.
+    buffered : bool
+        If True, write the node as a single batch; see IO.batch().
+
+    Returns
+    -------
+    dict
+        The results.
+    """
+    name = 'node'
+    write_seconds = float('inf')
+    directory = None
+    for _ in range(repeat):
+        if directory is not None:
+            shutil.rmtree(directory)
+        directory = tempfile.mkdtemp()
+        io = io_factory(directory)
+        start = time.perf_counter()
+        io.write(node, name, buffered=buffered)
+        write_seconds = min(write_seconds, time.perf_counter() - start)
+    try:
+        io = reopen(io)
+        read_seconds, _ = best_time(lambda: io.read(name), repeat)
+        partial_seconds, _ = best_time(lambda: partial_read(io, name), repeat)
+        read_peak = peak_memory(lambda: io.read(name))
+        io.close()
+    finally:
+        shutil.rmtree(directory)
+    return {backend + '.write_seconds': write_seconds,
+            backend + '.write_bytes_per_second': nbytes(node) / write_seconds,
+            backend + '.read_seconds': read_seconds,
+            backend + '.read_bytes_per_second': nbytes(node) / read_seconds,
+            backend + '.partial_read_seconds': partial_seconds,
+            backend + '.read_peak_memory_bytes': read_peak}
+
+
+def prefixed(prefix, results):
+    return OrderedDict((prefix + '.' + key, value) for key, value in results.items())
+
+
+# Benchmarks
+
+@benchmark
+def array_size(quick=False):
+    """
+    Write and read TimeOrderedStreams of increasing length; the partial read is 1% of the data using a lazy read.
+    """
+    exponents = (10, 16) if quick else (10, 16, 20, 23)
+    repeat = 1 if quick else 3
+    results = OrderedDict()
+    for exponent in exponents:
+        node = utilities.fake_time_ordered_stream(num_samples=2 ** exponent)
+        stop = max(1, node.data.size // 100)
+        for backend, io_factory in backends().items():
+            results.update(prefixed('samples_2e{}'.format(exponent),
+                                    measure(backend, io_factory, node,
+                                            lambda io, name: io.read(name, lazy=True).data[:stop], repeat)))
+    return results
+
+
+@benchmark
+def channel_count(quick=False):
+    """
+    Write and read TimeOrderedStreamArrays with increasing numbers of channels; the partial read is one channel.
+    """
+    counts = (1, 16) if quick else (1, 16, 64, 256)
+    num_samples = 2 ** 10 if quick else 2 ** 14
+    repeat = 1 if quick else 3
+    results = OrderedDict()
+    for count in counts:
+        node = utilities.fake_time_ordered_stream_array(num_channels=count, num_samples=num_samples)
+        for backend, io_factory in backends().items():
+            results.update(prefixed('channels_{}'.format(count),
+                                    measure(backend, io_factory, node,
+                                            lambda io, name: io.read(name, lazy=True)[0].data, repeat)))
+    return results
+
+
+@benchmark
+def list_length(quick=False):
+    """
+    Write and read MeasurementLists of increasing length of small FrequencySweeps; the partial read is one element.
+    """
+    lengths = (10, 100) if quick else (10, 100, 1000)
+    repeat = 1 if quick else 3
+    results = OrderedDict()
+    for length in lengths:
+        node = core.MeasurementList([utilities.fake_frequency_sweep(num_frequencies=2 ** 8) for _ in range(length)])
+        for backend, io_factory in backends().items():
+            results.update(prefixed('length_{}'.format(length),
+                                    measure(backend, io_factory, node,
+                                            lambda io, name: io.read(core.join(name, '0')), repeat)))
+    return results
+
+
+@benchmark
+def complex_data(quick=False):
+    """
+    Write and read complex data as one long TimeOrderedStream, which measures conversion throughput, and as a
+    MeasurementList of many short TimeOrderedStreams, which measures the per-array overhead of complex types such as
+    netCDF4 compound types. The partial reads are 1% of the long stream and one element of the list.
+    """
+    num_samples = 2 ** 16 if quick else 2 ** 22
+    num_streams = 100 if quick else 2000
+    repeat = 1 if quick else 3
+    long_stream = utilities.fake_time_ordered_stream(num_samples=num_samples)
+    short_streams = core.MeasurementList([utilities.fake_time_ordered_stream(num_samples=2 ** 8)
+                                          for _ in range(num_streams)])
+    results = OrderedDict()
+    for backend, io_factory in backends().items():
+        results.update(prefixed('long', measure(backend, io_factory, long_stream,
+                                                lambda io, name: io.read(name, lazy=True).data[:num_samples // 100],
+                                                repeat)))
+        results.update(prefixed('many', measure(backend, io_factory, short_streams,
+                                                lambda io, name: io.read(core.join(name, '0')), repeat)))
+    return results
+
+
+@benchmark
+def node_count(quick=False):
+    """
+    Write and read a tree of 10,000 nodes with small arrays, a MeasurementList of MeasurementLists of FrequencySweeps,
+    which measures the per-node overhead of path resolution and metadata; the partial read is one deep node. The tree
+    is written as a single batch, which is how large trees should be written to NetcdfIO.
+    """
+    width = 10 if quick else 100
+    repeat = 1
+    tree = core.MeasurementList([core.MeasurementList([measurements.FrequencySweep(frequency=np.linspace(1, 2, 4),
+                                                                                   data=np.zeros(4, dtype='complex'),
+                                                                                   state={})
+                                                       for _ in range(width)])
+                                 for _ in range(width)])
+    deep = core.join(str(width - 1), str(width - 1))
+    results = OrderedDict()
+    for backend, io_factory in backends().items():
+        results.update(prefixed('nodes_{}'.format(width ** 2),
+                                measure(backend, io_factory, tree,
+                                        lambda io, name: io.read(core.join(name, deep)), repeat, buffered=True)))
+    return results
+
+
+@benchmark
+def listing_syscalls(quick=False):
+    """
+    Count the filesystem calls made by NpyJsonIO to read a MeasurementList of SweepStreams, with and without the
+    structural index; without it, every node directory is listed.
+    """
+    length = 5 if quick else 20
+    node = core.MeasurementList([utilities.fake_sweep_stream(num_frequencies=16, num_samples=16)
+                                 for _ in range(length)])
+    results = OrderedDict()
+    for backend in ('NpyJsonIO', 'NpyJsonIO_consolidated'):
+        directory = tempfile.mkdtemp()
+        try:
+            io = backends()[backend](directory)
+            io.write(node, 'node', buffered=True)
+            io.close()
+            for index in (True, False):
+                if not index:
+                    os.remove(os.path.join(io.root_path, core.INDEX))
+                reader = npyjson.NpyJsonIO(io.root_path)
+                counts = count_calls(lambda: reader.read('node'))
+                reader.close()
+                prefix = '{}.{}.{}'.format(backend, 'indexed' if index else 'scanned', length)
+                for name, count in counts.items():
+                    results['{}.{}_calls'.format(prefix, name)] = count
+        finally:
+            shutil.rmtree(directory)
+    return results
+
+
+@benchmark
+def state_dict(quick=False):
+    """
+    Measure the throughput of StateDict construction for realistic nested state: from a dict; from a StateDict, as
+    Measurement(state=...) does, which also validates it; with StateDict.trusted(), as IO.read() does for the state
+    that it reads; and as part of constructing a TimeOrderedStream, both from validated state and from trusted state,
+    as IO.read() does.
+    """
+    number = 1000 if quick else 20000
+    state = dict(utilities.corners)
+    state.update({'temperature': 0.1, 'attenuation': 30, 'lo_frequency': 3e9,
+                  'roach': {'boffile': 'readout.bof', 'adc_sample_rate': 512e6, 'tone_bins': list(range(16)),
+                            'waveform': {'amplitudes': [0.5] * 16, 'phases': [0.1] * 16}},
+                  'cryostat': {'stages': {'mixing_chamber': 0.01, 'still': 0.8, 'four_k': 4.1}, 'heater': False},
+                  'lockin': {'x': 0.1, 'y': -0.2, 'r': None, 'sensitivity': 1e-6}})
+    validated = core.StateDict(state)
+    stream = utilities.fake_time_ordered_stream(num_samples=16)
+    cases = OrderedDict([('dict', lambda: core.StateDict(state)),
+                         ('state_dict', lambda: core.StateDict(validated)),
+                         ('trusted', lambda: core.StateDict.trusted(state)),
+                         ('measurement', lambda: measurements.TimeOrderedStream(time=stream.time, data=stream.data,
+                                                                                state=validated)),
+                         ('trusted_measurement', lambda: measurements.TimeOrderedStream(
+                             time=stream.time, data=stream.data, state=core.StateDict.trusted(state)))])
+    results = OrderedDict()
+    for name, function in cases.items():
+        seconds, _ = best_time(lambda: [function() for _ in range(number)], repeat=3)
+        results['{}_per_second'.format(name)] = number / seconds
+    return results
+
+
+# Synthetic data
+
+def write_synthetic_dataset(io, node_path, total_bytes, num_channels=16, num_samples=2 ** 20):
+    """
+    Write a MeasurementList of TimeOrderedStreamArrays with complex data totaling roughly the given number of bytes,
+    using an IOList so that only one TimeOrderedStreamArray is in memory at a time.
+
+    Parameters
+    ----------
+    io : IO
+        The IO instance to write to.
+    node_path : str
+        The node path of the MeasurementList.
+    total_bytes : int
+        The approximate total size of the data arrays.
+    num_channels : int
+        The number of channels in each TimeOrderedStreamArray.
+    num_samples : int
+        The number of samples per channel in each TimeOrderedStreamArray.
+
+    Returns
+    -------
+    int
+        The number of TimeOrderedStreamArrays written.
+    """
+    array_bytes = num_channels * num_samples * np.dtype('complex128').itemsize
+    number = max(1, int(round(total_bytes / array_bytes)))
+    io_list = core.IOList()
+    io.write(io_list, node_path)
+    for n in range(number):
+        time_ = np.arange(num_samples, dtype='float64') + n * num_samples
+        data = np.empty((num_channels, num_samples), dtype='complex128')
+        data.real = np.random.randn(num_channels, num_samples)
+        data.imag = np.random.randn(num_channels, num_samples)
+        io_list.append(measurements.TimeOrderedStreamArray(time=time_, data=data, state=utilities.corners,
+                                                           description='synthetic TimeOrderedStreamArray'))
+    return number
+
+
+# Running and comparing
+
+def run(names=None, quick=False):
+    """
+    Run the benchmarks with the given names, or all of them, and return a dict containing the results and metadata.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    results = OrderedDict()
+    for name in names:
+        print("Running {}".format(name), file=sys.stderr)
+        results.update(prefixed(name, BENCHMARKS[name](quick=quick)))
+    return {'metadata': {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                         'python': platform.python_version(),
+                         'numpy': np.__version__,
+                         'platform': platform.platform(),
+                         'quick': quick},
+            'results': results}
+
+
+def compare(baseline, current, threshold):
+    """
+    Return a list of (name, baseline value, current value, change) tuples for the results in both dicts that are worse
+    in `current` by more than the fractional `threshold`. The change is the fractional increase of a cost or the
+    fractional decrease of a rate.
+    """
+    regressions = []
+    for name, baseline_value in baseline['results'].items():
+        try:
+            current_value = current['results'][name]
+        except KeyError:
+            continue
+        if not baseline_value:
+            continue
+        if name.endswith(COST_SUFFIXES):
+            change = current_value / baseline_value - 1
+        elif name.endswith(RATE_SUFFIXES):
+            change = 1 - current_value / baseline_value
+        else:
+            continue
+        if change > threshold:
+            regressions.append((name, baseline_value, current_value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m measurement.benchmark', description=__doc__.split('\n\n')[1])
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help="Run benchmarks and save the results as JSON.")
+    run_parser.add_argument('--output', help="The JSON file to write; the default is standard output.")
+    run_parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="The benchmarks to run.")
+    run_parser.add_argument('--quick', action='store_true', help="Use small sizes.")
+    compare_parser = subparsers.add_parser('compare', help="Flag regressions relative to a baseline.")
+    compare_parser.add_argument('baseline', help="The baseline JSON file.")
+    compare_parser.add_argument('current', help="The JSON file to compare to the baseline.")
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help="The fractional change to flag.")
+    generate_parser = subparsers.add_parser('generate', help="Write a synthetic dataset.")
+    generate_parser.add_argument('root_path', help="The root file or directory to create.")
+    generate_parser.add_argument('--backend', default='NpyJsonIO',
+                                 choices=['NpyJsonIO', 'ChunkedIO', 'PackedIO', 'SqliteIO', 'NetcdfIO'],
+                                 help="The IO class name.")
+    generate_parser.add_argument('--gigabytes', type=float, default=1., help="The approximate size of the dataset.")
+    generate_parser.add_argument('--channels', type=int, default=16, help="The number of channels per array.")
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        text = json.dumps(run(names=args.only, quick=args.quick), indent=2)
+        if args.output is None:
+            print(text)
+        else:
+            with open(args.output, 'w') as f:
+                f.write(text)
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for name, baseline_value, current_value, change in regressions:
+            print("{}: {:.4g} -> {:.4g} ({:+.1%})".format(name, baseline_value, current_value, change))
+        if regressions:
+            return 1
+        print("No regressions above {:.0%}.".format(args.threshold))
+    elif args.command == 'generate':
+        io_classes = {'NpyJsonIO': npyjson.NpyJsonIO, 'ChunkedIO': chunked.ChunkedIO, 'PackedIO': packed.PackedIO,
+                      'SqliteIO': sqlite.SqliteIO}
+        if netcdf is not None:
+            io_classes['NetcdfIO'] = netcdf.NetcdfIO
+        io = io_classes[args.backend](args.root_path)
+        number = write_synthetic_dataset(io, 'synthetic', int(args.gigabytes * 2 ** 30), num_channels=args.channels)
+        io.close()
+        print("Wrote {} TimeOrderedStreamArrays to {}".format(number, args.root_path))
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,26 +7,38 @@ This module contains the core classes of the measurement package:
 - MeasurementError
 - StateDict
 - IO
+- LazyArray
+- ReadCache
 It also contains some functions for handling paths in the hierarchical files.
 
 See __init__.py for the main package documentation.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent import futures
+import contextlib
 # import copy_reg
+import fnmatch
+import hashlib
 import importlib
 import inspect
+import json
 import keyword
 import logging
 from numbers import Number
 import re
+import threading
 
 import numpy as np
 import pandas as pd
 
+from measurement import metrics
+
 CLASS_NAME = '_class'  # This is the string used by IO objects to save class names.
 VERSION = '_version'  # This is the string used by IO objects to save class versions.
 METADATA = '_metadata'  # This is the string used by IO objects to save metadata dictionaries.
+INDEX = '_index'  # This is the string used by IO objects to save the structural index.
+FINGERPRINT = '_fingerprint'  # This is the string used by IO objects to save node fingerprints.
 
 # TODO: decide which names really need to be reserved
 # These names cannot be used for attributes because they are used as part of the public DataFrame interface.
@@ -38,6 +50,9 @@ RESERVED = (IO_CLASS_NAME, ROOT_PATH, NODE_PATH, NUMBER)  # io_node_path is incl
 # These strings have a corresponding private attribute.
 PRIVATE = ('io_node_path',)
 
+# This is the version of the format of the structural index records; see IO._read_index_log().
+INDEX_VERSION = 1
+
 # This character separates nodes in a node path.
 NODE_PATH_SEPARATOR = '/'
 
@@ -159,6 +174,38 @@ class Node(object):
                         dataframe['.'.join((key, ROOT_PATH))] = None
                         dataframe['.'.join((key, NODE_PATH))] = None
 
+    def fingerprint(self):
+        """
+        Return a digest of the contents of this node. Two nodes that hold the same data have the same fingerprint,
+        whether they are in memory or on disk, so fingerprints can be compared instead of the data themselves to find
+        duplicate or changed measurements.
+
+        The digest is a Merkle tree: it covers the class name, version, and public attributes of this node, the digest
+        of each of its arrays, and the fingerprint of each node that it contains. Arrays are hashed one block at a time,
+        so a LazyArray is read in blocks instead of all at once. IO classes store the fingerprint of each node that they
+        write; see IO.fingerprint().
+
+        Returns
+        -------
+        str
+            The hexadecimal BLAKE2b digest.
+        """
+        others = {}
+        children = {}
+        dimensions = getattr(self, 'dimensions', {})
+        for key, value in self.__dict__.items():
+            if key.startswith('_'):
+                continue
+            elif isinstance(value, Node):
+                children[key] = value.fingerprint()
+            elif key not in dimensions:
+                others[key] = value
+        if isinstance(self, MeasurementList):
+            for index, child in enumerate(self):
+                children[str(index)] = child.fingerprint()
+        arrays = dict((array_name, array_digest(getattr(self, array_name))) for array_name in dimensions)
+        return _node_digest(self.class_name(), getattr(self, VERSION, None), others, arrays, children)
+
     def _locate(self, node):
         """
         Subclasses should implement this method to enable nodes to discover their location in the node tree:
@@ -229,7 +276,8 @@ class Measurement(Node):
     property. For example, in the case above, the 'time' dimension could be implemented as a property. The instance
     would still pass validation as long as
     s21_raw.shape[0] == time.size
-    were True.
+    were True. An entry can also be a Dimensions instance, which is a tuple that carries a StoragePolicy describing how
+    the array should be chunked and compressed on disk.
 
     Content restrictions.
     Measurements store state information in a dictionary subclass called StateDict, which has attribute access and
@@ -264,7 +312,12 @@ class Measurement(Node):
         super(Measurement, self).__init__()
         if state is None:
             state = dict()
-        self.state = StateDict(state)
+        if type(state) is _TrustedStateDict:
+            # This state is adopted once without validation, and then becomes an ordinary StateDict.
+            object.__setattr__(state, '__class__', StateDict)
+            self.state = state
+        else:
+            self.state = StateDict(state)
         self.description = description
         if validate:
             self._validate_dimensions()
@@ -302,7 +355,7 @@ class Measurement(Node):
         """
         Recursively compare two measurements. At each level, the function tests that both instances have the same public
         attributes (meaning those that do not start with an underscore), that all these attributes are equal,
-        and that the classes of the measurements are equal. Because the data we store mixes booleans and numbers,
+        and that both measurements have the same class_name(). Because the data we store mixes booleans and numbers,
         boolean values stored as attributes are compared using identity, not equality. Note that this is not done
         within containers.
 
@@ -320,8 +373,10 @@ class Measurement(Node):
             True if self compares equal with other, and False if not.
         """
         try:
-            keys_s = ['__class__'] + [k for k in self.__dict__ if not k.startswith('_')]
-            keys_o = ['__class__'] + [k for k in other.__dict__ if not k.startswith('_')]
+            # Classes that are written to disk as another class, such as TimeOrderedStreamView, compare as that class.
+            assert isinstance(other, Node) and self.class_name() == other.class_name()
+            keys_s = [k for k in self.__dict__ if not k.startswith('_')]
+            keys_o = [k for k in other.__dict__ if not k.startswith('_')]
             assert set(keys_s) == set(keys_o)
             for key in keys_s:
                 value_s = getattr(self, key)
@@ -333,7 +388,9 @@ class Measurement(Node):
                     for meas_s, meas_o in zip(value_s, value_o):
                         assert meas_s.__eq__(meas_o)
                 # This allows arrays to contain NaN and be equal.
-                elif isinstance(value_s, np.ndarray) or isinstance(value_o, np.ndarray):
+                elif isinstance(value_s, (np.ndarray, LazyArray)) or isinstance(value_o, (np.ndarray, LazyArray)):
+                    value_s = np.asarray(value_s)
+                    value_o = np.asarray(value_o)
                     assert np.all(np.isnan(value_s) == np.isnan(value_o))
                     assert np.all(value_s[~np.isnan(value_s)] == value_o[~np.isnan(value_o)])
                 else:  # This will fail for NaN or sequences that contain any NaN values.
@@ -398,22 +455,44 @@ class MeasurementList(list, Node):
 class IOList(MeasurementList):
     """
     This class acts like a MeasurementList that writes Measurements to disk as they are added to the list. It can only
-    be created empty, and implements only the append() and extend() methods. To use this class, pass it as an argument
-    when instantiating a class that normally contains a MeasurementList, save that class to disk, then use the append()
-    or extend() methods to save measurements directly to disk instead of storing them in memory. The IO class must
-    remain open until writing is finished.
+    be created empty, and implements only the append() and extend() methods for adding measurements. To use this class,
+    pass it as an argument when instantiating a class that normally contains a MeasurementList, save that class to
+    disk, then use the append() or extend() methods to save measurements directly to disk instead of storing them in
+    memory. The IO class must remain open until writing is finished.
+
+    The list can be read while it is being written: len(), indexing, slicing, and iteration read the elements back from
+    disk as they are needed, so online analysis can consume measurements as they are acquired without keeping the whole
+    list in memory. The most recently appended measurements can also be kept in memory, so that reading them does not
+    access the disk; see __init__().
     """
 
     @classmethod
     def class_name(cls):
         return cls.__base__.__name__
 
-    def __init__(self):
-        super(IOList, self).__init__()
+    def __init__(self, window=0):
+        """
+        Return a new, empty IOList.
+
+        Parameters
+        ----------
+        window : int
+            The number of most recently appended measurements to keep in memory; indexing returns these instances
+            instead of reading them from disk.
+        """
+        # MeasurementList.__init__() iterates over the new list.
         self._len = 0
+        super(IOList, self).__init__()
+        if window:
+            self._window = deque(maxlen=window)
+        else:
+            self._window = None
 
     def append(self, item):
         self._io.write(item, join(self._io_node_path, str(len(self))))
+        item._parent = self
+        if self._window is not None:
+            self._window.append((self._len, item))
         self._len += 1
 
     def extend(self, iterable):
@@ -443,17 +522,48 @@ class IOList(MeasurementList):
 
     def __iter__(self):
         """
-        Instances of this class appear like empty lists, so iteration stops immediately.
+        Read and yield the measurements one at a time. Measurements appended during iteration are also yielded.
 
-        :return: an empty iterator.
+        Returns
+        -------
+        iterator
+            An iterator over the measurements in the list.
         """
-        return iter(())
+        index = 0
+        while index < len(self):
+            yield self[index]
+            index += 1
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
 
     def __len__(self):
         return self._len
 
     def __getitem__(self, item):
-        raise NotImplementedError()
+        """
+        Return the measurement at the given index, reading it from disk unless it is in the window, or a list of the
+        measurements in the given slice.
+        """
+        if isinstance(item, slice):
+            return [self[index] for index in range(*item.indices(len(self)))]
+        try:
+            index = item.__index__()
+        except AttributeError:
+            raise TypeError("{} indices must be integers or slices, not {}".format(self.__class__.__name__,
+                                                                                   type(item).__name__))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("{} index out of range".format(self.__class__.__name__))
+        if self._window is not None:
+            for window_index, window_item in self._window:
+                if window_index == index:
+                    return window_item
+        node = self._io.read(join(self._io_node_path, str(index)))
+        node._parent = self
+        return node
 
     def __setitem__(self, key, value):
         raise NotImplementedError()
@@ -470,6 +580,11 @@ class MeasurementError(Exception):
 
 
 # ToDo: when a dict is added after construction, it is not converted to a StateDict so there is no type checking
+# These names cannot be StateDict keys because they are keywords or would hide builtins.
+_RESERVED_NAMES = frozenset(keyword.kwlist) | frozenset(__builtins__ if isinstance(__builtins__, dict)
+                                                        else dir(__builtins__))
+
+
 class StateDict(dict):
     """
     This class adds attribute access and some content restrictions to the dict class.
@@ -492,6 +607,11 @@ class StateDict(dict):
     - JSON has only a single sequence type, so all iterable non-dictionary objects are converted to lists on input;
     - netCDF cannot write None, so it cannot be an element of a sequence;
     - ...
+
+    Validation is fast for the common cases. Each distinct key is checked once per process. Values whose type is
+    exactly bool, int, float, or str need no further checks, and lists and tuples are checked element by element without
+    first being tried as basic types. Since a StateDict can be modified, one created from another StateDict is validated
+    like any other. trusted() skips validation entirely, for dicts that are known to be valid.
     """
 
     __setattr__ = dict.__setitem__
@@ -508,15 +628,26 @@ class StateDict(dict):
     _invalid_value = "Key {0} maps to invalid value: {1!s} ({1!r})"
     _invalid_sequence_value = "Key {0} maps to a sequence containing invalid value: {1!s} ({1!r})"
 
+    _valid_name = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*$')
+    # These are the keys that have passed validation, up to MAX_VALID_KEYS of them.
+    _valid_keys = set()
+    MAX_VALID_KEYS = 2 ** 14
+    # Values of exactly these types are valid without further checks.
+    _scalar_types = frozenset([bool, int, float, str])
+
     def __init__(self, *args, **kwargs):
         super(StateDict, self).__init__(*args, **kwargs)
+        valid_keys = self._valid_keys
+        scalar_types = self._scalar_types
         for key, value in self.items():
-            if not isinstance(key, str):  # (str, unicode)):
-                raise MeasurementError(self._invalid_key_type)
-            elif re.match(r'[a-zA-Z_][a-zA-Z0-9_]*$', key) is None or keyword.iskeyword(key) or key in __builtins__:
-                raise MeasurementError(self._invalid_variable_name.format(key))
-            if isinstance(value, dict):
+            if key not in valid_keys:
+                self._validate_key(key)
+            if value is None or type(value) in scalar_types:
+                continue
+            elif isinstance(value, dict):
                 self[key] = StateDict(value)
+            elif type(value) in (list, tuple):
+                self[key] = self._validate_list(key, list(value))
             else:
                 # Given that we are testing for sequence-ness using iteration, we have to try value validation first
                 # because strings are iterable.
@@ -528,6 +659,46 @@ class StateDict(dict):
                     except TypeError:  # Not iterable, and str would have passed value validation
                         raise e
 
+    @staticmethod
+    def trusted(mapping):
+        """
+        Return a new StateDict with the contents of the given dict, without validating them. Nested dicts are converted
+        to StateDicts, and nothing else is copied. This is for dicts that are known to obey the restrictions, such as
+        state read from disk, which was validated before it was written.
+
+        The first Measurement created with the returned instance as its state adopts it without validating or copying
+        it again. After that it is an ordinary StateDict, so it is validated like any other if it is modified and used
+        as the state of another Measurement.
+
+        Parameters
+        ----------
+        mapping : dict
+            The dict to convert, which should not be used afterward.
+
+        Returns
+        -------
+        StateDict
+            A new instance that shares the values of the given dict.
+        """
+        return StateDict._from_valid(mapping, _TrustedStateDict)
+
+    @staticmethod
+    def _from_valid(mapping, class_):
+        state = class_.__new__(class_)
+        dict.update(state, mapping)
+        for key, value in mapping.items():
+            if isinstance(value, dict) and not isinstance(value, StateDict):
+                dict.__setitem__(state, key, StateDict._from_valid(value, StateDict))
+        return state
+
+    def _validate_key(self, key):
+        if not isinstance(key, str):  # (str, unicode)):
+            raise MeasurementError(self._invalid_key_type)
+        elif self._valid_name.match(key) is None or key in _RESERVED_NAMES:
+            raise MeasurementError(self._invalid_variable_name.format(key))
+        if len(self._valid_keys) < self.MAX_VALID_KEYS:
+            self._valid_keys.add(key)
+
     def _validate_value(self, key, value):
         if value is None or isinstance(value, self.ALLOWED_VALUE_TYPES):
             return value
@@ -535,8 +706,9 @@ class StateDict(dict):
             raise ValueError(self._invalid_value.format(key, value))
 
     def _validate_list(self, key, list_):
+        scalar_types = self._scalar_types
         for index, element in enumerate(list_):
-            if not isinstance(element, self.ALLOWED_VALUE_TYPES):
+            if type(element) not in scalar_types and not isinstance(element, self.ALLOWED_VALUE_TYPES):
                 try:
                     list_[index] = self._validate_list(key, list(element))
                 except TypeError:  # Not iterable, and str would have passed value validation
@@ -561,6 +733,15 @@ class StateDict(dict):
         return results
 
 
+class _TrustedStateDict(StateDict):
+    """
+    This class marks a StateDict returned by StateDict.trusted() that no Measurement has adopted yet; see
+    Measurement.__init__().
+    """
+
+    __slots__ = ()
+
+
 # ToDo: add if necessary
 # def pickle_state(s):
 #    return StateDict, (dict(s),)
@@ -568,6 +749,155 @@ class StateDict(dict):
 # copy_reg.pickle(StateDict, pickle_state)
 
 
+# Dimensions with these names are chunked with length one by auto_chunks(), so that each channel can be read without
+# reading the others.
+CHANNEL_DIMENSIONS = ('num_channels', 'channel')
+# This is the approximate size of the chunks chosen by auto_chunks().
+AUTO_CHUNK_BYTES = 2 ** 20
+
+
+class StoragePolicy(object):
+    """
+    This class describes how an IO implementation should lay out an array on disk. Attributes that are None are not
+    specified, so the value from a less specific policy or the default of the implementation is used; see merge().
+    Implementations that do not support an option ignore it; currently NetcdfIO uses all of them.
+
+    A policy can be set for a whole IO instance, where supported, and for a single array of a Measurement class by
+    using a Dimensions instance as its entry in the dimensions OrderedDict. The class policy takes precedence.
+    """
+
+    def __init__(self, chunks=None, compression=None, shuffle=None, checksum=None):
+        """
+        Return a new StoragePolicy.
+
+        Parameters
+        ----------
+        chunks : str, tuple, or dict
+            'auto' to use auto_chunks(), 'contiguous' to store the array unchunked, a tuple of chunk lengths with one
+            element per dimension, or a dict that maps dimension names to chunk lengths, with the remaining lengths
+            chosen by auto_chunks().
+        compression : int
+            The compression level from 0, meaning no compression, to 9.
+        shuffle : bool
+            If True, apply the byte shuffle filter before compression, which usually helps for numeric data.
+        checksum : bool
+            If True, store a checksum for each chunk that is verified on read.
+        """
+        self.chunks = chunks
+        self.compression = compression
+        self.shuffle = shuffle
+        self.checksum = checksum
+
+    def merge(self, other):
+        """
+        Return a new StoragePolicy with the attributes of this policy replaced by those of the given policy that are
+        not None. If other is None, return this policy.
+        """
+        if other is None:
+            return self
+        kwargs = dict(self.__dict__)
+        kwargs.update((key, value) for key, value in other.__dict__.items() if value is not None)
+        return StoragePolicy(**kwargs)
+
+    def chunk_shape(self, shape, dimensions, itemsize):
+        """
+        Return the tuple of chunk lengths for an array with the given shape, dimension names, and item size, or None if
+        the array should not be chunked or if the chunks are unspecified.
+        """
+        if self.chunks is None or self.chunks == 'contiguous' or not shape:
+            return None
+        if self.chunks == 'auto':
+            return auto_chunks(shape, dimensions, itemsize)
+        if isinstance(self.chunks, dict):
+            chunks = list(auto_chunks(shape, dimensions, itemsize))
+            for axis, dimension in enumerate(dimensions):
+                if dimension in self.chunks:
+                    chunks[axis] = self.chunks[dimension]
+        else:
+            chunks = list(self.chunks)
+        # A chunk cannot be longer than a fixed dimension; a dimension with length zero can grow.
+        return tuple(max(1, min(chunk, length)) if length else max(1, chunk) for chunk, length in zip(chunks, shape))
+
+    def __eq__(self, other):
+        return isinstance(other, StoragePolicy) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__,
+                               ', '.join('{}={!r}'.format(key, value) for key, value in sorted(self.__dict__.items())
+                                         if value is not None))
+
+
+class Dimensions(tuple):
+    """
+    This class is a tuple of dimension names that also carries a StoragePolicy, for use as an entry in the dimensions
+    OrderedDict of a Measurement class. It behaves exactly like a tuple everywhere else. Example:
+
+    dimensions = OrderedDict([('time', ('time',)),
+                              ('data', Dimensions(('num_channels', 'time'), chunks='auto'))])
+    """
+
+    def __new__(cls, names, storage=None, **kwargs):
+        """
+        Return a new Dimensions instance.
+
+        Parameters
+        ----------
+        names : tuple of str
+            The dimension names.
+        storage : StoragePolicy
+            The policy for the array; if None, a policy is created from the keyword arguments.
+        kwargs
+            The arguments to StoragePolicy() if no policy is given.
+        """
+        self = super(Dimensions, cls).__new__(cls, names)
+        if storage is None:
+            storage = StoragePolicy(**kwargs)
+        self.storage = storage
+        return self
+
+    def __repr__(self):
+        return '{}({}, storage={!r})'.format(self.__class__.__name__, tuple.__repr__(self), self.storage)
+
+
+def auto_chunks(shape, dimensions, itemsize, target_bytes=AUTO_CHUNK_BYTES):
+    """
+    Return a tuple of chunk lengths for an array with the given shape and dimension names. Dimensions named in
+    CHANNEL_DIMENSIONS get length one, so that reading one channel reads only its own chunks. The remaining dimensions
+    are filled starting from the last, which is contiguous in memory, until a chunk contains about target_bytes. A
+    dimension with length zero is treated as unbounded, because it may grow; see IO.open_array_writer().
+
+    Parameters
+    ----------
+    shape : tuple of int
+        The shape of the array.
+    dimensions : tuple of str
+        The dimension names of the array.
+    itemsize : int
+        The size in bytes of each element.
+    target_bytes : int
+        The approximate size of each chunk.
+
+    Returns
+    -------
+    tuple of int
+        The chunk lengths.
+    """
+    chunks = [1] * len(shape)
+    budget = max(1, target_bytes // itemsize)
+    for axis in reversed(range(len(shape))):
+        if dimensions[axis] in CHANNEL_DIMENSIONS:
+            continue
+        length = shape[axis] if shape[axis] else budget
+        chunks[axis] = max(1, min(length, budget))
+        budget = max(1, budget // chunks[axis])
+    return tuple(chunks)
+
+
 class IO(object):
     """
     This is an abstract class that specifies the IO interface.
@@ -585,6 +915,8 @@ class IO(object):
 
     # Subclasses can define a conventional extension for files or directories they create.
     EXTENSION = ''
+    # If True, write() hashes the data it writes and stores the fingerprint of each node; see fingerprint().
+    store_fingerprints = True
 
     def __init__(self, root_path, metadata=None):
         """
@@ -599,11 +931,24 @@ class IO(object):
         metadata : dict
             If the root does not exist, write this dict to the root node.
         """
+        self._batch = None
+        self._hooks = []
+        self._uninstrumented = {}
+        self._index = None
+        self._index_children = None
+        self._index_pending = None
+        self._index_length = None
+        # This counts the reads in progress; see _reading().
+        self._reads = 0
+        self._reads_lock = threading.Lock()
+        self._array_writers = []
+        self._appended_records = OrderedDict()
         self.root_path = root_path
         if self._root_path_exists(self.root_path):
             if metadata is not None:
                 raise ValueError("Cannot set metadata for an existing root: {}".format(root_path))
             self._root = self._open_existing(self.root_path)
+            self._load_index()
             try:
                 metadata = self.read_other(NODE_PATH_SEPARATOR, METADATA)
                 if metadata is not None:
@@ -616,6 +961,7 @@ class IO(object):
             self._root = self._create_new(self.root_path)
             self.write_other(NODE_PATH_SEPARATOR, METADATA, metadata)
             self.metadata = metadata
+            self._start_index()
 
     # These private methods must be implemented by subclasses.
 
@@ -640,6 +986,12 @@ class IO(object):
         """
         return True
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def default_name(self, node):
         """
         Return a name for the given Node subclass or instance that is guaranteed to be unique at the root level.
@@ -655,9 +1007,87 @@ class IO(object):
             A string consisting of the class name and a number that is one plus the number of nodes already stored at
             the root level, guaranteeing uniqueness.
         """
-        return node.class_name() + str(len(self.node_names()))
+        num_nodes = len(self.node_names())
+        if self._batch is not None:
+            num_nodes += len([node_path for node_path in self._batch.created if len(explode(node_path)) == 1])
+        return node.class_name() + str(num_nodes)
+
+    @contextlib.contextmanager
+    def instrument(self, hook=None):
+        """
+        Return a context manager that records the IO operations performed by this object within it.
+
+        Within the context, every call to the methods listed in metrics.OPERATIONS, including the recursive calls to
+        _read_node() and _write_node(), is timed and passed as a metrics.Event to the record() method of the hook. The
+        methods are wrapped only while at least one hook is installed, so instrumentation costs nothing otherwise.
+
+        Example:
+        with io.instrument() as io_metrics:
+            io.read('SweepStream0')
+        print(io_metrics.summary())
+        io_metrics.write_chrome_trace('read.json')
+
+        Parameters
+        ----------
+        hook : metrics.IOMetrics
+            The object that records the events; if None, a new IOMetrics instance is used.
+
+        Returns
+        -------
+        metrics.IOMetrics
+            The hook, as the target of the with statement.
+        """
+        if hook is None:
+            hook = metrics.IOMetrics()
+        if not self._hooks:
+            # Instance attributes shadow the class methods, so any that were already set, such as wrappers installed
+            # by the caller, are wrapped in turn and restored on exit.
+            self._uninstrumented = dict((operation, self.__dict__[operation]) for operation in metrics.OPERATIONS
+                                        if operation in self.__dict__)
+            for operation in metrics.OPERATIONS:
+                setattr(self, operation, metrics.instrumented(self, operation, getattr(self, operation), self._hooks))
+        self._hooks.append(hook)
+        try:
+            yield hook
+        finally:
+            self._hooks.remove(hook)
+            if not self._hooks:
+                for operation in metrics.OPERATIONS:
+                    if operation in self._uninstrumented:
+                        setattr(self, operation, self._uninstrumented[operation])
+                    else:
+                        self.__dict__.pop(operation, None)
+                self._uninstrumented = {}
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Return a context manager that buffers all writes made within it and commits them when it exits.
+
+        Within the context, write() builds the node tree and the list of values to write in memory without accessing
+        the disk. When the context exits normally, the buffered operations are passed to _commit(), which
+        implementations can override to write them in an order that suits the format. If the commit fails, the nodes
+        created by the batch are removed using _remove_node() and the exception is raised again. If an exception is
+        raised within the context, nothing is written. Nested batches are merged into the outermost batch.
+
+        Nodes written in a batch are tagged with this IO object and their node path only after the commit succeeds.
+
+        Example:
+        with io.batch():
+            io.write(sweep, 'sweep')
+            io.write(stream, 'stream')
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        self._batch = batch = _Batch()
+        try:
+            yield batch
+        finally:
+            self._batch = None
+        self._commit_batch(batch)
 
-    def write(self, node, node_path=None):
+    def write(self, node, node_path=None, buffered=False):
         """
         Write the node to disk at the given node path. If no node path is specified, write at the root level using the
         name given by self.default_name(). If a node path is specified, all but the final node must already exist.
@@ -668,7 +1098,13 @@ class IO(object):
             The instance to write to disk.
         node_path : str
              The node path to the node that will contain this object.
+        buffered : bool
+            If True, write the node as a single batch; see batch().
         """
+        if buffered and self._batch is None:
+            with self.batch():
+                self.write(node, node_path)
+            return
         if node_path is None:
             node_path = self.default_name(node)
         elif node_path == NODE_PATH_SEPARATOR:
@@ -678,16 +1114,47 @@ class IO(object):
             absolute_node_path = node_path
         else:
             absolute_node_path = NODE_PATH_SEPARATOR + node_path
-        self._write_node(node, absolute_node_path)
+        if self._batch is not None:
+            self._batch.check_new(self, absolute_node_path)
+            self._write_node(node, absolute_node_path)
+        else:
+            self._index_begin()
+            try:
+                self._write_node(node, absolute_node_path)
+            except Exception:
+                self._index_invalidate()
+                raise
+            finally:
+                self._invalidate_read_cache()
+            self._index_end()
         logger.info("Wrote {} to node path {}".format(node.__class__.__name__, absolute_node_path))
 
-    def read(self, node_path, translate=None, force=False):
+    def read(self, node_path, translate=None, force=False, lazy=False, include=None, exclude=None, workers=None):
         """
         Read a measurement from disk and return it.
 
         The `force` keyword is intended for inspecting measurements for which the data on disk does not match the class
         structure; see _instantiate().
 
+        If `lazy` is True, each array is returned as a LazyArray instead of a numpy ndarray: its shape and dtype are
+        available without reading the data, and indexing it reads only the requested region. The IO object must remain
+        open until the data are no longer needed.
+
+        The `include` and `exclude` keywords restrict which nodes and arrays are read. Each pattern is a glob that is
+        matched against paths relative to the node being read, such as 'sweep/streams/*/data' or '/stream', where each
+        wildcard matches a single node name; a pattern without a separator, such as 'data', matches a node or array
+        with that name at any depth. If `include` is given, only the nodes and arrays that match it, and everything
+        below the nodes that match it, are read. Excluded nodes and arrays, and the nodes that cannot contain anything
+        included, are never accessed on disk. A skipped node is absent from its parent, so skipping a node that is a
+        required argument requires `force=True`. Skipping an element of a MeasurementList also requires `force=True`,
+        because the element is omitted from the list and the position of each later element no longer matches its
+        stored node path. A skipped array is returned as a LazyArray, or is absent if `force` is True.
+
+        If `workers` is greater than one, the elements of each MeasurementList and the arrays of each node are read
+        using a pool of that many threads, which helps most when reads are limited by latency rather than bandwidth.
+        Measurements are returned in the same order as a serial read. IO implementations that cannot read from multiple
+        threads in their current state read serially instead; see _begin_parallel().
+
         Parameters
         ----------
         node_path : str
@@ -696,6 +1163,14 @@ class IO(object):
             A dictionary with entries 'original_class': 'new_class'; class names must be fully-qualified.
         force : bool
             If True, attempt to create the classes specified on disk even if the variables do not match.
+        lazy : bool
+            If True, return LazyArray instances instead of reading array data from disk.
+        include : str or iterable of str
+            If given, read only the nodes and arrays that match these patterns.
+        exclude : str or iterable of str
+            If given, do not read the nodes and arrays that match these patterns.
+        workers : int
+            If greater than one, the maximum number of threads used to read the node.
 
         Returns
         -------
@@ -711,7 +1186,119 @@ class IO(object):
             absolute_node_path = node_path
         if translate is None:
             translate = {}
-        return self._read_node(node_path=absolute_node_path, translate=translate, force=force)
+        if include is None and exclude is None:
+            projection = None
+        else:
+            projection = _Projection(absolute_node_path, include, exclude)
+        with self._reading():
+            if workers is None or workers < 2 or not self._begin_parallel():
+                return self._read_node(node_path=absolute_node_path, translate=translate, force=force, lazy=lazy,
+                                       projection=projection)
+            try:
+                with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    return self._read_node(node_path=absolute_node_path, translate=translate, force=force, lazy=lazy,
+                                           projection=projection, executor=executor)
+            finally:
+                self._end_parallel()
+
+    def fingerprint(self, node_path):
+        """
+        Return the fingerprint of the node at the given node path, which is equal to Node.fingerprint() of the node that
+        it contains; see Node.fingerprint(). This allows two stored nodes, or a file and a reference copy, to be
+        compared without reading them.
+
+        The fingerprint of each node is stored when it is written, along with a stamp of its array shapes and of the
+        fingerprints of the nodes it contains. A stored fingerprint is used if the stamp still matches, so no array data
+        are read unless the node was written without fingerprints or has grown since, for example through
+        open_array_writer() or IOList.append(). Only the nodes that have changed are hashed again.
+
+        Parameters
+        ----------
+        node_path : str
+            The path to the node, in the form 'node0/node1/node2' or '/node0/node1/node2'.
+
+        Returns
+        -------
+        str
+            The hexadecimal BLAKE2b digest.
+        """
+        validate_node_path(node_path)
+        if node_path == NODE_PATH_SEPARATOR:
+            raise MeasurementError("The IO root has no fingerprint.")
+        if not node_path.startswith(NODE_PATH_SEPARATOR):
+            node_path = NODE_PATH_SEPARATOR + node_path
+        with self._reading():
+            return self._fingerprint_node(node_path)
+
+    def append_array(self, node_path, key, chunk):
+        """
+        Append the given chunk to the stored array with the given key at node_path, along its first axis. This opens
+        and closes an ArrayWriter, so use open_array_writer() to append many chunks.
+
+        Parameters
+        ----------
+        node_path : str
+            The node path of the node that contains the array.
+        key : str
+            The name of the array.
+        chunk : numpy.ndarray
+            The data to append; see ArrayWriter.append().
+        """
+        with self.open_array_writer(node_path, key) as writer:
+            writer.append(chunk)
+
+    def open_array_writer(self, node_path, key):
+        """
+        Return an ArrayWriter that appends chunks to a stored array along its first axis, so that a long acquisition can
+        be saved without holding all of its data in memory.
+
+        To create an array that can grow, write a measurement with an array whose first axis has length zero. Arrays
+        that share a dimension, such as the time and data arrays of a TimeOrderedStream, can be appended to by separate
+        writers that are open at the same time. When the last writer for a node closes, the shapes of the arrays in the
+        node are checked against the dimensions of its class, as Measurement._validate_dimensions() would on
+        instantiation, and a MeasurementError is raised if they do not match.
+
+        Example:
+        io.write(TimeOrderedStream(time=np.zeros(0), data=np.zeros(0, dtype='complex')), 'stream')
+        with io.open_array_writer('stream', 'time') as time_writer, io.open_array_writer('stream', 'data') as writer:
+            for time, data in acquire():
+                time_writer.append(time)
+                writer.append(data)
+
+        Parameters
+        ----------
+        node_path : str
+            The node path of the node that contains the array.
+        key : str
+            The name of the array.
+
+        Returns
+        -------
+        ArrayWriter
+            An open writer, which is also a context manager that closes it.
+
+        Raises
+        ------
+        MeasurementError
+            If the array cannot be appended to, or if it is already open for appending.
+        """
+        validate_node_path(node_path)
+        if not node_path.startswith(NODE_PATH_SEPARATOR):
+            node_path = NODE_PATH_SEPARATOR + node_path
+        if self._batch is not None:
+            raise MeasurementError("Arrays cannot be appended to within a batch.")
+        if key not in self.array_names(node_path):
+            raise ValueError("Array not found: {}".format(join(node_path, key)))
+        for writer in self._array_writers:
+            if writer.node_path == node_path and writer.key == key:
+                raise MeasurementError("Array is already open for appending: {}".format(join(node_path, key)))
+        writer = self._open_array_writer(node_path, key)
+        # The unmatched 'begin' marker tells other readers that the shapes in the index may be stale until the last
+        # writer closes.
+        if not self._array_writers and self._index is not None:
+            self._append_index([{'begin': True}])
+        self._array_writers.append(writer)
+        return writer
 
     # The remaining public methods should be implemented by subclasses.
     # TODO: update comments, especially with exceptions raised and handling of private variables.
@@ -752,6 +1339,36 @@ class IO(object):
         """
         pass
 
+    def read_lazy_array(self, node_path, key):
+        """
+        Return a LazyArray for array key at node_path. Implementations should determine the shape and dtype without
+        reading the array data; this default implementation reads the whole array.
+        """
+        array = self.read_array(node_path, key)
+        return LazyArray(self, node_path, key, array.shape, array.dtype)
+
+    def read_array_slice(self, node_path, key, index):
+        """
+        Return the region of array key at node_path selected by the given index as a numpy ndarray, with the same
+        result as read_array(node_path, key)[index]. Implementations should read only the region; bounding_box()
+        reduces an index to a hyperslab that can be read directly. This default implementation reads the whole array.
+
+        Parameters
+        ----------
+        node_path : str
+            The node path of the node that contains the array.
+        key : str
+            The name of the array.
+        index
+            A numpy index: an integer, slice, integer array, or Ellipsis, or a tuple of these.
+
+        Returns
+        -------
+        numpy.ndarray
+            The selected region, which may be a view of data that the IO instance holds in memory.
+        """
+        return np.asarray(self.read_array(node_path, key))[index]
+
     def node_names(self, node_path=NODE_PATH_SEPARATOR):
         """
         Return the names of all nodes contained in the node at node_path.
@@ -772,6 +1389,332 @@ class IO(object):
 
     # Private methods
 
+    @contextlib.contextmanager
+    def _reading(self):
+        """
+        Return a context manager that wraps each read() and fingerprint() call. The index is refreshed once, when the
+        outermost read starts, and the listing methods use it as it is until the last read finishes, so they access
+        neither the disk nor the root from the threads of a parallel read. This calls _begin_read() and _end_read().
+        """
+        with self._reads_lock:
+            if not self._reads:
+                self._refresh_index()
+            self._reads += 1
+        self._begin_read()
+        try:
+            yield
+        finally:
+            self._end_read()
+            with self._reads_lock:
+                self._reads -= 1
+
+    def _begin_read(self):
+        """
+        This is called when read() starts, and _end_read() is called when it finishes, so implementations can keep
+        state, such as cached directory listings, for the lifetime of a read. Calls can be nested, for example by reads
+        made from other threads.
+        """
+        pass
+
+    def _end_read(self):
+        pass
+
+    def _begin_parallel(self):
+        """
+        Prepare to be called from multiple threads by IO.read() and return True, or return False if this is not
+        possible, in which case the read is serial. Implementations that are not thread-safe can, for example, open a
+        handle per thread here.
+        """
+        return True
+
+    def _end_parallel(self):
+        """
+        Release any resources acquired by _begin_parallel().
+        """
+        pass
+
+    # These methods maintain the structural index; see _read_index_log().
+
+    def _read_index_log(self):
+        """
+        Implementations that store a structural index should return the list of records appended to it by
+        _append_index_log(), in order, or None if there is no index. If the stored index cannot be parsed, return the
+        records that precede the problem followed by None, which marks the index as stale.
+
+        The index allows the listing methods node_names(), array_names(), and other_names() to answer without accessing
+        the disk: implementations should call _indexed_names() first and scan the disk only if it returns None. The
+        index is an append-only log. Each write() appends a 'begin' marker before it changes anything on disk, then a
+        record for each node that it wrote, then an 'end' marker. If a write fails, or the process dies, the 'begin'
+        marker is never matched and readers ignore the index. Implementations wrap their create_node(), write_other(),
+        and write_array() methods in _direct_write() so that calling them directly also updates the index. The index is
+        reloaded if another IO instance or process has appended to it, once per read() and before each listing made
+        outside a read; see _refresh_index().
+        """
+        return None
+
+    def _append_index_log(self, records):
+        """
+        Implementations that store a structural index should append the given list of dicts to it and return True.
+        """
+        return False
+
+    def _index_log_length(self):
+        """
+        Implementations that store a structural index should return its current length, in any unit that increases with
+        every call to _append_index_log(), or None if there is no index.
+        """
+        return None
+
+    def _append_index(self, records):
+        """
+        Append the given records to the index. If no other writer has appended to it since it was loaded, the index in
+        memory remains current, so its stored length is updated; otherwise the next listing reloads it.
+        """
+        current = self._index_log_length() == self._index_length
+        appended = self._append_index_log(records)
+        if current:
+            self._index_length = self._index_log_length()
+        return appended
+
+    def _start_index(self):
+        if self._append_index([{INDEX: INDEX_VERSION}]):
+            self._index = {}
+            self._index_children = {NODE_PATH_SEPARATOR: []}
+
+    def _refresh_index(self):
+        """
+        Reload the index if its stored length has changed since it was loaded, which means that another IO instance or
+        process has written to the root, unless this instance is writing or reading. The listing methods call this only
+        outside reads; see _reading().
+        """
+        if self._index_length is None or self._index_pending is not None or self._array_writers or self._reads:
+            return
+        if self._index_log_length() != self._index_length:
+            self._index = None
+            self._index_children = None
+            self._load_index()
+
+    def _load_index(self):
+        self._index_length = self._index_log_length()
+        records = self._read_index_log()
+        if records is None:
+            # An existing root that contains no nodes, such as an empty directory, can start a new index.
+            if not self.node_names(NODE_PATH_SEPARATOR):
+                self._start_index()
+            return
+        elif not records or records[0] != {INDEX: INDEX_VERSION}:
+            return
+        index = {}
+        children = {NODE_PATH_SEPARATOR: []}
+        open_writes = 0
+        for record in records[1:]:
+            if record is None:
+                return
+            elif 'begin' in record:
+                open_writes += 1
+            elif 'end' in record:
+                open_writes -= 1
+            else:
+                self._index_record(index, children, record)
+        if open_writes == 0:
+            self._index = index
+            self._index_children = children
+
+    @staticmethod
+    def _index_record(index, children, record):
+        index[record['path']] = record
+        children.setdefault(record['path'], [])
+        parent, name = split(record['path'])
+        siblings = children.setdefault(parent, [])
+        if name not in siblings:
+            siblings.append(name)
+
+    def _index_begin(self):
+        if self._index is not None:
+            self._append_index([{'begin': True}])
+            self._index_pending = []
+
+    def _index_end(self):
+        if self._index is not None:
+            self._append_index(self._index_pending + [{'end': True}])
+            for record in self._index_pending:
+                self._index_record(self._index, self._index_children, record)
+            self._index_pending = None
+
+    def _index_invalidate(self):
+        """
+        Stop using the index, because the disk may no longer match it; the unmatched 'begin' marker ensures that later
+        readers also ignore it.
+        """
+        self._index = None
+        self._index_children = None
+        self._index_pending = None
+
+    @contextlib.contextmanager
+    def _direct_write(self, *operation):
+        """
+        Return a context manager that wraps the body of the create_node(), write_other(), or write_array() method called
+        with the given operation, in the format of _commit(). If the method was called directly, rather than by write()
+        or a batch commit, the index is updated as write() would update it.
+        """
+        if self._index is None or self._index_pending is not None:
+            yield
+            return
+        self._index_begin()
+        try:
+            yield
+        except Exception:
+            self._index_invalidate()
+            raise
+        node_path = NODE_PATH_SEPARATOR + NODE_PATH_SEPARATOR.join(explode(operation[1]))
+        if operation[0] == _Batch.CREATE_NODE:
+            record = {'path': node_path, 'class': None, 'version': None, 'arrays': {}, 'others': []}
+        else:
+            # The root node has no record, so its names are always found by scanning.
+            record = self._index.get(node_path)
+        if record is not None and operation[0] != _Batch.CREATE_NODE:
+            record = dict(record, arrays=dict(record['arrays']), others=list(record['others']))
+            key, value = operation[2:4]
+            if operation[0] == _Batch.WRITE_ARRAY:
+                value = np.asarray(value)
+                record['arrays'][key] = [list(value.shape), value.dtype.str]
+            elif key == CLASS_NAME:
+                record['class'] = value
+            elif key == VERSION:
+                record['version'] = value
+            elif not key.startswith('_') and key not in record['others']:
+                record['others'].append(key)
+        if record is not None:
+            self._index_pending.append(record)
+        self._index_end()
+
+    def _indexed_names(self, node_path, kind):
+        """
+        Return a list of the names of the given kind, which is 'nodes', 'arrays', or 'others', contained in the node at
+        the given node path according to the index, or None if the index has no valid entry for the node.
+        """
+        self._refresh_index()
+        if self._index is None:
+            return None
+        node_path = NODE_PATH_SEPARATOR + NODE_PATH_SEPARATOR.join(explode(node_path))
+        if kind == 'nodes':
+            try:
+                return list(self._index_children[node_path])
+            except KeyError:
+                return None
+        try:
+            return list(self._index[node_path][kind])
+        except KeyError:
+            return None
+
+    def _indexed_array(self, node_path, key):
+        """
+        Return a (shape, dtype) tuple for the given array according to the index, or None if it is not indexed.
+        """
+        self._refresh_index()
+        if self._index is None:
+            return None
+        node_path = NODE_PATH_SEPARATOR + NODE_PATH_SEPARATOR.join(explode(node_path))
+        try:
+            shape, dtype = self._index[node_path]['arrays'][key]
+        except KeyError:
+            return None
+        return tuple(shape), np.dtype(dtype)
+
+    def _open_array_writer(self, node_path, key):
+        """
+        Return an instance of an ArrayWriter subclass that appends to the given array; see open_array_writer().
+        Implementations should raise MeasurementError if the array cannot grow.
+        """
+        raise NotImplementedError("{} cannot append to arrays.".format(self.__class__.__name__))
+
+    def _close_array_writer(self, writer):
+        """
+        This is called by ArrayWriter.close() to update the index with the new shape of the array and, when the last
+        writer for the node closes, to validate the dimensions of the node.
+        """
+        self._array_writers.remove(writer)
+        self._invalidate_read_cache()
+        if self._index is not None:
+            record = self._index.get(writer.node_path)
+            if record is not None:
+                record = dict(record, arrays=dict(record['arrays']))
+                record['arrays'][writer.key] = [list(writer.shape), writer.dtype.str]
+                self._index_record(self._index, self._index_children, record)
+                self._appended_records[writer.node_path] = record
+            if not self._array_writers:
+                self._append_index(list(self._appended_records.values()) + [{'end': True}])
+                self._appended_records.clear()
+        if not any(other.node_path == writer.node_path for other in self._array_writers):
+            self._validate_array_dimensions(writer.node_path)
+
+    def _validate_array_dimensions(self, node_path):
+        """
+        Raise MeasurementError if the stored arrays in the given node that share a dimension have different lengths
+        along it.
+        """
+        try:
+            version = self.read_other(node_path, VERSION)
+        except ValueError:
+            version = None
+        class_ = resolve_class(self.read_other(node_path, CLASS_NAME), version, {})
+        array_names = self.array_names(node_path)
+        lengths = {}
+        for array_name, dimension_tuple in getattr(class_, 'dimensions', {}).items():
+            if array_name in array_names:
+                shape = self.read_lazy_array(node_path, array_name).shape
+                for dimension, length in zip(dimension_tuple, shape):
+                    if lengths.setdefault(dimension, length) != length:
+                        raise MeasurementError("Shape of {} does not match size of {}.".format(
+                            join(node_path, array_name), dimension_tuple))
+
+    def _commit(self, operations):
+        """
+        Perform the given buffered write operations. Each operation is a tuple whose first element is the name of the
+        method to call and whose remaining elements are its arguments: ('create_node', node_path),
+        ('write_other', node_path, key, value), or ('write_array', node_path, key, array, dimensions). The operations
+        are listed in the order in which they would have been performed without buffering.
+
+        Implementations can override this method to write more efficiently. This implementation creates all the nodes,
+        then writes all the other values, then all the arrays; within each group the order is preserved, so the arrays
+        of each node are written in the order of its dimensions OrderedDict.
+        """
+        for method_name in (_Batch.CREATE_NODE, _Batch.WRITE_OTHER, _Batch.WRITE_ARRAY):
+            method = getattr(self, method_name)
+            for operation in operations:
+                if operation[0] == method_name:
+                    method(*operation[1:])
+
+    def _remove_node(self, node_path):
+        """
+        Remove the node at the given node path and everything it contains, if it exists. This is used to roll back a
+        failed batch commit.
+        """
+        raise NotImplementedError("{} cannot remove nodes.".format(self.__class__.__name__))
+
+    def _commit_batch(self, batch):
+        self._index_begin()
+        try:
+            self._commit(batch.operations)
+        except Exception:
+            self._invalidate_read_cache()
+            try:
+                for node_path in reversed(batch.top_level()):
+                    self._remove_node(node_path)
+            except Exception:
+                logger.exception("Failed to roll back batch write.")
+                self._index_invalidate()
+            else:
+                self._index_pending = []
+                self._index_end()
+            raise
+        self._invalidate_read_cache()
+        self._index_pending = batch.index_records
+        self._index_end()
+        for node, node_path in batch.nodes:
+            node._io = self
+            node._io_node_path = node_path
+
     def __getattr__(self, item):
         if item in self.node_names():
             return self.read(item)
@@ -795,61 +1738,785 @@ class IO(object):
             This will usually be a subclass of Measurement or MeasurementList.
         node_path : str
             The path of the new node into which the instance will be written.
+
+        Returns
+        -------
+        str
+            The fingerprint of the node, or None if fingerprints are not stored.
         """
-        self.create_node(node_path)
-        self.write_other(node_path, CLASS_NAME, node.class_name())
+        # In batch mode, the operations are recorded instead of performed.
+        writer = self if self._batch is None else self._batch
+        record = {'path': node_path, 'class': node.class_name(), 'version': getattr(node, VERSION, None),
+                  'arrays': {}, 'others': []}
+        writer.create_node(node_path)
+        writer.write_other(node_path, CLASS_NAME, node.class_name())
         if hasattr(node, VERSION):  # ToDo: seems like this should always be True
-            self.write_other(node_path, VERSION, getattr(node, VERSION))
+            writer.write_other(node_path, VERSION, getattr(node, VERSION))
         else:
-            self.write_other(node_path, VERSION, None)
+            writer.write_other(node_path, VERSION, None)
+        # These are the contents of the fingerprint; see Node.fingerprint().
+        others = {}
+        arrays = {}
+        children = {}
         for key, value in node.__dict__.items():
             if not key.startswith('_'):  # Private attributes are not written to disk
                 if isinstance(value, Node):
-                    self._write_node(value, join(node_path, key))
+                    children[key] = self._write_node(value, join(node_path, key))
                 elif hasattr(node, 'dimensions') and key in node.dimensions:
                     pass  # Skip array writing on the first pass so that the dimensions can be created in order.
                 else:
-                    self.write_other(node_path, key, value)
+                    writer.write_other(node_path, key, value)
+                    record['others'].append(key)
+                    others[key] = value
         if isinstance(node, MeasurementList):
             for index, child in enumerate(node):
-                self._write_node(child, join(node_path, str(index)))
+                children[str(index)] = self._write_node(child, join(node_path, str(index)))
         # Saving arrays in order allows the netCDF group to create the dimensions.
         if hasattr(node, 'dimensions'):
             for array_name, dimensions in node.dimensions.items():
-                self.write_array(node_path, array_name, getattr(node, array_name), dimensions)
+                array = getattr(node, array_name)
+                if isinstance(array, LazyArray):
+                    array = np.asarray(array)
+                writer.write_array(node_path, array_name, array, dimensions)
+                record['arrays'][array_name] = [list(array.shape), array.dtype.str]
+                if self.store_fingerprints:
+                    arrays[array_name] = array_digest(array)
+        if self.store_fingerprints:
+            digest = _node_digest(node.class_name(), getattr(node, VERSION, None), others, arrays, children)
+            shapes = dict((array_name, shape) for array_name, (shape, dtype) in record['arrays'].items())
+            writer.write_other(node_path, FINGERPRINT, '{}:{}'.format(digest, _fingerprint_stamp(shapes, children)))
+        else:
+            digest = None
+        if self._index is not None:
+            if self._batch is None:
+                self._index_pending.append(record)
+            else:
+                self._batch.index_records.append(record)
         # Update the node with information about how it was saved.
-        node._io = self
-        node._io_node_path = node_path
+        if self._batch is None:
+            node._io = self
+            node._io_node_path = node_path
+        else:
+            self._batch.nodes.append((node, node_path))
+        return digest
+
+    def _read_node(self, node_path, translate, force, lazy=False, projection=None, executor=None):
+        """
+        Read and return the node at the given node path, including all nodes that it contains.
 
-    def _read_node(self, node_path, translate, force):
+        If `executor` is not None, the elements of a MeasurementList and the arrays of each node are submitted to it,
+        while the remaining nodes are read in the calling thread so that they can also submit work. Reads that run in
+        the executor are serial, which guarantees that the bounded pool cannot deadlock while waiting for itself.
+        """
+        cache = _read_cache
+        if cache is not None and isinstance(self.root_path, str) and not (translate or force or lazy or projection):
+            cache_key = (self.root_path, node_path)
+            node = cache.get(cache_key)
+            if node is not None:
+                return node
+        else:
+            cache_key = None
         saved_class_name = self.read_other(node_path, CLASS_NAME)
         try:
             version = self.read_other(node_path, VERSION)
         except ValueError:
             version = None
-        full_class_name = translate.get(saved_class_name, full_name(saved_class_name, version))
-        class_ = get_class(full_class_name)
+        class_ = resolve_class(saved_class_name, version, translate)
         measurement_names = self.node_names(node_path)
+        if projection is not None:
+            projected = [name for name in measurement_names if projection.read_node(join(node_path, name))]
+            if len(projected) < len(measurement_names) and issubclass(class_, MeasurementList) and not force:
+                raise MeasurementError("Reading {} would skip elements of a MeasurementList; use force=True to omit "
+                                       "them.".format(node_path))
+            measurement_names = projected
         if issubclass(class_, MeasurementList):
             # Use the name of each measurement, which is an int, to restore the order in the sequence.
-            contents = [self._read_node(join(node_path, measurement_name), translate, force)
-                        for measurement_name in sorted(measurement_names, key=int)]
+            child_paths = [join(node_path, measurement_name)
+                           for measurement_name in sorted(measurement_names, key=int)]
+            if executor is None:
+                contents = [self._read_node(child_path, translate, force, lazy, projection)
+                            for child_path in child_paths]
+            else:
+                contents = [future.result() for future in
+                            [executor.submit(self._read_node, child_path, translate, force, lazy, projection)
+                             for child_path in child_paths]]
             node = class_(contents)
         else:
             variables = {}
-            for measurement_name in measurement_names:
-                variables[measurement_name] = self._read_node(join(node_path, measurement_name), translate, force)
+            arrays = {}
             array_names = self.array_names(node_path)
+            read_array = self.read_lazy_array if lazy else self.read_array
             for array_name in array_names:
-                variables[array_name] = self.read_array(node_path, array_name)
+                if projection is None or projection.read_array(join(node_path, array_name)):
+                    if executor is None:
+                        arrays[array_name] = read_array(node_path, array_name)
+                    else:
+                        arrays[array_name] = executor.submit(read_array, node_path, array_name)
+                elif not force:
+                    arrays[array_name] = self.read_lazy_array(node_path, array_name)
+            for measurement_name in measurement_names:
+                variables[measurement_name] = self._read_node(join(node_path, measurement_name), translate, force,
+                                                              lazy, projection, executor)
             for other_name in self.other_names(node_path):
                 variables[other_name] = self.read_other(node_path, other_name)
+            # The state was validated before it was written, so Measurement.__init__() adopts it without validation.
+            state = variables.get('state')
+            if type(state) is dict and issubclass(class_, Measurement):
+                variables['state'] = StateDict.trusted(state)
+            for array_name, array in arrays.items():
+                if isinstance(array, futures.Future):
+                    array = array.result()
+                variables[array_name] = array
             node = _instantiate(class_, variables, force)
         # Update the node with information about how it was loaded.
         node._io = self
         node._io_node_path = node_path
+        if cache_key is not None:
+            cache.put(cache_key, node)
         return node
 
+    def _fingerprint_node(self, node_path):
+        """
+        Return the fingerprint of the node at the given node path, using the stored fingerprint if it is still valid.
+        """
+        children = dict((name, self._fingerprint_node(join(node_path, name))) for name in self.node_names(node_path))
+        arrays = dict((name, self.read_lazy_array(node_path, name)) for name in self.array_names(node_path))
+        shapes = dict((name, list(array.shape)) for name, array in arrays.items())
+        try:
+            stored = self.read_other(node_path, FINGERPRINT)
+        except ValueError:
+            stored = None
+        if stored is not None:
+            digest, stamp = stored.split(':')
+            if stamp == _fingerprint_stamp(shapes, children):
+                return digest
+        try:
+            version = self.read_other(node_path, VERSION)
+        except ValueError:
+            version = None
+        others = dict((name, self.read_other(node_path, name)) for name in self.other_names(node_path))
+        return _node_digest(self.read_other(node_path, CLASS_NAME), version, others,
+                            dict((name, array_digest(array)) for name, array in arrays.items()), children)
+
+    def _invalidate_read_cache(self):
+        cache = _read_cache
+        if cache is not None and isinstance(self.root_path, str):
+            cache.invalidate(self.root_path)
+
+
+class ArrayWriter(object):
+    """
+    This class appends chunks to an array stored on disk along its first axis; see IO.open_array_writer().
+    Implementations subclass it, call this __init__() with the stored shape and dtype, and implement _append() and,
+    if they hold resources, _close(). The shape attribute is updated after each chunk is appended.
+    """
+
+    def __init__(self, io, node_path, key, shape, dtype):
+        self.io = io
+        self.node_path = node_path
+        self.key = key
+        self.shape = tuple(int(length) for length in shape)
+        self.dtype = np.dtype(dtype)
+        self.closed = False
+        if not self.shape:
+            raise MeasurementError("Cannot append to a 0-d array: {}".format(join(node_path, key)))
+        if self.dtype.hasobject:
+            raise MeasurementError("Cannot append to an object array: {}".format(join(node_path, key)))
+
+    def append(self, chunk):
+        """
+        Append the given array to the stored array. The chunk must have the same shape as the stored array except
+        along the first axis, and its dtype must be castable to the stored dtype without changing its kind.
+
+        Parameters
+        ----------
+        chunk : numpy.ndarray
+            The data to append.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed ArrayWriter.")
+        chunk = np.asarray(chunk)
+        if chunk.shape[1:] != self.shape[1:] or chunk.ndim != len(self.shape):
+            raise ValueError("Cannot append chunk with shape {} to array with shape {}.".format(chunk.shape,
+                                                                                               self.shape))
+        if not np.can_cast(chunk.dtype, self.dtype, casting='same_kind'):
+            raise ValueError("Cannot append chunk with dtype {} to array with dtype {}.".format(chunk.dtype,
+                                                                                               self.dtype))
+        chunk = np.ascontiguousarray(chunk, dtype=self.dtype)
+        if chunk.shape[0]:
+            self._append(chunk)
+            self.shape = (self.shape[0] + chunk.shape[0],) + self.shape[1:]
+
+    def close(self):
+        """
+        Finish appending. This updates the index and, if this is the last open writer for the node, validates the
+        dimensions of the node; see IO.open_array_writer().
+        """
+        if self.closed:
+            return
+        try:
+            self._close()
+        finally:
+            self.closed = True
+            self.io._close_array_writer(self)
+
+    def _append(self, chunk):
+        """
+        Write the given C-contiguous array, which has the stored dtype, after the data already stored.
+        """
+        raise NotImplementedError()
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, {!r}, shape={})'.format(self.__class__.__name__, self.io, self.node_path, self.key,
+                                                       self.shape)
+
+
+class LazyArray(object):
+    """
+    This class stands in for a numpy array that is stored on disk. The shape and dtype are known without reading the
+    data, and indexing an instance reads only the requested region and returns a numpy ndarray. Passing an instance to
+    numpy.asarray() reads the entire array.
+
+    Indexing calls IO.read_array_slice(), which IO implementations override to read array regions efficiently;
+    subclasses can also override _read().
+    """
+
+    def __init__(self, io, node_path, key, shape, dtype):
+        """
+        Return a new LazyArray instance.
+
+        Parameters
+        ----------
+        io : IO
+            The IO instance that contains the array; it must remain open while the data are accessed.
+        node_path : str
+            The node path of the node that contains the array.
+        key : str
+            The name of the array.
+        shape : tuple
+            The shape of the array.
+        dtype : numpy.dtype
+            The dtype of the array.
+        """
+        self.io = io
+        self.node_path = node_path
+        self.key = key
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        try:
+            return self.shape[0]
+        except IndexError:
+            raise TypeError("len() of unsized object")
+
+    def __getitem__(self, index):
+        return self._read(index)
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def __array__(self, dtype=None):
+        array = np.asarray(self._read(Ellipsis))
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return array
+
+    def __repr__(self):
+        return '{}({}, {}, shape={}, dtype={})'.format(self.__class__.__name__, repr(self.node_path), repr(self.key),
+                                                       self.shape, self.dtype)
+
+    def _read(self, index):
+        return self.io.read_array_slice(self.node_path, self.key, index)
+
+
+def bounding_box(index, shape):
+    """
+    Reduce a numpy index into an array with the given shape to the smallest box that contains every selected element
+    and an index into that box. Reading the box and indexing it with the second index gives the same result as indexing
+    the whole array, so IO implementations can answer read_array_slice() with one hyperslab read.
+
+    Parameters
+    ----------
+    index
+        An integer, slice, integer array, or Ellipsis, or a tuple of these.
+    shape : tuple of int
+        The shape of the array.
+
+    Returns
+    -------
+    tuple or None
+        A (box, local) tuple, where box is a tuple of (start, stop) pairs with one per axis and local is the index into
+        the box, or None if the index contains anything else, such as a boolean array or numpy.newaxis.
+
+    Raises
+    ------
+    IndexError
+        If the index is out of bounds or has too many elements.
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    positions = [position for position, item in enumerate(index) if item is Ellipsis]
+    if len(positions) > 1:
+        return None
+    if positions:
+        position = positions[0]
+        index = index[:position] + (slice(None),) * (len(shape) - len(index) + 1) + index[position + 1:]
+    if len(index) > len(shape):
+        raise IndexError("too many indices for array: array is {}-dimensional, but {} were indexed".format(
+            len(shape), len(index)))
+    index = index + (slice(None),) * (len(shape) - len(index))
+    box = []
+    local = []
+    for axis, (item, length) in enumerate(zip(index, shape)):
+        if isinstance(item, slice):
+            items = range(*item.indices(length))
+            if not items:
+                box.append((0, 0))
+                local.append(slice(None))
+                continue
+            first, last = min(items), max(items) + 1
+            box.append((first, last))
+            end = items[-1] - first + items.step
+            local.append(slice(items[0] - first, end if end >= 0 else None, items.step))
+        elif isinstance(item, (bool, np.bool_)) or item is None:
+            return None
+        elif isinstance(item, (int, np.integer)):
+            n = int(item)
+            if not -length <= n < length:
+                raise IndexError("index {} is out of bounds for axis {} with size {}".format(n, axis, length))
+            n %= length
+            box.append((n, n + 1))
+            local.append(0)
+        else:
+            items = np.asarray(item)
+            if items.dtype.kind not in 'iu':
+                return None
+            if not items.size:
+                box.append((0, 0))
+                local.append(items)
+                continue
+            if items.min() < -length or items.max() >= length:
+                raise IndexError("index {} is out of bounds for axis {} with size {}".format(
+                    items.min() if items.min() < -length else items.max(), axis, length))
+            items = items % length
+            first = int(items.min())
+            box.append((first, int(items.max()) + 1))
+            local.append(items - first)
+    return tuple(box), tuple(local)
+
+
+# This is the approximate number of bytes of array data hashed at a time by Node.fingerprint() and IO.fingerprint().
+FINGERPRINT_BLOCK_BYTES = 2 ** 22
+
+
+def _hasher(digest_size=32):
+    return hashlib.blake2b(digest_size=digest_size)
+
+
+def _canonical_json(value):
+    """
+    Return the given value as JSON bytes that do not depend on key order, on whether sequences are lists, tuples, or
+    arrays, or on whether integral numbers are ints or floats, so that a value hashes the same before it is written and
+    after it is read back by any IO class. Like Measurement.__eq__(), this treats 1 and 1.0 as equal, but not 1 and
+    True.
+    """
+    return json.dumps(_canonical_value(value), sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def _canonical_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, dict):
+        return dict((key, _canonical_value(item)) for key, item in value.items())
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical_value(item) for item in value]
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    elif isinstance(value, complex):
+        return {'complex': [_canonical_value(value.real), _canonical_value(value.imag)]}
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    # Values that cannot be stored on disk have no canonical form.
+    return repr(value)
+
+
+def array_digest(array):
+    """
+    Return the hexadecimal digest of the dtype, shape, and little-endian bytes of the given array, which may be a
+    LazyArray, hashing at most about FINGERPRINT_BLOCK_BYTES at a time.
+    """
+    if not isinstance(array, (np.ndarray, LazyArray)):
+        array = np.asarray(array)
+    hasher = _hasher()
+    if array.dtype.hasobject:
+        hasher.update(_canonical_json(['object', list(array.shape), np.asarray(array).tolist()]))
+        return hasher.hexdigest()
+    dtype = array.dtype.newbyteorder('<')
+    hasher.update(_canonical_json([dtype.str, list(array.shape)]))
+    if isinstance(array, np.ndarray) and array.flags.c_contiguous and array.dtype == dtype:
+        hasher.update(array)  # Contiguous arrays are hashed in place.
+    elif not array.ndim:
+        hasher.update(np.ascontiguousarray(np.asarray(array), dtype=dtype))
+    else:
+        rows = max(1, FINGERPRINT_BLOCK_BYTES // max(1, dtype.itemsize * int(np.prod(array.shape[1:]))))
+        for start in range(0, array.shape[0], rows):
+            if isinstance(array, LazyArray):
+                block = array.io.read_array_slice(array.node_path, array.key, (slice(start, start + rows),))
+            else:
+                block = array[start:start + rows]
+            hasher.update(np.ascontiguousarray(block, dtype=dtype))
+    return hasher.hexdigest()
+
+
+def _node_digest(class_name, version, others, arrays, children):
+    """
+    Return the hexadecimal digest of a node from its class name, version, dict of other values, dict of array digests,
+    and dict of the fingerprints of the nodes it contains.
+    """
+    hasher = _hasher()
+    hasher.update(_canonical_json([class_name, version, others, arrays, children]))
+    return hasher.hexdigest()
+
+
+def _fingerprint_stamp(shapes, children):
+    """
+    Return a short digest of the array shapes and child fingerprints of a node, which is stored with its fingerprint.
+    Appending to an array, or adding or changing a node that it contains, changes the stamp, which shows that the
+    stored fingerprint is stale.
+    """
+    hasher = _hasher(digest_size=8)
+    hasher.update(_canonical_json([shapes, children]))
+    return hasher.hexdigest()
+
+
+class ReadCache(object):
+    """
+    This class is a memory-bounded cache of measurements read from disk, keyed by (root_path, node_path), that evicts
+    the least-recently-used entries when the total size of the cached arrays exceeds its byte budget.
+
+    Enable the cache with enable_read_cache(). While it is enabled, IO.read() and from_series() return cached
+    measurements instead of reading them again. Every node in a tree is cached separately, so reading a node and then
+    one of its children, or the reverse, shares the cached child. Each entry holds every array in the tree of its node,
+    so the size of the cache is the total nbytes of the distinct arrays held by all entries: an array shared by a node
+    and its cached ancestors is counted once. Since a cached node keeps its children in memory, evicting an entry also
+    evicts the cached entries of its ancestors. Only reads that use the default options are cached, and the cached
+    entries for a root are invalidated whenever an IO object writes to that root.
+
+    Cached measurements are shared between all callers. A cached node refers to the IO object that read it, as does
+    every node in its tree, so an entry is discarded instead of returned once any of those IO objects has been closed.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Return a new, empty ReadCache.
+
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum total size of the arrays in the cached measurements.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        # This maps each key to (node, ids of the arrays in its tree, IO objects that read the nodes in its tree).
+        self._entries = OrderedDict()
+        # This maps id() of each array held by an entry to [nbytes, number of entries that hold it].
+        self._arrays = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the node cached with the given (root_path, node_path) key, or None if it is not cached or if an IO object
+        that read part of it has been closed.
+        """
+        with self._lock:
+            node = self._lookup(key)
+            if node is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return node
+
+    def put(self, key, node):
+        """
+        Cache the given node with the given (root_path, node_path) key, evicting entries as necessary.
+        """
+        arrays, ios = self._walk(node)
+        if sum(array.nbytes for array in arrays.values()) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (node, list(arrays), ios)
+            for array_id, array in arrays.items():
+                counted = self._arrays.setdefault(array_id, [array.nbytes, 0])
+                if not counted[1]:
+                    self.bytes += array.nbytes
+                counted[1] += 1
+            while self.bytes > self.max_bytes:
+                evicted = next(iter(self._entries))
+                for ancestor in self._ancestors(evicted):
+                    if ancestor in self._entries:
+                        self._remove(ancestor)
+                        self.evictions += 1
+                self._remove(evicted)
+                self.evictions += 1
+
+    def invalidate(self, root_path):
+        """
+        Remove all cached nodes read from the given root.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == root_path]:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove all cached nodes; the statistics are not reset.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._arrays.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Return a dict containing the cache statistics.
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'bytes': self.bytes,
+                    'max_bytes': self.max_bytes}
+
+    def _lookup(self, key):
+        """
+        Return the node cached with the given key and mark it as the most recently used, without updating statistics. An
+        entry that contains a node read by a closed IO object is removed, along with the entries of its ancestors.
+        """
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            return None
+        self._entries[key] = entry
+        if any(io.closed for io in entry[2]):
+            for stale in [key] + self._ancestors(key):
+                self._remove(stale)
+            return None
+        return entry[0]
+
+    def _remove(self, key):
+        try:
+            node, array_ids, ios = self._entries.pop(key)
+        except KeyError:
+            return
+        for array_id in array_ids:
+            counted = self._arrays[array_id]
+            counted[1] -= 1
+            if not counted[1]:
+                del self._arrays[array_id]
+                self.bytes -= counted[0]
+
+    @staticmethod
+    def _ancestors(key):
+        """
+        Return a list of the keys of the nodes that contain the node with the given key.
+        """
+        root_path, node_path = key
+        ancestors = []
+        while node_path != NODE_PATH_SEPARATOR:
+            node_path = split(node_path)[0]
+            ancestors.append((root_path, node_path))
+        return ancestors
+
+    @staticmethod
+    def _walk(node):
+        """
+        Return a dict that maps id() to each array in the tree of the given node, and a list of the distinct IO objects
+        that read the nodes in the tree. The ids are stable while an entry holds the node, since the node keeps the
+        arrays alive.
+        """
+        arrays = {}
+        ios = []
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            io = getattr(node, '_io', None)
+            if io is not None and not any(io is known for known in ios):
+                ios.append(io)
+            if isinstance(node, MeasurementList):
+                nodes.extend(node)
+                continue
+            for name, value in node.__dict__.items():
+                if isinstance(value, np.ndarray):
+                    arrays[id(value)] = value
+                elif isinstance(value, Node) and not name.startswith('_'):
+                    nodes.append(value)
+        return arrays, ios
+
+
+# This is the ReadCache used by IO.read(), or None if caching is disabled.
+_read_cache = None
+
+
+def enable_read_cache(max_bytes):
+    """
+    Enable caching of measurements read from disk using a new ReadCache with the given byte budget, and return it.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the arrays in the cached measurements.
+
+    Returns
+    -------
+    ReadCache
+        The new cache, which can be used to examine statistics.
+    """
+    global _read_cache
+    _read_cache = ReadCache(max_bytes)
+    return _read_cache
+
+
+def disable_read_cache():
+    """
+    Disable caching of measurements read from disk and discard the cache.
+    """
+    global _read_cache
+    _read_cache = None
+
+
+class _Batch(object):
+    """
+    This class records the write operations performed within IO.batch(); see IO._commit() for their format.
+    """
+
+    CREATE_NODE = 'create_node'
+    WRITE_OTHER = 'write_other'
+    WRITE_ARRAY = 'write_array'
+
+    def __init__(self):
+        self.operations = []
+        self.created = []
+        self.nodes = []
+        self.index_records = []
+
+    def create_node(self, node_path):
+        self.operations.append((self.CREATE_NODE, node_path))
+        self.created.append(node_path)
+
+    def write_other(self, node_path, key, value):
+        self.operations.append((self.WRITE_OTHER, node_path, key, value))
+
+    def write_array(self, node_path, key, value, dimensions):
+        self.operations.append((self.WRITE_ARRAY, node_path, key, value, dimensions))
+
+    def check_new(self, io, node_path):
+        """
+        Raise MeasurementError if a node already exists at the given node path, either on disk or in this batch, so that
+        the conflict is detected before anything is written.
+        """
+        existing, new = split(node_path)
+        if node_path in self.created or (existing not in self.created and new in io.node_names(existing)):
+            raise MeasurementError("Node already exists: {}".format(node_path))
+
+    def top_level(self):
+        """
+        Return a list of the created node paths whose parents were not created by this batch.
+        """
+        created = set(self.created)
+        return [node_path for node_path in self.created if split(node_path)[0] not in created]
+
+
+class _Projection(object):
+    """
+    This class decides which nodes and arrays are read by IO.read() when it is given `include` or `exclude` patterns.
+
+    Each pattern is stored as a (anchored, names) tuple: an anchored pattern matches a path relative to the node being
+    read, while an unanchored pattern is a single name that matches the final name of a path at any depth.
+    """
+
+    def __init__(self, node_path, include, exclude):
+        self.root_length = len(explode(node_path))
+        self.include = self._parse(include)
+        self.exclude = self._parse(exclude)
+
+    @staticmethod
+    def _parse(patterns):
+        if patterns is None:
+            return None
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        return [(pattern.startswith(NODE_PATH_SEPARATOR) or NODE_PATH_SEPARATOR in pattern, explode(pattern))
+                for pattern in patterns]
+
+    @staticmethod
+    def _matches(pattern, names):
+        """Return True if the given pattern matches the given relative path exactly."""
+        anchored, pattern_names = pattern
+        if not anchored:
+            return bool(names) and fnmatch.fnmatchcase(names[-1], pattern_names[0])
+        return (len(pattern_names) == len(names) and
+                all(fnmatch.fnmatchcase(n, p) for n, p in zip(names, pattern_names)))
+
+    def _excluded(self, names):
+        return self.exclude is not None and any(self._matches(pattern, names) for pattern in self.exclude)
+
+    def _included(self, names):
+        """Return True if the given relative path or one of its ancestors matches an include pattern."""
+        if self.include is None:
+            return True
+        return any(self._matches(pattern, names[:length])
+                   for pattern in self.include for length in range(1, len(names) + 1))
+
+    def _may_contain_included(self, names):
+        for anchored, pattern_names in self.include:
+            if not anchored:  # This could match something at any depth.
+                return True
+            elif (len(pattern_names) > len(names) and
+                  all(fnmatch.fnmatchcase(n, p) for n, p in zip(names, pattern_names))):
+                return True
+        return False
+
+    def read_node(self, node_path):
+        names = explode(node_path)[self.root_length:]
+        if self._excluded(names):
+            return False
+        return self._included(names) or self._may_contain_included(names)
+
+    def read_array(self, node_path):
+        names = explode(node_path)[self.root_length:]
+        return not self._excluded(names) and self._included(names)
+
 
 # Class-related functions
 
@@ -861,9 +2528,17 @@ def get_class(full_class_name):
 
 # ToDo: look at effect of None in number field, and handle it here
 def from_series(series):
-    io_class = get_class(full_name(class_name=series[IO_CLASS_NAME], version=None))
-    io = io_class(series[ROOT_PATH])
-    node = io.read(series[NODE_PATH])
+    node = None
+    cache = _read_cache
+    if cache is not None:
+        node_path = series[NODE_PATH]
+        if not node_path.startswith(NODE_PATH_SEPARATOR):
+            node_path = NODE_PATH_SEPARATOR + node_path
+        node = cache.get((series[ROOT_PATH], node_path))  # A hit avoids opening the root.
+    if node is None:
+        io_class = get_class(full_name(class_name=series[IO_CLASS_NAME], version=None))
+        io = io_class(series[ROOT_PATH])
+        node = io.read(series[NODE_PATH])
     if NUMBER in series and pd.notnull(series[NUMBER]):
         return node[series[NUMBER]]
     else:
@@ -901,25 +2576,9 @@ def _instantiate(class_, variables, force):
     class_
         A new instance.
     """
-    # The Measurement framework does not support varargs or keywords, so these should be None.
-    args, varargs, keywords, defaults = inspect.getargspec(class_.__init__)
-    # Populate this list from last to first.
-    arg_values = []
-    for arg, default in zip(reversed(args), reversed(defaults)):
-        if arg == 'validate' and force:
-            arg_values.append(False)  # Skip validation to increase the chances of success.
-        else:
-            arg_values.append(variables.get(arg, default))
-    for arg in reversed(args[1:-len(defaults)]):  # Skip the first arg, which is 'self'.
-        try:
-            arg_values.append(variables[arg])
-        except KeyError:
-            if force:
-                arg_values.append(None)
-            else:
-                raise MeasurementError("A required argument is not present on disk: {}".format(arg))
-    instance = class_(*reversed(arg_values))
-    extras = set(variables.keys()) - set(args)
+    binder = _binder(class_)
+    instance = class_(*binder.bind(variables, force))
+    extras = set(variables.keys()) - binder.names
     if force:
         for key in extras:
             setattr(instance, key, variables[key])  # Monkey-patch.
@@ -929,6 +2588,86 @@ def _instantiate(class_, variables, force):
     return instance
 
 
+class _Binder(object):
+    """
+    This class converts a dict of variables read from disk into the positional arguments of a class's __init__()
+    method. It is created once per class by _binder(), so the signature is inspected only once.
+    """
+
+    # This marks arguments that have no default value.
+    _required = object()
+
+    def __init__(self, class_):
+        # The Measurement framework does not support varargs or keywords, so these are ignored.
+        spec = inspect.getfullargspec(class_.__init__)
+        args = spec.args[1:]  # Skip the first arg, which is 'self'.
+        defaults = spec.defaults or ()
+        num_required = len(args) - len(defaults)
+        self.parameters = tuple(zip(args, [self._required] * num_required + list(defaults)))
+        self.names = frozenset(args)
+
+    def bind(self, variables, force):
+        """
+        Return a list of the positional arguments for __init__(); see _instantiate() for the meaning of `force`.
+        """
+        values = []
+        for arg, default in self.parameters:
+            if default is self._required:
+                try:
+                    values.append(variables[arg])
+                except KeyError:
+                    if force:
+                        values.append(None)
+                    else:
+                        raise MeasurementError("A required argument is not present on disk: {}".format(arg))
+            elif arg == 'validate' and force:
+                values.append(False)  # Skip validation to increase the chances of success.
+            else:
+                values.append(variables.get(arg, default))
+        return values
+
+
+# These dicts cache the results of resolve_class() and _binder().
+_resolved_classes = {}
+_binders = {}
+
+
+def resolve_class(saved_class_name, version, translate):
+    """
+    Return the class that should be used to instantiate a node saved with the given class name and version, using the
+    given translation dict; see IO.read(). The result is cached, so each class module is imported only once.
+
+    Parameters
+    ----------
+    saved_class_name : str
+        The class name saved on disk.
+    version : int (None for unversioned classes)
+        The version number saved on disk.
+    translate : dict
+        A dictionary with entries 'original_class': 'new_class'; class names must be fully-qualified.
+
+    Returns
+    -------
+    type
+        The class.
+    """
+    key = (saved_class_name, version, tuple(sorted(translate.items())))
+    try:
+        return _resolved_classes[key]
+    except KeyError:
+        class_ = get_class(translate.get(saved_class_name, full_name(saved_class_name, version)))
+        _resolved_classes[key] = class_
+        return class_
+
+
+def _binder(class_):
+    try:
+        return _binders[class_]
+    except KeyError:
+        binder = _binders[class_] = _Binder(class_)
+        return binder
+
+
 def full_name(class_name, version):
     """
     Return the fully-qualified name of the given class that corresponds to the given version number.
@@ -996,9 +2735,12 @@ _versioned = {'Measurement': {0: 'measurement.core.Measurement'},
 
 # This dict includes the IO implementations, which have no version numbers, as well as any classes that have no version
 # information. For these, it should map fully-qualified class name to fully-qualified class name.
-_unversioned = {'Dictionary': 'measurement.io.dictionary.Dictionary',
+_unversioned = {'ChunkedIO': 'measurement.io.chunked.ChunkedIO',
+                'Dictionary': 'measurement.io.dictionary.Dictionary',
                 'NetcdfIO': 'measurement.io.netcdf.NetcdfIO',
-                'NpyJsonIO': 'measurement.io.npyjson.NpyJsonIO'
+                'NpyJsonIO': 'measurement.io.npyjson.NpyJsonIO',
+                'PackedIO': 'measurement.io.packed.PackedIO',
+                'SqliteIO': 'measurement.io.sqlite.SqliteIO'
                 }
 
 
@@ -0,0 +1,267 @@
+"""
+This module implements reading and writing of Measurements using a directory hierarchy in which each array is stored as
+a grid of independently compressed chunk files, so that reading part of an array reads only the chunks that it
+overlaps.
+
+Each node is a directory, exactly as in NpyJsonIO, and values that are not arrays are stored the same way.
+Each array is a directory with the extension .chunks that contains:
+  a JSON header named _array.json with the shape, dtype, chunk shape, and codec of the array;
+  one file per chunk, named by the position of the chunk in the grid, such as 3.0 or 3.1 for a 2-D array.
+
+Chunks at the end of each axis are stored with their actual length, not padded. The codec of each chunk is an optional
+byte shuffle, then zlib compression, then an optional CRC-32 checksum, all implemented with numpy and the standard
+library. The chunk shape, compression level, shuffle, and checksum are chosen by a core.StoragePolicy.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from concurrent import futures
+import itertools
+import json
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from measurement import core
+from measurement.io import npyjson
+
+
+class ChunkedIO(npyjson.NpyJsonIO):
+
+    ARRAY_EXTENSION = '.chunks'
+
+    # This is the name of the JSON header in each array directory.
+    HEADER = '_array.json'
+    # This is the version of the array layout written to each header.
+    FORMAT = 1
+
+    # This policy applies to every array, and is updated by the storage argument and by per-array policies.
+    DEFAULT_STORAGE = core.StoragePolicy(chunks='auto', compression=1, shuffle=True, checksum=False)
+
+    def __init__(self, root_path, metadata=None, consolidate=False, storage=None, workers=None):
+        """
+        Return a new ChunkedIO instance.
+
+        :param root_path: the path to the root directory.
+        :param metadata: a dict to write to the root node of a new directory.
+        :param consolidate: if True, write the values of each node that are not arrays as a single JSON document; see
+          NpyJsonIO.
+        :param storage: a core.StoragePolicy that updates DEFAULT_STORAGE for every array written by this instance; a
+          core.Dimensions entry in a Measurement class's dimensions updates it for one array. A policy with
+          chunks='contiguous' stores each array as one chunk.
+        :param workers: if greater than one, chunks are compressed and decompressed by a pool of this many threads;
+          zlib releases the GIL, so this is faster for large arrays.
+        """
+        self.storage = self.DEFAULT_STORAGE.merge(storage)
+        self.workers = workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        super(ChunkedIO, self).__init__(root_path=root_path, metadata=metadata, consolidate=consolidate)
+
+    def close(self):
+        """
+        Disable further reading or writing of files and stop the chunk threads, if any.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        super(ChunkedIO, self).close()
+
+    def write_array(self, node_path, key, value, dimensions):
+        value = np.asarray(value)
+        if value.dtype.hasobject:
+            raise core.MeasurementError("Cannot write an array with dtype object: {}".format(core.join(node_path, key)))
+        directory = os.path.join(self._get_node(node_path), key + self.ARRAY_EXTENSION)
+        if os.path.exists(directory):
+            raise RuntimeError("File already exists: {}".format(directory))
+        with self._direct_write(core._Batch.WRITE_ARRAY, node_path, key, value, dimensions):
+            self._invalidate_scans()
+            policy = self.storage.merge(getattr(dimensions, 'storage', None))
+            chunks = policy.chunk_shape(value.shape, dimensions, value.dtype.itemsize)
+            if chunks is None:
+                chunks = tuple(max(1, length) for length in value.shape)
+            header = {'format': self.FORMAT,
+                      'shape': [int(length) for length in value.shape],
+                      'dtype': np.lib.format.dtype_to_descr(value.dtype),
+                      'chunks': [int(length) for length in chunks],
+                      'compression': int(policy.compression or 0),
+                      'shuffle': bool(policy.shuffle),
+                      'checksum': bool(policy.checksum)}
+            os.mkdir(directory)
+            ChunkedArray(self, node_path, key, directory, header=header).write(value, 0)
+
+    def read_array(self, node_path, name):
+        return np.asarray(self.read_lazy_array(node_path, name))
+
+    def read_array_slice(self, node_path, name, index):
+        return self.read_lazy_array(node_path, name)[index]
+
+    def read_lazy_array(self, node_path, name):
+        return ChunkedArray(self, node_path, name, os.path.join(self._get_node(node_path), name + self.ARRAY_EXTENSION))
+
+    # Private methods.
+
+    def _open_array_writer(self, node_path, key):
+        array = self.read_lazy_array(node_path, key)
+        return ChunkedArrayWriter(self, node_path, key, array)
+
+    def _classify(self, entry):
+        if entry.is_dir() and os.path.splitext(entry.name)[1] == self.ARRAY_EXTENSION:
+            return 'arrays'
+        return super(ChunkedIO, self)._classify(entry)
+
+    def _map(self, function, items):
+        """
+        Return a list of the results of calling the given function on each item, using the chunk threads if there is
+        more than one item and workers is greater than one.
+        """
+        items = list(items)
+        if len(items) < 2 or not self.workers or self.workers < 2:
+            return [function(item) for item in items]
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+        return list(self._executor.map(function, items))
+
+
+class ChunkedArray(core.LazyArray):
+    """
+    This class is a LazyArray for an array stored by ChunkedIO. Indexing with integers, slices, integer arrays, and
+    Ellipsis reads and decompresses only the chunks that overlap the bounding box of the requested region; any other
+    index reads the whole array first.
+    """
+
+    def __init__(self, io, node_path, key, directory, header=None):
+        """
+        If the header is not given, it is read from the array directory.
+        """
+        if header is None:
+            try:
+                with open(os.path.join(directory, io.HEADER), 'r') as f:
+                    header = json.load(f)
+            except (IOError, OSError):
+                raise ValueError("Array not found: {}".format(core.join(node_path, key)))
+            if header.get('format', 0) > io.FORMAT:
+                raise core.MeasurementError("Array {} has format {}, but this version reads format {} or "
+                                            "lower.".format(core.join(node_path, key), header['format'], io.FORMAT))
+        descr = header['dtype']
+        if isinstance(descr, list):  # JSON turns the tuples of a structured dtype into lists.
+            descr = [tuple(field) for field in descr]
+        super(ChunkedArray, self).__init__(io=io, node_path=node_path, key=key, shape=header['shape'],
+                                           dtype=np.lib.format.descr_to_dtype(descr))
+        self.directory = directory
+        self.header = header
+        self.chunks = tuple(header['chunks'])
+
+    def chunk_names(self, box):
+        """
+        Return a list of (name, region) pairs for the chunks that overlap the given box, a tuple of (start, stop) pairs
+        with one per axis, where region is the tuple of (start, stop) pairs covered by the chunk.
+        """
+        if not self.ndim:
+            return [('0', ())]
+        ranges = []
+        for (start, stop), chunk, length in zip(box, self.chunks, self.shape):
+            ranges.append([(n, (n * chunk, min((n + 1) * chunk, length))) for n in range(start // chunk,
+                                                                                         -(-stop // chunk))])
+        return [('.'.join(str(n) for n, region in position), tuple(region for n, region in position))
+                for position in itertools.product(*ranges)]
+
+    def read_box(self, box):
+        """
+        Return a new ndarray that contains the given box of this array, a tuple of (start, stop) pairs, one per axis.
+        """
+        out = np.empty(tuple(stop - start for start, stop in box), dtype=self.dtype)
+        if not out.size:
+            return out
+
+        def read_chunk(item):
+            name, region = item
+            chunk = self._decode(name, region)
+            out[tuple(slice(max(start, chunk_start) - start, min(stop, chunk_stop) - start)
+                      for (start, stop), (chunk_start, chunk_stop) in zip(box, region))] = \
+                chunk[tuple(slice(max(start, chunk_start) - chunk_start, min(stop, chunk_stop) - chunk_start)
+                            for (start, stop), (chunk_start, chunk_stop) in zip(box, region))]
+
+        self.io._map(read_chunk, self.chunk_names(box))
+        return out
+
+    def write(self, value, start):
+        """
+        Write the given array to the rows of this array along the first axis that begin at the given row, rewriting the
+        partial last chunk if it exists, then update the header with the new shape.
+        """
+        if self.ndim:
+            stop = start + value.shape[0]
+            shape = (max(stop, self.shape[0]),) + self.shape[1:]
+            box = ((start, stop),) + tuple((0, length) for length in value.shape[1:])
+        else:
+            shape = ()
+            box = ()
+        self.shape = shape
+        self.header['shape'] = [int(length) for length in shape]
+
+        def write_chunk(item):
+            name, region = item
+            block = value[tuple(slice(max(chunk_start, box_start) - box_start, chunk_stop - box_start)
+                                for (chunk_start, chunk_stop), (box_start, box_stop) in zip(region, box))]
+            if region and region[0][0] < start:  # The existing rows of a partial chunk are kept.
+                existing = self._decode(name, ((region[0][0], start),) + region[1:])
+                block = np.concatenate((existing, block))
+            self._encode(name, block)
+
+        self.io._map(write_chunk, self.chunk_names(box))
+        filename = os.path.join(self.directory, self.io.HEADER)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.header, f)
+        os.replace(filename + '.tmp', filename)
+
+    def _read(self, index):
+        split = core.bounding_box(index, self.shape)
+        if split is None:
+            return np.asarray(self)[index]
+        box, local = split
+        return self.read_box(box)[local]
+
+    def _encode(self, name, block):
+        data = np.ascontiguousarray(block).tobytes()
+        itemsize = self.dtype.itemsize
+        if self.header['shuffle'] and itemsize > 1:
+            data = np.frombuffer(data, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+        if self.header['compression']:
+            data = zlib.compress(data, self.header['compression'])
+        if self.header['checksum']:
+            data += struct.pack('<I', zlib.crc32(data) & 0xffffffff)
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+    def _decode(self, name, region):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if self.header['checksum']:
+            data, checksum = data[:-4], struct.unpack('<I', data[-4:])[0]
+            if zlib.crc32(data) & 0xffffffff != checksum:
+                raise core.MeasurementError("Checksum mismatch in chunk {}".format(filename))
+        if self.header['compression']:
+            data = zlib.decompress(data)
+        itemsize = self.dtype.itemsize
+        if self.header['shuffle'] and itemsize > 1:
+            data = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+        return np.frombuffer(data, dtype=self.dtype).reshape(tuple(stop - start for start, stop in region))
+
+
+class ChunkedArrayWriter(core.ArrayWriter):
+    """
+    This class appends to an array stored by ChunkedIO by writing whole chunks and rewriting the partial last chunk of
+    each column, then the header, so the array stays readable if acquisition stops unexpectedly.
+    """
+
+    def __init__(self, io, node_path, key, array):
+        super(ChunkedArrayWriter, self).__init__(io=io, node_path=node_path, key=key, shape=array.shape,
+                                                 dtype=array.dtype)
+        self.array = array
+
+    def _append(self, chunk):
+        self.array.write(chunk, self.shape[0])
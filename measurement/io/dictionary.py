@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import numpy as np
+
 from measurement import core
 
 
@@ -78,6 +80,13 @@ class Dictionary(core.IO):
         node = self._get_node(node_path)
         return node[self._array][key]
 
+    def read_array_slice(self, node_path, key, index):
+        """
+        Return a view of the selected region where numpy indexing allows one.
+        """
+        node = self._get_node(node_path)
+        return node[self._array][key][index]
+
     def read_other(self, node_path, key):
         """
         Read non-array object with name key from node_path.
@@ -111,6 +120,17 @@ class Dictionary(core.IO):
 
     # Private methods.
 
+    def _open_array_writer(self, node_path, key):
+        array = self.read_array(node_path, key)
+        return DictionaryArrayWriter(self, node_path, key, array.shape, array.dtype)
+
+    def _remove_node(self, node_path):
+        existing, name = core.split(node_path)
+        try:
+            del self._get_node(existing)[self._node][name]
+        except KeyError:
+            pass
+
     def _get_node(self, node_path):
         core.validate_node_path(node_path)
         if node_path.startswith(core.NODE_PATH_SEPARATOR):
@@ -119,3 +139,13 @@ class Dictionary(core.IO):
         for name in core.explode(node_path):
             node = node[self._node][name]
         return node
+
+
+class DictionaryArrayWriter(core.ArrayWriter):
+    """
+    This class appends to an array in a Dictionary by concatenation, which copies the array.
+    """
+
+    def _append(self, chunk):
+        arrays = self.io._get_node(self.node_path)[self.io._array]
+        arrays[self.key] = np.concatenate((arrays[self.key], chunk))
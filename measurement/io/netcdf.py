@@ -6,7 +6,8 @@ numpy arrays that are have entries in the dimensions dictionary are stored as ne
 other sequences like lists and tuples, or arrays that do not have a dimensions entry, are stored as variables with
   special names (for restrictions, see below);
 dicts are stored hierarchically as groups with special names;
-other instance attribute are stored as ncattrs of the group.
+other instance attribute are stored as ncattrs of the group;
+with the dedupe option, arrays are stored once each in a group of the root, and nodes store references to them.
 
 Limitations and issues.
 
@@ -21,7 +22,11 @@ These are stored as special strings that are attributes of the IO class, and con
 This is a little bit gross but probably safe in practice.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict
+import json
 import os
+import threading
+import weakref
 
 import netCDF4
 import numpy as np
@@ -47,14 +52,53 @@ class NetcdfIO(core.IO):
                                              'name': 'complex64'},
                      np.dtype('complex128'): {'datatype': np.dtype([('real', 'f8'), ('imag', 'f8')]),
                                               'name': 'complex128'}}
+    # This dictionary translates the names of the compound types back to numpy complex dtypes.
+    netcdf_to_npy = dict((value['name'], key) for key, value in npy_to_netcdf.items())
 
     # Dictionaries are stored as Groups with names that end with this string.
     is_dict = '.dict'
     # Sequences that are not explicitly declared as arrays with their own dimensions are stored as Variables with names
     # that end with this string, and are returned on read as lists.
     is_list = '.list'
-
-    def __init__(self, root_path, metadata=None, cache_s21_raw=False):
+    # Groups removed by rolling back a failed batch write are renamed to end with this string, since netCDF4 groups
+    # cannot be deleted.
+    is_discarded = '.discarded'
+    # Arrays written with a zero-length first axis use an unlimited dimension so that they can be appended to. Since
+    # every Variable that uses an unlimited dimension reports its current size, each such Variable stores its own
+    # length in a Variable attribute with this name, which does not start with an underscore because the netCDF
+    # conventions reserve such names.
+    appended_length = 'measurement_length'
+    # With the dedupe option, each distinct array is stored once, as a Variable in the root Group with this name, and
+    # each node stores a scalar Variable with an attribute with the reference name, whose value is the name of that
+    # Variable. Like appended_length, these names do not start with an underscore.
+    blobs = 'measurement_blobs'
+    reference = 'measurement_reference'
+    # A Variable in the blobs Group is used by later writes only once its data has been assigned, which is recorded by
+    # an attribute with this name; a blob created by a failed write is filled by the next write of an equal array.
+    complete = 'measurement_complete'
+
+    def __init__(self, root_path, metadata=None, cache_s21_raw=False, storage=None, dedupe=False):
+        """
+        Return a new NetcdfIO instance.
+
+        :param root_path: the path to the netCDF4 file.
+        :param metadata: a dict to write to the root node of a new file.
+        :param cache_s21_raw: if True, arrays named s21_raw are always read as NetcdfArray instances, as if read with
+          lazy=True; use IO.read(..., lazy=True) to read all arrays this way.
+        :param storage: a core.StoragePolicy that sets the chunking, compression, shuffle, and checksum options of every
+          array written by this instance; options set by the dimensions entry of a Measurement class take precedence.
+        :param dedupe: if True, write each distinct array once and write references for arrays that are equal to one
+          already in the file; see write_array(). Arrays written either way can be read regardless of this option.
+        """
+        self._compound_types = {}
+        self._groups = {}
+        if storage is None:
+            storage = core.StoragePolicy()
+        self.storage = storage
+        self.dedupe = dedupe
+        # This maps the name of each deduplicated array that is in use to its read-only array; see _read_blob().
+        self._shared = weakref.WeakValueDictionary()
+        self._shared_lock = threading.Lock()
         super(NetcdfIO, self).__init__(root_path=os.path.expanduser(root_path), metadata=metadata)
         self.cache_s21_raw = cache_s21_raw
 
@@ -62,12 +106,16 @@ class NetcdfIO(core.IO):
         return os.path.isfile(root_path)
 
     def _open_existing(self, root_path):
+        self._writable = False
         return netCDF4.Dataset(self.root_path, mode='r', keepweakref=True)
 
     def _create_new(self, root_path):
+        self._writable = True
         return netCDF4.Dataset(root_path, mode='w', clobber=False)
 
     def close(self):
+        self._compound_types = {}
+        self._groups = {}
         if not self.closed:
             try:
                 self._root.close()
@@ -79,61 +127,104 @@ class NetcdfIO(core.IO):
     def closed(self):
         return self._root is None
 
-    def read(self, node_path, translate=None, force=False):
-        if translate is None:
-            translate = {}
-        if self.cache_s21_raw:
-            translate.update({'StreamArray': '{}.NCStreamArray'.format(__name__),
-                              'SingleStream': '{}.NCSingleStream'.format(__name__)})
-        return self._read_node(node_path=node_path, translate=translate, force=force)
-
     def create_node(self, node_path):
         existing, new = core.split(node_path)
         if not new:
             raise core.MeasurementError("Cannot create root node.")
-        self._get_node(existing).createGroup(new)
+        with self._direct_write(core._Batch.CREATE_NODE, node_path):
+            self._groups[self._absolute(node_path)] = self._get_node(existing).createGroup(new)
 
     def write_array(self, node_path, name, array, dimensions):
         """
         Write the given array to the node at node_path with the given name and dimensions.
 
         When writing arrays to a node, each dimension is created the first time it appears in the dimensions tuple.
-        The dimension is created with size equal to the corresponding dimension of the given array. Thus, there is no
-        restriction on the order in which arrays are written. Writing will still fail if two arrays share a dimension
-        name and have different shape along the corresponding axes. Since this would have caused
-        Measurement._validate_dimensions() to fail, this should not happen unless array sizes are modified after
-        instantiation somehow.
+        The dimension is created with size equal to the corresponding dimension of the given array, except that a
+        zero-length first dimension is created unlimited so that the array can be appended to; see
+        IO.open_array_writer(). Thus, there is no restriction on the order in which arrays are written. Writing will
+        still fail if two arrays share a dimension name and have different shape along the corresponding axes. Since
+        this would have caused Measurement._validate_dimensions() to fail, this should not happen unless array sizes
+        are modified after instantiation somehow.
+
+        With the dedupe option, an array that can grow, is empty, or contains Python objects is written as above. Any
+        other array is stored in the blobs Group under a name derived from its core.array_digest(), unless an equal
+        array is already there, and the node stores a reference to it. On read, every reference to the same array
+        returns the same read-only array.
 
         :param node_path: the node path as a string.
         :param name: the name of the variable.
         :param array: the array containing the data.
-        :param dimensions: a tuple of strings with the dimensions that correspond to the dimensions of the array.
+        :param dimensions: a tuple of strings with the dimensions that correspond to the dimensions of the array; if it
+          is a core.Dimensions instance, its storage policy is merged with that of this instance.
         :return: None.
         """
-        node = self._get_node(node_path)
+        with self._direct_write(core._Batch.WRITE_ARRAY, node_path, name, array, dimensions):
+            self._assign(*self._create_variable(self._get_node(node_path), name, array, dimensions))
+
+    def _create_variable(self, node, name, array, dimensions):
+        """
+        Create the dimensions and Variable for the given array in the given Group, as described in write_array(), and
+        return the Variable and the data to assign to it, which is None if the array is a duplicate.
+        """
         for n, dimension in enumerate(dimensions):
             if dimension not in node.dimensions:
-                node.createDimension(dimension, array.shape[n])
+                if n == 0 and array.shape[0] == 0:
+                    node.createDimension(dimension, None)
+                else:
+                    node.createDimension(dimension, array.shape[n])
+        if self.dedupe and array.size and not array.dtype.hasobject:
+            return self._create_reference(node, name, array, dimensions)
         try:
             npy_datatype = self.npy_to_netcdf[array.dtype]['datatype']
-            netcdf_datatype = node.createCompoundType(self.npy_to_netcdf[array.dtype]['datatype'],
-                                                      self.npy_to_netcdf[array.dtype]['name'])
+            netcdf_datatype = self._compound_type(array.dtype)
         except KeyError:
             npy_datatype = netcdf_datatype = array.dtype
-        variable = node.createVariable(name, netcdf_datatype, dimensions)
-        variable[:] = array.view(npy_datatype)
+        variable = node.createVariable(name, netcdf_datatype, dimensions,
+                                       **self._variable_options(node, array, dimensions))
+        if dimensions and node.dimensions[dimensions[0]].isunlimited():
+            variable.setncattr(self.appended_length, array.shape[0])
+        return variable, array.view(npy_datatype)
 
     def write_other(self, node_path, key, value):
-        node = self._get_node(node_path)
-        self._write_to_group(node, key, value)
+        with self._direct_write(core._Batch.WRITE_OTHER, node_path, key, value):
+            self._write_to_group(self._get_node(node_path), key, value)
 
     def read_array(self, node_path, name):
-        node = self._get_node(node_path)
-        nc_variable = node.variables[name]
-        if name == 's21_raw' and self.cache_s21_raw:  # hacktastic
-            return nc_variable
-        else:
-            return nc_variable[:].view(nc_variable.datatype.name)
+        if name == 's21_raw' and self.cache_s21_raw:
+            return self.read_lazy_array(node_path, name)
+        nc_variable = self._get_node(node_path).variables[name]
+        blob_name = self._blob_name(nc_variable)
+        if blob_name is not None:
+            return self._read_blob(blob_name)
+        if self.appended_length in nc_variable.ncattrs():
+            return self._read_variable(nc_variable, slice(nc_variable.getncattr(self.appended_length)))
+        return self._read_variable(nc_variable, slice(None))
+
+    def read_array_slice(self, node_path, name, index):
+        """
+        Read the hyperslab that contains the selected region, using core.bounding_box(), then index it, so that netCDF4
+        reads only the HDF5 chunks that overlap the region and integer arrays follow numpy semantics.
+        """
+        nc_variable = self._get_node(node_path).variables[name]
+        blob_name = self._blob_name(nc_variable)
+        if blob_name is not None:
+            with self._shared_lock:
+                array = self._shared.get(blob_name)
+            if array is not None:
+                return array[index]
+            nc_variable = self._root.groups[self.blobs].variables[blob_name]
+        shape = nc_variable.shape
+        if self.appended_length in nc_variable.ncattrs():
+            shape = (int(nc_variable.getncattr(self.appended_length)),) + shape[1:]
+        split = core.bounding_box(index, shape)
+        if split is None:
+            return self.read_array(node_path, name)[index]
+        box, local = split
+        hyperslab = tuple(slice(start, stop) for start, stop in box) if box else Ellipsis
+        return self._read_variable(nc_variable, hyperslab)[local]
+
+    def read_lazy_array(self, node_path, name):
+        return NetcdfArray(self, node_path, name, self._array_variable(node_path, name))
 
     def read_other(self, node_path, name):
         node = self._get_node(node_path)
@@ -148,14 +239,25 @@ class NetcdfIO(core.IO):
             raise ValueError("Name not found: {}".format(name))
 
     def node_names(self, node_path='/'):
+        names = self._indexed_names(node_path, 'nodes')
+        if names is not None:
+            return names
         node = self._get_node(node_path)
-        return [name for name in node.groups if not name.endswith(self.is_dict)]
+        return [name for name in node.groups
+                if not name.endswith((self.is_dict, self.is_discarded)) and name != self.blobs]
 
     def array_names(self, node_path):
+        names = self._indexed_names(node_path, 'arrays')
+        if names is not None:
+            return names
         node = self._get_node(node_path)
-        return [key for key in node.variables if not key.endswith(self.is_list)]
+        # The root node contains the structural index variable.
+        return [key for key in node.variables if not key.endswith(self.is_list) and not key.startswith('_')]
 
     def other_names(self, node_path):
+        names = self._indexed_names(node_path, 'others')
+        if names is not None:
+            return names
         node = self._get_node(node_path)
         ncattrs = [ncattr for ncattr in node.ncattrs() if not ncattr.startswith('_')]
         dicts = [name.replace(self.is_dict, '') for name in node.groups if name.endswith(self.is_dict)]
@@ -164,16 +266,258 @@ class NetcdfIO(core.IO):
 
     # Private methods.
 
+    def _read_index_log(self):
+        """
+        The structural index is stored in the root group as a variable-length string Variable with an unlimited
+        dimension, each element of which is a JSON record.
+        """
+        if core.INDEX not in self._root.variables:
+            return None
+        records = []
+        for text in self._root.variables[core.INDEX][:]:
+            try:
+                records.append(json.loads(text))
+            except ValueError:
+                records.append(None)
+                break
+        return records
+
+    def _append_index_log(self, records):
+        if not self._writable:
+            return False
+        if core.INDEX not in self._root.variables:
+            self._root.createDimension(core.INDEX, None)
+            self._root.createVariable(core.INDEX, str, (core.INDEX,))
+        variable = self._root.variables[core.INDEX]
+        start = len(variable)
+        variable[start:start + len(records)] = np.array([json.dumps(record) for record in records], dtype=object)
+        return True
+
+    def _index_log_length(self):
+        if core.INDEX not in self._root.variables:
+            return None
+        return len(self._root.variables[core.INDEX])
+
+    def _commit(self, operations):
+        """
+        Create all the groups, then set the scalar attributes of each group with a single call to setncatts() and write
+        the containers, then create the Variables for all the arrays, then write the array data. The first write to a
+        new Variable makes the netCDF library write the metadata of the file, so defining every Variable before writing
+        any data avoids a cost that grows with the number of groups for each array.
+        """
+        attributes = OrderedDict()
+        for operation in operations:
+            if operation[0] == 'create_node':
+                self.create_node(operation[1])
+                attributes[operation[1]] = OrderedDict()
+        for operation in operations:
+            if operation[0] == 'write_other':
+                node_path, key, value = operation[1:]
+                if isinstance(value, (dict, list, tuple, np.ndarray)):
+                    self.write_other(node_path, key, value)
+                else:
+                    attributes.setdefault(node_path, OrderedDict())[key] = self._to_ncattr(value)
+        for node_path, node_attributes in attributes.items():
+            self._get_node(node_path).setncatts(node_attributes)
+        assignments = []
+        for operation in operations:
+            if operation[0] == 'write_array':
+                node_path, name, array, dimensions = operation[1:]
+                assignments.append(self._create_variable(self._get_node(node_path), name, array, dimensions))
+        assigned = set()
+        for variable, data in assignments:
+            # Equal arrays in one batch share a blob, which is assigned once.
+            if variable not in assigned:
+                self._assign(variable, data)
+                assigned.add(variable)
+
+    def _create_reference(self, node, name, array, dimensions):
+        """
+        Create a reference to the given array in the given Group, and create a Variable for the array in the blobs Group
+        if it is not already there. Return the Variable and data to assign, as _create_variable() does; the data is None
+        only if the blob is complete. The Variable has its own dimensions, and its storage options are those that the
+        array would have had in the node.
+        """
+        blob_name = 'b' + core.array_digest(array)
+        reference = node.createVariable(name, 'u1', ())
+        reference.setncattr(self.reference, blob_name)
+        root = self._root
+        if self.blobs in root.groups:
+            blobs = root.groups[self.blobs]
+        else:
+            blobs = root.createGroup(self.blobs)
+        try:
+            npy_datatype = self.npy_to_netcdf[array.dtype]['datatype']
+            netcdf_datatype = self._compound_type(array.dtype)
+        except KeyError:
+            npy_datatype = netcdf_datatype = array.dtype
+        if blob_name in blobs.variables:
+            variable = blobs.variables[blob_name]
+            if self.complete in variable.ncattrs():
+                return reference, None
+        else:
+            blob_dimensions = tuple('{}_{}'.format(blob_name, n) for n in range(array.ndim))
+            for blob_dimension, length in zip(blob_dimensions, array.shape):
+                if blob_dimension not in blobs.dimensions:
+                    blobs.createDimension(blob_dimension, length)
+            variable = blobs.createVariable(blob_name, netcdf_datatype, blob_dimensions,
+                                            **self._variable_options(node, array, dimensions))
+        return variable, array.view(npy_datatype)
+
+    def _assign(self, variable, data):
+        """
+        Assign the data returned by _create_variable() to the given Variable, if there is any, and mark a Variable in
+        the blobs Group complete once it contains its data.
+        """
+        if data is None:
+            return
+        variable[:] = data
+        if variable.group().name == self.blobs:
+            variable.setncattr(self.complete, 1)
+
+    def _blob_name(self, variable):
+        """
+        Return the name of the Variable in the blobs Group that the given Variable refers to, or None if it is not a
+        reference.
+        """
+        if variable.ndim == 0 and self.reference in variable.ncattrs():
+            return variable.getncattr(self.reference)
+        return None
+
+    def _array_variable(self, node_path, name):
+        """
+        Return the Variable that contains the data of the given array, which is in the blobs Group if the array is a
+        reference.
+        """
+        variable = self._get_node(node_path).variables[name]
+        blob_name = self._blob_name(variable)
+        if blob_name is None:
+            return variable
+        return self._root.groups[self.blobs].variables[blob_name]
+
+    def _read_blob(self, blob_name):
+        """
+        Return the read-only array stored in the blobs Group with the given name. While any array returned by this
+        method is in use, every read of the same name returns that array, so duplicates share one buffer and are read
+        from disk once.
+        """
+        with self._shared_lock:
+            array = self._shared.get(blob_name)
+        if array is not None:
+            return array
+        array = self._read_variable(self._root.groups[self.blobs].variables[blob_name], slice(None))
+        array.flags.writeable = False
+        with self._shared_lock:
+            return self._shared.setdefault(blob_name, array)
+
+    def _compound_type(self, dtype):
+        """
+        Return the netCDF4 CompoundType for the given numpy complex dtype. Each type is created once, in the root group,
+        where it is visible to every group in the file.
+        """
+        try:
+            return self._compound_types[dtype]
+        except KeyError:
+            name = self.npy_to_netcdf[dtype]['name']
+            if name in self._root.cmptypes:
+                compound_type = self._root.cmptypes[name]
+            else:
+                compound_type = self._root.createCompoundType(self.npy_to_netcdf[dtype]['datatype'], name)
+            self._compound_types[dtype] = compound_type
+            return compound_type
+
+    def _read_variable(self, variable, index):
+        """
+        Return the data in the given Variable at the given index as a numpy ndarray. Automatic masking is disabled, so
+        netCDF4 reads directly into a new array without creating a masked array, and complex data stored as a compound
+        type are returned as a view of that array with the equivalent complex dtype, without a copy.
+        """
+        variable.set_auto_mask(False)
+        data = variable[index]
+        if isinstance(variable.datatype, netCDF4.CompoundType):
+            return data.view(self.netcdf_to_npy.get(variable.datatype.name, variable.datatype.name))
+        return data
+
+    def _variable_options(self, group, array, dimensions):
+        """
+        Return a dict of the keyword arguments to Group.createVariable() that implement the storage policy for the
+        given array. HDF5 filters and unlimited dimensions require a chunked layout, so a request for a contiguous
+        layout is ignored in those cases.
+        """
+        policy = self.storage.merge(getattr(dimensions, 'storage', None))
+        options = {}
+        if policy.compression:
+            options['zlib'] = True
+            options['complevel'] = policy.compression
+            options['shuffle'] = True if policy.shuffle is None else policy.shuffle
+        else:
+            options['shuffle'] = False
+        if policy.checksum:
+            options['fletcher32'] = True
+        chunks = policy.chunk_shape(array.shape, dimensions, array.dtype.itemsize)
+        if chunks is not None:
+            options['chunksizes'] = chunks
+        elif (policy.chunks == 'contiguous' and not policy.compression and not policy.checksum and
+              not any(group.dimensions[dimension].isunlimited() for dimension in dimensions)):
+            options['contiguous'] = True
+        return options
+
+    def _open_array_writer(self, node_path, key):
+        if not self._writable:
+            raise core.MeasurementError("Cannot append to an array in a file opened read-only: {}".format(
+                self.root_path))
+        variable = self._get_node(node_path).variables[key]
+        if self.appended_length not in variable.ncattrs():
+            raise core.MeasurementError("Array {} was not written with a zero-length first dimension, so it cannot be"
+                                        " appended to.".format(core.join(node_path, key)))
+        return NetcdfArrayWriter(self, node_path, key, variable)
+
+    def _remove_node(self, node_path):
+        existing, name = core.split(node_path)
+        parent = self._get_node(existing)
+        if name in parent.groups:
+            number = 0
+            while '{}.{}{}'.format(name, number, self.is_discarded) in parent.groups:
+                number += 1
+            parent.renameGroup(name, '{}.{}{}'.format(name, number, self.is_discarded))
+            self._groups = {}
+
+    def _begin_parallel(self):
+        """
+        The netCDF-C and HDF5 libraries are not thread-safe, even with a separate Dataset per thread, and netCDF4
+        releases the GIL during its calls, so concurrent reads can corrupt memory. NetcdfIO therefore always reads
+        serially.
+        """
+        return False
+
     def _get_node(self, node_path):
+        """
+        Return the Group at the given node path. Groups are cached by absolute node path, so each path is validated and
+        walked from the root only once per Dataset whether or not it begins with a slash; the cache is cleared when the
+        file is closed and when a group is renamed. Paths that are not valid, such as those with a trailing slash, are
+        never cached, so they always fail validation.
+        """
         if self.closed:
             raise OSError("I/O operation on closed file")
+        key = self._absolute(node_path)
+        try:
+            return self._groups[key]
+        except KeyError:
+            pass
         node = self._root
         if node_path != '':
             core.validate_node_path(node_path)
             for name in core.explode(node_path):
                 node = node.groups[name]
+        self._groups[key] = node
         return node
 
+    @staticmethod
+    def _absolute(node_path):
+        if node_path.startswith(core.NODE_PATH_SEPARATOR):
+            return node_path
+        return core.NODE_PATH_SEPARATOR + node_path
+
     def _write_to_group(self, group, key, value):
         """
         This method directly writes non-container values to the given Group or calls the appropriate function to
@@ -189,11 +533,16 @@ class NetcdfIO(core.IO):
         elif isinstance(value, (list, tuple, np.ndarray)):
             self._write_sequence(group, key + self.is_list, value)
         else:
-            for k, v in self.on_write.items():
-                if value is k:  # we need to use identity because, e.g., 0 == False evaluates to True.
-                    setattr(group, key, v)
-                    return
-            setattr(group, key, value)
+            setattr(group, key, self._to_ncattr(value))
+
+    def _to_ncattr(self, value):
+        """
+        Return the value to store as an ncattr for the given non-container value.
+        """
+        for k, v in self.on_write.items():
+            if value is k:  # we need to use identity because, e.g., 0 == False evaluates to True.
+                return v
+        return value
 
     def _write_sequence(self, group, key, value):
         """
@@ -264,115 +613,48 @@ class NetcdfIO(core.IO):
         return dict(ncattrs + lists + dicts)
 
 
-# Classes that implement caching of s21_raw
-'''
-
-class NCVariable(object):
-
-    def __init__(self, variable):
-        self.variable = variable
-
-    def __getitem__(self, item):
-        return self.variable[item].view(self.dtype)
-
-    @property
-    def shape(self):
-        return self.variable.shape
+class NetcdfArray(core.LazyArray):
+    """
+    This class is a LazyArray for a netCDF4 Variable: indexing reads only the requested hyperslab, and complex data
+    stored as compound types are returned with the proper view; see NetcdfIO.read_array_slice(). The Variable is looked
+    up on each read, so instances remain valid after the Group cache is cleared.
+    """
 
-    @property
-    def size(self):
-        return self.variable.size
+    def __init__(self, io, node_path, key, variable):
+        if isinstance(variable.datatype, netCDF4.CompoundType):
+            dtype = np.dtype(variable.datatype.name)
+        else:
+            dtype = variable.datatype
+        shape = variable.shape
+        if io.appended_length in variable.ncattrs():
+            shape = (int(variable.getncattr(io.appended_length)),) + shape[1:]
+        super(NetcdfArray, self).__init__(io=io, node_path=node_path, key=key, shape=shape, dtype=dtype)
 
     @property
-    def dtype(self):
-        return self.variable.datatype.name
+    def variable(self):
+        return self.io._array_variable(self.node_path, self.key)
 
 
-class NCStreamArray(basic.StreamArray):
+class NetcdfArrayWriter(core.ArrayWriter):
     """
-    This class represents simultaneously-sampled data from multiple channels.
+    This class appends to a Variable with an unlimited first dimension, updating its stored length after each chunk so
+    that the file is consistent if acquisition stops unexpectedly.
     """
 
-    def __init__(self, tone_bin, tone_amplitude, tone_phase, tone_index, filterbank_bin, epoch, s21_raw,
-                 data_demodulated, roach_state, sequence_start_number=np.nan, state=None, description=''):
-        """
-        Return a new NCStreamArray instance. This class stores the netCDF4 Variable containing the s21_raw data
-        instead of a numpy array so that the data is not read from disk unless requested. The Variable is stored using
-        a thin wrapper that takes the proper view of the complex data. Note that because it contains an attribute,
-        s21_raw_variable, that is not writeable, instances currently cannot be written back to disk.
-
-        :param tone_bin: an array of integers representing the frequencies of the tones played during the measurement.
-        :param tone_amplitude: an array of floats representing the amplitudes of the tones played during the
-          measurement.
-        :param tone_phase: an array of floats representing the radian phases of the tones played during the measurement.
-        :param tone_index: an int array for which tone_bin[tone_index] gives the integer frequencies of the tones read
-          out in this measurement.
-        :param filterbank_bin: an int array of filter bank bins in which the read out tones lie.
-        :param epoch: a float that is the unix timestamp of first sample of the time stream.
-        :param s21_raw: a netCDF4 Variable containing a 2-D array of complex float s21 data, demodulated or not.
-        :param data_demodulated: True if the s21_raw data are demodulated.
-        :param roach_state: a dict containing state information for the roach.
-        :param state: a dict containing all non-roach state information.
-        :param description: a string describing this measurement.
-        :return: a new NCStreamArray instance.
-        """
-        self.s21_raw_variable = NCVariable(s21_raw)
-        super(NCStreamArray, self).__init__(tone_bin=tone_bin, tone_amplitude=tone_amplitude, tone_phase=tone_phase,
-                                            tone_index=tone_index, filterbank_bin=filterbank_bin, epoch=epoch,
-                                            sequence_start_number=sequence_start_number, s21_raw=None,
-                                            data_demodulated=data_demodulated, roach_state=roach_state, state=state,
-                                            description=description, validate=False)
-
-    @memoized_property
-    def s21_raw(self):
-        return self.s21_raw_variable[:]
-
-    # This exists so that the superclass __init__() can set it.
-    @s21_raw.setter
-    def s21_raw(self, s21):
-        pass
-
-
-class NCSingleStream(basic.SingleStream):
-    """
-    This class contains time-ordered data from a single channel.
-    """
+    def __init__(self, io, node_path, key, variable):
+        if isinstance(variable.datatype, netCDF4.CompoundType):
+            dtype = np.dtype(variable.datatype.name)
+        else:
+            dtype = variable.datatype
+        shape = (variable.getncattr(io.appended_length),) + variable.shape[1:]
+        super(NetcdfArrayWriter, self).__init__(io=io, node_path=node_path, key=key, shape=shape, dtype=dtype)
+        try:
+            self._view = io.npy_to_netcdf[self.dtype]['datatype']
+        except KeyError:
+            self._view = self.dtype
 
-    def __init__(self, tone_bin, tone_amplitude, tone_phase, tone_index, filterbank_bin, epoch, s21_raw,
-                 data_demodulated, roach_state, sequence_start_number=np.nan, number=0, state=None, description=''):
-        """
-        Return a new NCSingleStream instance. This class stores the netCDF4 Variable containing the s21_raw data
-        instead of a numpy array so that the data is not read from disk unless requested. The Variable is stored using
-        a thin wrapper that takes the proper view of the complex data. Note that because it contains an attribute,
-        s21_raw_variable, that is not writeable, instances currently cannot be written back to disk.
-
-        :param tone_bin: an array of integers representing the frequencies of the tones played during the measurement.
-        :param tone_amplitude: an array of floats representing the amplitudes of the tones played during the
-          measurement.
-        :param tone_phase: an array of floats representing the radian phases of the tones played during the measurement.
-        :param tone_index: an int for which tone_bin[tone_index] corresponds to the frequency used to produce s21_raw.
-        :param filterbank_bin: an int that is the filter bank bin in which the tone lies.
-        :param epoch: a float that is the unix timestamp of first sample of the time stream.
-        :param s21_raw: a netCDF4 Variable containing a 1-D array of complex float s21 data, demodulated or not.
-        :param data_demodulated: True if the s21_raw data are demodulated.
-        :param roach_state: a dict containing state information for the roach.
-        :param state: a dict containing all non-roach state information.
-        :param description: a string describing this measurement.
-        :return: a new NCSingleStream instance.
-        """
-        self.s21_raw_variable = NCVariable(s21_raw)
-        super(NCSingleStream, self).__init__(tone_bin=tone_bin, tone_amplitude=tone_amplitude, tone_phase=tone_phase,
-                                             tone_index=tone_index, filterbank_bin=filterbank_bin, epoch=epoch,
-                                             sequence_start_number=sequence_start_number, s21_raw=None,
-                                             data_demodulated=data_demodulated, roach_state=roach_state, number=number,
-                                             state=state, description=description, validate=False)
-
-    @memoized_property
-    def s21_raw(self):
-        return self.s21_raw_variable[:]
-
-    # This exists so that the superclass __init__() can set it.
-    @s21_raw.setter
-    def s21_raw(self, s21):
-        pass
-'''
+    def _append(self, chunk):
+        variable = self.io._get_node(self.node_path).variables[self.key]
+        start = self.shape[0]
+        variable[start:start + chunk.shape[0]] = chunk.view(self._view)
+        variable.setncattr(self.io.appended_length, start + chunk.shape[0])
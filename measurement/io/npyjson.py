@@ -3,7 +3,9 @@ This module implements reading and writing of Measurements using a directory hie
 
 Each node is a directory:
 Numpy arrays are stored as .npy files;
-Other values are stored using json.
+Other values are stored using json, either one file per value or, with the consolidate option, in a single JSON
+  object per node; both layouts can be read by any instance.
+With the dedupe option, arrays are stored once each in a directory of the root, and nodes store references to them.
 
 Limitations and issues:
 -Because json has only a single sequence type, all sequences that are not declared to be numpy arrays (i.e. passed to
@@ -11,15 +13,22 @@ Limitations and issues:
 -
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict
+import contextlib
+import copy
 import json
+import mmap
 import os
+import shutil
+import struct
+import threading
+import weakref
 
 import numpy as np
 
 from measurement import core
 
 
-# ToDo: implement tagging and closing of memmapped files
 # ToDo: check node path validation -- how were tests passing?
 # ToDo: rewrite error messages as variables
 class NpyJsonIO(core.IO):
@@ -30,7 +39,60 @@ class NpyJsonIO(core.IO):
 
     ARRAY_EXTENSION = '.npy'
 
-    def __init__(self, root_path, metadata=None, memmap=False):
+    # Arrays with a zero-length first axis are written with a header of this many bytes, padded with spaces, so that the
+    # header can be rewritten in place as the array grows; see IO.open_array_writer().
+    GROWABLE_HEADER_LENGTH = 256
+
+    # With the consolidate option, all the values of a node that are not arrays are stored as one JSON object in a file
+    # with this name.
+    DOCUMENT = '_node.json'
+    # This is the number of parsed documents kept in memory, which must exceed the depth of the trees being read.
+    DOCUMENT_CACHE_SIZE = 256
+
+    # With the dedupe option, each distinct array is stored once, in this directory of the root, as a .npy file named
+    # by its digest, and each node stores a file with the reference extension that contains the digest; see
+    # write_array().
+    BLOBS = '_blobs'
+    REFERENCE_EXTENSION = '.ref'
+
+    # These are the values of the advice argument of advise(), mapped to the names of the mmap module constants that
+    # are passed to madvise() for each array mapped during a read; advice that the platform lacks is ignored.
+    ADVICE = {'normal': 'MADV_NORMAL',
+              'sequential': 'MADV_SEQUENTIAL',
+              'random': 'MADV_RANDOM',
+              'willneed': 'MADV_WILLNEED'}
+
+    def __init__(self, root_path, metadata=None, memmap=False, consolidate=False, advice=None, dedupe=False):
+        """
+        Return a new NpyJsonIO instance.
+
+        :param root_path: the path to the root directory.
+        :param metadata: a dict to write to the root node of a new directory.
+        :param memmap: if True, arrays are read as read-only memory-mapped arrays; the mappings are released by close()
+          once no array uses them.
+        :param consolidate: if True, write the class name, version, and other values of each node as a single JSON
+          document, which is written once per node and read with one open; every write is then buffered, as if
+          write(..., buffered=True) were used. Nodes written either way can be read regardless of this option.
+        :param advice: the default access pattern hint for memory-mapped arrays, one of the keys of ADVICE; see
+          advise().
+        :param dedupe: if True, write each distinct array once and write references for arrays that are equal to one
+          already in the directory; see write_array(). Arrays written either way can be read regardless of this option.
+        """
+        self._check_advice(advice)
+        self.advice = advice
+        self._mappings = weakref.WeakSet()
+        self._mappings_lock = threading.Lock()
+        self.consolidate = consolidate
+        self.dedupe = dedupe
+        # This maps the digest of each deduplicated array that is in use to its read-only array; see _read_blob().
+        self._shared = weakref.WeakValueDictionary()
+        self._shared_lock = threading.Lock()
+        self._documents = OrderedDict()
+        self._documents_lock = threading.Lock()
+        # During a read, this dict caches node directories and their listings; see _begin_read().
+        self._scans = None
+        self._read_depth = 0
+        self._read_lock = threading.Lock()
         super(NpyJsonIO, self).__init__(root_path=os.path.abspath(os.path.expanduser(root_path)), metadata=metadata)
         if memmap:
             self._mmap_mode = 'r'
@@ -49,12 +111,54 @@ class NpyJsonIO(core.IO):
 
     def close(self):
         """
-        Disable further reading or writing of files. Note that this doesn't actually close any memmapped files. The
-        numpy.memmap documentation says that to close them you have to delete the memmap object, and it's not clear
-        to me how to do that here.
+        Disable further reading or writing of files and release the memory maps of arrays read with the memmap option.
+        A mapping that is still used by an array, or by a view of one, cannot be released safely, so it stays open until
+        the last such array is deleted; call release_mappings() to find out how many remain.
         """
+        self.release_mappings()
         self._root = None
 
+    def release_mappings(self):
+        """
+        Close every memory map created by this instance that is no longer used by an array, which frees its address
+        space and file descriptor without waiting for garbage collection.
+
+        :return: the number of mappings that are still in use.
+        """
+        with self._mappings_lock:
+            mappings = list(self._mappings)
+        in_use = 0
+        for mapping in mappings:
+            try:
+                mapping.close()
+            except BufferError:  # An array still exports the buffer.
+                in_use += 1
+            else:
+                self._mappings.discard(mapping)
+        return in_use
+
+    @contextlib.contextmanager
+    def advise(self, advice):
+        """
+        Return a context manager in which arrays read with the memmap option are mapped with the given access pattern
+        hint, which the operating system uses to choose readahead: 'sequential' for arrays that will be read from start
+        to finish, 'random' for sparse indexing, 'willneed' to start reading the whole array in the background, or
+        'normal'. For example:
+
+            with io.advise('sequential'):
+                stream = io.read('stream')
+
+        The hint applies to reads by this instance from any thread until the block exits.
+
+        :param advice: one of the keys of ADVICE, or None for no hint.
+        """
+        self._check_advice(advice)
+        previous, self.advice = self.advice, advice
+        try:
+            yield self
+        finally:
+            self.advice = previous
+
     @property
     def closed(self):
         return self._root is None
@@ -63,58 +167,415 @@ class NpyJsonIO(core.IO):
         existing, new = core.split(node_path)
         if not new:
             raise core.MeasurementError("Cannot create root node.")
-        os.mkdir(os.path.join(self._get_node(existing), new))
+        with self._direct_write(core._Batch.CREATE_NODE, node_path):
+            os.mkdir(os.path.join(self._get_node(existing), new))
+            self._invalidate_scans()
 
     def write_array(self, node_path, key, value, dimensions):
-        node = self._get_node(node_path)
-        filename = os.path.join(node, key + self.ARRAY_EXTENSION)
-        with self._safe_open(filename, 'wb') as f:
-            np.save(f, value)
+        """
+        Write the given array as a .npy file. With the dedupe option, an array that is not empty is instead stored in
+        the BLOBS directory under its core.array_digest(), unless an equal array is already there, and the node stores a
+        reference to it. On read, every reference to the same array returns the same read-only array.
+        """
+        with self._direct_write(core._Batch.WRITE_ARRAY, node_path, key, value, dimensions):
+            self._invalidate_scans()
+            node = self._get_node(node_path)
+            if self.dedupe and value.size and not value.dtype.hasobject:
+                digest = core.array_digest(value)
+                self._write_blob(digest, value)
+                with self._safe_open(os.path.join(node, key + self.REFERENCE_EXTENSION), 'w') as f:
+                    f.write(digest)
+                return
+            filename = os.path.join(node, key + self.ARRAY_EXTENSION)
+            with self._safe_open(filename, 'wb') as f:
+                header = None
+                if value.ndim and value.shape[0] == 0 and not value.dtype.hasobject:
+                    header = npy_header(value.shape, value.dtype, (1, 0), self.GROWABLE_HEADER_LENGTH)
+                if header is None:
+                    np.save(f, value)
+                else:
+                    f.write(header)
+
+    def write(self, node, node_path=None, buffered=False):
+        super(NpyJsonIO, self).write(node, node_path=node_path, buffered=buffered or self.consolidate)
 
     def write_other(self, node_path, key, value):
-        node = self._get_node(node_path)
-        filename = os.path.join(node, key)
-        with self._safe_open(filename, 'w') as f:
-            try:
-                json.dump(value, f)
-            except TypeError as e:
-                raise ValueError("json.dump({}) of {} ({}) failed: {}".format(key, value, repr(value), e))
+        with self._direct_write(core._Batch.WRITE_OTHER, node_path, key, value):
+            self._invalidate_scans()
+            if self.consolidate:
+                self._update_document(node_path, key, value)
+            else:
+                self._write_json(node_path, key, self._dumps(key, value))
 
     def read_array(self, node_path, name):
         full = os.path.join(self._get_node(node_path), name + self.ARRAY_EXTENSION)
-        return np.load(full, mmap_mode=self._mmap_mode)
+        try:
+            if self._mmap_mode is None:
+                return np.load(full)
+            return self._map_array(full)
+        except (IOError, OSError):
+            digest = self._read_reference(node_path, name)
+            if digest is None:
+                raise
+        return self._read_blob(digest)
+
+    def read_array_slice(self, node_path, name, index):
+        """
+        Read only the selected region by indexing a memory map of the file, so that only the pages that contain it are
+        read from disk. Arrays that cannot be memory-mapped are read whole.
+        """
+        full = os.path.join(self._get_node(node_path), name + self.ARRAY_EXTENSION)
+        try:
+            return self._read_file_slice(full, index)
+        except (IOError, OSError):
+            digest = self._read_reference(node_path, name)
+            if digest is None:
+                raise
+        with self._shared_lock:
+            array = self._shared.get(digest)
+        if array is not None:
+            return array[index]
+        return self._read_file_slice(self._blob_filename(digest), index)
+
+    def read_lazy_array(self, node_path, name):
+        full = os.path.join(self._get_node(node_path), name + self.ARRAY_EXTENSION)
+        indexed = self._indexed_array(node_path, name)
+        if indexed is None:
+            try:
+                return NpyArray(self, node_path, name, full)
+            except (IOError, OSError):
+                digest = self._read_reference(node_path, name)
+                if digest is None:
+                    raise
+            return NpyArray(self, node_path, name, self._blob_filename(digest))
+        else:
+            return NpyArray(self, node_path, name, full, shape=indexed[0], dtype=indexed[1])
 
     def read_other(self, node_path, name):
-        full_name = os.path.join(self._get_node(node_path), name)
-        if not os.path.isfile(full_name):
+        document = self._read_document(node_path)
+        if document is not None and name in document:
+            value = document[name]
+            if isinstance(value, (dict, list)):  # The cached document must not be shared.
+                return copy.deepcopy(value)
+            return value
+        try:
+            f = open(os.path.join(self._get_node(node_path), name), 'r')
+        except (IOError, OSError):
             raise ValueError("Name not found: {}".format(name))
-        with open(full_name, 'r') as f:
+        with f:
             return json.load(f)
 
     def node_names(self, node_path=core.NODE_PATH_SEPARATOR):
-        node = self._get_node(node_path)
-        return [f for f in os.listdir(node) if os.path.isdir(os.path.join(node, f))]
+        names = self._indexed_names(node_path, 'nodes')
+        if names is not None:
+            return names
+        return list(self._scan(node_path)['nodes'])
 
     def array_names(self, node_path):
-        node = self._get_node(node_path)
-        return [os.path.splitext(f)[0] for f in os.listdir(node) if os.path.isfile(os.path.join(node, f))
-                and os.path.splitext(f)[1] == self.ARRAY_EXTENSION]
+        names = self._indexed_names(node_path, 'arrays')
+        if names is not None:
+            return names
+        return list(self._scan(node_path)['arrays'])
 
     def other_names(self, node_path):
-        node = self._get_node(node_path)
-        return [f for f in os.listdir(node)
-                if os.path.isfile(os.path.join(node, f)) and
-                not f.startswith('_') and
-                os.path.splitext(f)[1] != self.ARRAY_EXTENSION]
+        names = self._indexed_names(node_path, 'others')
+        if names is not None:
+            return names
+        document = self._read_document(node_path)
+        if document is not None:
+            return [key for key in document if not key.startswith('_')]
+        return list(self._scan(node_path)['others'])
+
+    def _read_index_log(self):
+        filename = os.path.join(self._root, core.INDEX)
+        if not os.path.isfile(filename):
+            return None
+        records = []
+        with open(filename, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:  # The last write was interrupted.
+                    records.append(None)
+                    break
+        return records
+
+    def _append_index_log(self, records):
+        with open(os.path.join(self._root, core.INDEX), 'a') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+        return True
+
+    def _index_log_length(self):
+        try:
+            return os.path.getsize(os.path.join(self._root, core.INDEX))
+        except OSError:
+            return None
+
+    def _commit(self, operations):
+        """
+        Serialize every JSON value before touching the disk, so that an invalid value fails before anything is written,
+        then create all the directories, then write the JSON files, then write the arrays. With the consolidate option,
+        the values of each node are written as one document.
+        """
+        if self.consolidate:
+            documents = OrderedDict()
+            for operation in operations:
+                if operation[0] == 'write_other':
+                    documents.setdefault(operation[1], OrderedDict())[operation[2]] = operation[3]
+            others = [(node_path, self.DOCUMENT, self._dumps_document(document))
+                      for node_path, document in documents.items()]
+        else:
+            others = [(operation[1], operation[2], self._dumps(operation[2], operation[3]))
+                      for operation in operations if operation[0] == 'write_other']
+        for operation in operations:
+            if operation[0] == 'create_node':
+                self.create_node(operation[1])
+        for node_path, key, text in others:
+            self._write_json(node_path, key, text)
+        if self.consolidate:
+            with self._documents_lock:
+                self._documents.clear()
+        for operation in operations:
+            if operation[0] == 'write_array':
+                self.write_array(*operation[1:])
+
+    def _open_array_writer(self, node_path, key):
+        filename = os.path.join(self._get_node(node_path), key + self.ARRAY_EXTENSION)
+        if not os.path.exists(filename):
+            digest = self._read_reference(node_path, key)
+            if digest is not None:
+                # Appending to a shared array would change every node that refers to it, so this node gets a copy.
+                shutil.copyfile(self._blob_filename(digest), filename)
+                os.remove(os.path.join(self._get_node(node_path), key + self.REFERENCE_EXTENSION))
+                self._invalidate_scans()
+        return NpyArrayWriter(self, node_path, key, filename)
+
+    def _begin_read(self):
+        with self._read_lock:
+            self._read_depth += 1
+            if self._read_depth == 1:
+                self._scans = {}
+
+    def _end_read(self):
+        with self._read_lock:
+            self._read_depth -= 1
+            if not self._read_depth:
+                self._scans = None
+
+    def _check_advice(self, advice):
+        if advice is not None and advice not in self.ADVICE:
+            raise ValueError("Invalid advice {!r}; expected one of {}".format(advice, sorted(self.ADVICE)))
+
+    def _map_array(self, filename):
+        """
+        Return a read-only array that uses a memory map of the given .npy file. Unlike numpy.load(..., mmap_mode='r'),
+        the array is created from the buffer of an mmap object that this instance registers, which can then be closed
+        safely: mmap.close() raises BufferError while any array still uses it. Arrays that cannot be mapped, such as
+        empty arrays and object arrays, are read into memory.
+        """
+        with open(filename, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            count = int(np.prod(shape))
+            if dtype.hasobject or not count or not dtype.itemsize:
+                f.seek(0)
+                return np.load(f)
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        advice = self.ADVICE.get(self.advice)
+        if advice is not None and hasattr(mapping, 'madvise') and hasattr(mmap, advice):
+            mapping.madvise(getattr(mmap, advice))
+        with self._mappings_lock:
+            self._mappings.add(mapping)
+        array = np.frombuffer(mapping, dtype=dtype, count=count, offset=offset)
+        return array.reshape(shape, order='F' if fortran_order else 'C')
+
+    def _read_file_slice(self, filename, index):
+        if self._mmap_mode is not None:
+            return self._map_array(filename)[index]
+        try:
+            array = np.load(filename, mmap_mode='r')
+        except ValueError:  # This is raised for arrays of Python objects.
+            return np.load(filename)[index]
+        return np.array(array[index])
+
+    def _blob_filename(self, digest):
+        return os.path.join(self._root, self.BLOBS, digest + self.ARRAY_EXTENSION)
+
+    def _write_blob(self, digest, value):
+        """
+        Write the given array to the BLOBS directory, unless an array with the same digest is already there. The file is
+        written under a temporary name and then renamed, so a blob that exists is always complete.
+        """
+        filename = self._blob_filename(digest)
+        if os.path.exists(filename):
+            return
+        try:
+            os.mkdir(os.path.dirname(filename))
+        except OSError:  # The directory exists.
+            pass
+        with open(filename + '.tmp', 'wb') as f:
+            np.save(f, value)
+        os.replace(filename + '.tmp', filename)
+
+    def _read_reference(self, node_path, name):
+        """
+        Return the digest stored in the reference file of the given array, or None if there is no reference.
+        """
+        try:
+            with open(os.path.join(self._get_node(node_path), name + self.REFERENCE_EXTENSION), 'r') as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return None
+
+    def _read_blob(self, digest):
+        """
+        Return the read-only array with the given digest. While any array returned by this method is in use, every read
+        of the same digest returns that array, so duplicates share one buffer and are read from disk once.
+        """
+        with self._shared_lock:
+            array = self._shared.get(digest)
+        if array is not None:
+            return array
+        filename = self._blob_filename(digest)
+        if self._mmap_mode is None:
+            array = np.load(filename)
+            array.flags.writeable = False
+        else:
+            array = self._map_array(filename)
+        with self._shared_lock:
+            return self._shared.setdefault(digest, array)
+
+    def _invalidate_scans(self):
+        scans = self._scans
+        if scans is not None:
+            scans.clear()
+
+    def _scan(self, node_path):
+        """
+        Return a dict that maps 'nodes', 'arrays', and 'others' to lists of the names in the directory of the given
+        node, from a single os.scandir() pass whose entries are sorted by _classify(). During a read, the result is
+        cached until the read finishes or this instance writes.
+        """
+        full_path = self._get_node(node_path)
+        scans = self._scans
+        key = ('scan', full_path)
+        if scans is not None and key in scans:
+            return scans[key]
+        scan = {'nodes': [], 'arrays': [], 'others': []}
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                kind = self._classify(entry)
+                if kind == 'arrays':
+                    scan[kind].append(os.path.splitext(entry.name)[0])
+                elif kind is not None:
+                    scan[kind].append(entry.name)
+        if scans is not None:
+            scans[key] = scan
+        return scan
+
+    def _classify(self, entry):
+        """
+        Return 'nodes', 'arrays', or 'others' for the given os.DirEntry in a node directory, or None if it is not part
+        of the node. DirEntry methods usually answer without a stat() call. Subclasses that store other kinds of files
+        in node directories can override this.
+        """
+        if entry.is_dir():
+            return None if entry.name == self.BLOBS else 'nodes'
+        elif not entry.is_file():
+            return None
+        elif os.path.splitext(entry.name)[1] in (self.ARRAY_EXTENSION, self.REFERENCE_EXTENSION):
+            return 'arrays'
+        elif entry.name.startswith('_'):
+            return None
+        else:
+            return 'others'
+
+    def _remove_node(self, node_path):
+        self._invalidate_scans()
+        full_path = os.path.join(self._root, *core.explode(node_path))
+        if os.path.isdir(full_path):
+            shutil.rmtree(full_path)
+        with self._documents_lock:
+            self._documents.clear()
+
+    def _read_document(self, node_path):
+        """
+        Return the dict stored in the consolidated document of the given node, or None if the node has no document.
+        Recently used documents, and their absence, are cached.
+        """
+        full_path = self._get_node(node_path)
+        with self._documents_lock:
+            if full_path in self._documents:
+                document = self._documents.pop(full_path)
+                self._documents[full_path] = document
+                return document
+        try:
+            with open(os.path.join(full_path, self.DOCUMENT), 'r') as f:
+                document = json.load(f)
+        except (IOError, OSError):
+            document = None
+        self._cache_document(full_path, document)
+        return document
+
+    def _cache_document(self, full_path, document):
+        with self._documents_lock:
+            self._documents.pop(full_path, None)
+            self._documents[full_path] = document
+            while len(self._documents) > self.DOCUMENT_CACHE_SIZE:
+                self._documents.popitem(last=False)
+
+    def _update_document(self, node_path, key, value):
+        """
+        Add the given value to the consolidated document of the given node by rewriting it, which is used only when
+        write_other() is called directly.
+        """
+        document = OrderedDict(self._read_document(node_path) or ())
+        if key in document:
+            raise RuntimeError("Value already exists: {}".format(core.join(node_path, key)))
+        document[key] = value
+        text = self._dumps_document(document)
+        filename = os.path.join(self._get_node(node_path), self.DOCUMENT)
+        with open(filename + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(filename + '.tmp', filename)
+        self._cache_document(os.path.dirname(filename), document)
+
+    def _dumps_document(self, document):
+        try:
+            return json.dumps(document)
+        except TypeError:
+            for key, value in document.items():
+                self._dumps(key, value)  # This raises a ValueError that names the key.
+            raise
+
+    @staticmethod
+    def _dumps(key, value):
+        try:
+            return json.dumps(value)
+        except TypeError as e:
+            raise ValueError("json.dump({}) of {} ({}) failed: {}".format(key, value, repr(value), e))
+
+    def _write_json(self, node_path, key, text):
+        with self._safe_open(os.path.join(self._get_node(node_path), key), 'w') as f:
+            f.write(text)
 
     def _get_node(self, node_path):
         if self.closed:
             raise IOError("I/O operation on closed file")
+        scans = self._scans
+        if scans is not None and node_path in scans:
+            return scans[node_path]
         if node_path != '':
             core.validate_node_path(node_path)
         full_path = os.path.join(self._root, *core.explode(node_path))
         if not os.path.isdir(full_path):
             raise ValueError("Invalid path: {}".format(full_path))
+        if scans is not None:
+            scans[node_path] = full_path
         return full_path
 
     @staticmethod
@@ -122,3 +583,83 @@ class NpyJsonIO(core.IO):
         if os.path.exists(filename):
             raise RuntimeError("File already exists: {}".format(filename))
         return open(filename, mode)
+
+
+def npy_header(shape, dtype, version, length):
+    """
+    Return the bytes of a .npy header for a C-order array with the given shape and dtype, in the given format version,
+    padded with spaces to the given total length, or None if the header does not fit.
+    """
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(shape)).encode('latin1')
+    if version == (1, 0):
+        preamble_length = len(np.lib.format.MAGIC_PREFIX) + 4
+        size_format = '<H'
+    else:
+        preamble_length = len(np.lib.format.MAGIC_PREFIX) + 6
+        size_format = '<I'
+    header_length = length - preamble_length
+    if len(header) + 1 > header_length:
+        return None
+    return (np.lib.format.magic(*version) + struct.pack(size_format, header_length) +
+            header.ljust(header_length - 1) + b'\n')
+
+
+class NpyArrayWriter(core.ArrayWriter):
+    """
+    This class appends to a .npy file and rewrites its header in place after each chunk, so that the file is a valid
+    .npy file if acquisition stops unexpectedly. This requires space in the header for the new shape: arrays written
+    with a zero-length first axis have a padded header, as do most other arrays written by recent versions of numpy.
+    """
+
+    def __init__(self, io, node_path, key, filename):
+        with open(filename, 'rb') as f:
+            self._version = np.lib.format.read_magic(f)
+            if self._version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            self._header_length = f.tell()
+        if fortran_order and len(shape) > 1:
+            raise core.MeasurementError("Cannot append to a Fortran-order array: {}".format(filename))
+        super(NpyArrayWriter, self).__init__(io=io, node_path=node_path, key=key, shape=shape, dtype=dtype)
+        self.filename = filename
+        self._file = open(filename, 'r+b')
+        # Data after the end of the array, left by an interrupted append, is overwritten.
+        self._file.seek(self._header_length + int(np.prod(self.shape)) * self.dtype.itemsize)
+
+    def _append(self, chunk):
+        shape = (self.shape[0] + chunk.shape[0],) + self.shape[1:]
+        header = npy_header(shape, self.dtype, self._version, self._header_length)
+        if header is None:
+            raise core.MeasurementError("The header of {} has no space for shape {}.".format(self.filename, shape))
+        self._file.write(chunk.data)
+        end = self._file.tell()
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.seek(end)
+
+    def _close(self):
+        self._file.truncate()
+        self._file.close()
+
+
+class NpyArray(core.LazyArray):
+    """
+    This class is a LazyArray for a .npy file. The shape and dtype are read from the file header, and indexing
+    memory-maps the file and copies only the requested region; see NpyJsonIO.read_array_slice().
+    """
+
+    def __init__(self, io, node_path, key, filename, shape=None, dtype=None):
+        """
+        If the shape and dtype are given, for example from the structural index, the file is not opened.
+        """
+        if shape is None or dtype is None:
+            with open(filename, 'rb') as f:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        super(NpyArray, self).__init__(io=io, node_path=node_path, key=key, shape=shape, dtype=dtype)
+        self.filename = filename
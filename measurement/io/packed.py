@@ -0,0 +1,379 @@
+"""
+This module implements reading and writing of Measurements using a single append-only binary file.
+
+The file contains, in order:
+a preamble with a magic string and the format version;
+the raw bytes of each array, in C order, aligned to ALIGNMENT bytes;
+one JSON section per node that contains the values that are not arrays, written when the node is flushed;
+a JSON footer that describes the whole tree: for each node path, the names of its child nodes, the offset, shape, and
+  dtype of each array, the names of the other values, and the offset and length of its section;
+a fixed-size trailer with the offset and length of the footer.
+
+Every flush appends the sections of the nodes that changed, then a new footer and trailer, so a file is never modified
+in place and the last complete trailer always describes a consistent tree; data written after it by an interrupted
+process is ignored. Opening a file reads only the footer, so node_names(), array_names(), and other_names() do no I/O.
+Arrays are read as read-only, zero-copy views of a memory map of the file.
+
+Limitations and issues:
+-As in NpyJsonIO, values that are not arrays are stored as JSON, so tuples are read back as lists.
+-Only one IO instance should write to a file at a time.
+-Space used by superseded footers and sections is not reclaimed.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import OrderedDict
+import copy
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import weakref
+
+import numpy as np
+
+from measurement import core
+
+logger = logging.getLogger(__name__)
+
+
+class PackedIO(core.IO):
+    # This can be used as a conventional extension for files created by this IO class, but it is not used or enforced
+    # anywhere internally.
+    EXTENSION = '.pak'
+
+    MAGIC = b'\x93MEASPAK'
+    # This is the version of the file format written to the preamble.
+    FORMAT = 1
+    # The preamble is the magic string followed by the format version and four reserved bytes.
+    PREAMBLE = struct.Struct('<8sII')
+    # The trailer is the offset and length of the footer followed by the magic string.
+    TRAILER = struct.Struct('<QQ8s')
+    # Array data starts at a multiple of this many bytes, which suits any dtype and SIMD loads.
+    ALIGNMENT = 64
+
+    def __init__(self, root_path, metadata=None):
+        """
+        Return a new PackedIO instance. An existing file is opened for appending if possible, and read-only otherwise.
+
+        :param root_path: the path to the file.
+        :param metadata: a dict to write to the root node of a new file.
+        """
+        self._writable = False
+        self._file = None
+        self._mapping = None
+        self._mappings = weakref.WeakSet()
+        self._lock = threading.RLock()
+        # This maps each absolute node path to a dict with the keys 'nodes', 'arrays', 'others', and 'section'.
+        self._tree = OrderedDict()
+        # This maps node path to the dict of values in the section of that node, for sections that have been read.
+        self._sections = {}
+        # These node paths have values that have not been flushed.
+        self._dirty = set()
+        # This is True if the tree has changed since the last footer was written.
+        self._changed = False
+        super(PackedIO, self).__init__(root_path=os.path.abspath(os.path.expanduser(root_path)), metadata=metadata)
+        self.flush()
+
+    def _root_path_exists(self, root_path):
+        return os.path.isfile(root_path)
+
+    def _open_existing(self, root_path):
+        try:
+            self._file = open(root_path, 'r+b')
+            self._writable = True
+        except (IOError, OSError):
+            self._file = open(root_path, 'rb')
+        preamble = self._file.read(self.PREAMBLE.size)
+        if len(preamble) < self.PREAMBLE.size or self.PREAMBLE.unpack(preamble)[0] != self.MAGIC:
+            self._file.close()
+            raise core.MeasurementError("Not a {} file: {}".format(self.__class__.__name__, root_path))
+        version = self.PREAMBLE.unpack(preamble)[1]
+        if version > self.FORMAT:
+            self._file.close()
+            raise core.MeasurementError("File {} has format {}, but this version reads format {} or lower.".format(
+                root_path, version, self.FORMAT))
+        self._tree = self._read_footer()
+        return self._file
+
+    def _create_new(self, root_path):
+        self._file = open(root_path, 'x+b')
+        self._writable = True
+        self._file.write(self.PREAMBLE.pack(self.MAGIC, self.FORMAT, 0))
+        self._tree[core.NODE_PATH_SEPARATOR] = self._new_entry()
+        return self._file
+
+    def close(self):
+        """
+        Flush, close the file, and release the memory maps that no array uses; a mapping that is still used by an array
+        stays open until the last such array is deleted.
+        """
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._root = None
+            self._mapping = None
+            for mapping in list(self._mappings):
+                try:
+                    mapping.close()
+                except BufferError:  # An array still exports the buffer.
+                    pass
+
+    @property
+    def closed(self):
+        return self._root is None
+
+    def flush(self):
+        """
+        Write the sections of the nodes that have changed, then a new footer and trailer, so that other readers see
+        everything written so far. This is called after each write() and batch, and by close(); it is needed only after
+        calling create_node(), write_other(), or write_array() directly.
+        """
+        with self._lock:
+            if self.closed or not self._changed:
+                return
+            for node_path in sorted(self._dirty):
+                text = self._dumps_section(self._sections[node_path])
+                self._tree[node_path]['section'] = [self._append(text.encode('utf-8')), len(text.encode('utf-8'))]
+            footer = json.dumps({'format': self.FORMAT, 'nodes': self._tree}).encode('utf-8')
+            offset = self._append(footer)
+            self._append(self.TRAILER.pack(offset, len(footer), self.MAGIC), align=False)
+            self._file.flush()
+            self._dirty.clear()
+            self._changed = False
+
+    def write(self, node, node_path=None, buffered=False):
+        super(PackedIO, self).write(node, node_path=node_path, buffered=buffered)
+        if self._batch is None:
+            self.flush()
+
+    def create_node(self, node_path):
+        node_path = self._normalize(node_path)
+        existing, new = core.split(node_path)
+        if not new:
+            raise core.MeasurementError("Cannot create root node.")
+        with self._lock:
+            parent = self._get_node(existing)
+            if node_path in self._tree:
+                raise RuntimeError("Node already exists: {}".format(node_path))
+            self._check_writable()
+            parent['nodes'].append(new)
+            self._tree[node_path] = self._new_entry()
+            self._sections[node_path] = {}
+            self._dirty.add(node_path)
+            self._changed = True
+
+    def write_other(self, node_path, key, value):
+        node_path = self._normalize(node_path)
+        # Values are kept as they will be read back from the file, and this fails before anything changes if the value
+        # cannot be stored.
+        value = json.loads(self._dumps(key, value))
+        with self._lock:
+            node = self._get_node(node_path)
+            section = self._read_section(node_path)
+            if key in section:
+                raise RuntimeError("Value already exists: {}".format(core.join(node_path, key)))
+            self._check_writable()
+            section[key] = value
+            node['others'].append(key)
+            self._dirty.add(node_path)
+            self._changed = True
+
+    def write_array(self, node_path, key, value, dimensions):
+        node_path = self._normalize(node_path)
+        value = np.asarray(value)
+        if not value.flags.c_contiguous:
+            value = value.copy(order='C')
+        if value.dtype.hasobject:
+            raise core.MeasurementError("Cannot write an array with dtype object: {}".format(core.join(node_path, key)))
+        with self._lock:
+            node = self._get_node(node_path)
+            if key in node['arrays']:
+                raise RuntimeError("Array already exists: {}".format(core.join(node_path, key)))
+            self._check_writable()
+            offset = self._append(value.data if value.size else b'')
+            node['arrays'][key] = [offset, [int(length) for length in value.shape],
+                                   np.lib.format.dtype_to_descr(value.dtype)]
+            self._changed = True
+
+    def read_array(self, node_path, key):
+        """
+        Return a read-only view of the array in the memory map of the file, which copies nothing.
+        """
+        offset, shape, dtype = self._array_entry(node_path, key)
+        count = int(np.prod(shape))
+        if not count or not dtype.itemsize:
+            return np.empty(shape, dtype=dtype)
+        mapping = self._map(offset + count * dtype.itemsize)
+        return np.frombuffer(mapping, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    def read_array_slice(self, node_path, key, index):
+        """
+        Return the selected region as a view of the memory map of the file where numpy indexing allows one.
+        """
+        return self.read_array(node_path, key)[index]
+
+    def read_lazy_array(self, node_path, key):
+        offset, shape, dtype = self._array_entry(node_path, key)
+        return core.LazyArray(self, node_path, key, shape, dtype)
+
+    def read_other(self, node_path, key):
+        with self._lock:
+            section = self._read_section(self._normalize(node_path))
+            try:
+                value = section[key]
+            except KeyError:
+                raise ValueError("Name not found: {}".format(key))
+        if isinstance(value, (dict, list)):  # The cached section must not be shared.
+            return copy.deepcopy(value)
+        return value
+
+    def node_names(self, node_path=core.NODE_PATH_SEPARATOR):
+        return list(self._get_node(self._normalize(node_path))['nodes'])
+
+    def array_names(self, node_path):
+        return list(self._get_node(self._normalize(node_path))['arrays'])
+
+    def other_names(self, node_path):
+        return [key for key in self._get_node(self._normalize(node_path))['others'] if not key.startswith('_')]
+
+    # Private methods.
+
+    def _commit_batch(self, batch):
+        try:
+            super(PackedIO, self)._commit_batch(batch)
+        finally:
+            self.flush()
+
+    def _remove_node(self, node_path):
+        node_path = self._normalize(node_path)
+        existing, name = core.split(node_path)
+        with self._lock:
+            if node_path not in self._tree:
+                return
+            self._tree[existing]['nodes'].remove(name)
+            self._changed = True
+            prefix = node_path + core.NODE_PATH_SEPARATOR
+            for path in [path for path in self._tree if path == node_path or path.startswith(prefix)]:
+                del self._tree[path]
+                self._sections.pop(path, None)
+                self._dirty.discard(path)
+
+    @staticmethod
+    def _new_entry():
+        return OrderedDict([('nodes', []), ('arrays', OrderedDict()), ('others', []), ('section', None)])
+
+    @staticmethod
+    def _normalize(node_path):
+        return core.NODE_PATH_SEPARATOR + core.NODE_PATH_SEPARATOR.join(core.explode(node_path))
+
+    def _get_node(self, node_path):
+        if self.closed:
+            raise IOError("I/O operation on closed file")
+        try:
+            return self._tree[node_path]
+        except KeyError:
+            raise ValueError("Invalid path: {}".format(node_path))
+
+    def _check_writable(self):
+        if not self._writable:
+            raise core.MeasurementError("Cannot write to a file opened read-only: {}".format(self.root_path))
+
+    def _array_entry(self, node_path, key):
+        try:
+            offset, shape, descr = self._get_node(self._normalize(node_path))['arrays'][key]
+        except KeyError:
+            raise ValueError("Array not found: {}".format(core.join(node_path, key)))
+        if isinstance(descr, list):  # JSON turns the tuples of a structured dtype into lists.
+            descr = [tuple(field) for field in descr]
+        return offset, tuple(shape), np.lib.format.descr_to_dtype(descr)
+
+    def _read_section(self, node_path):
+        """
+        Return the dict of values of the given node, reading its section if necessary; the caller holds the lock.
+        """
+        node = self._get_node(node_path)
+        if node_path not in self._sections:
+            if node['section'] is None:
+                self._sections[node_path] = {}
+            else:
+                offset, length = node['section']
+                mapping = self._map(offset + length)
+                self._sections[node_path] = json.loads(mapping[offset:offset + length].decode('utf-8'))
+        return self._sections[node_path]
+
+    def _map(self, end):
+        """
+        Return a memory map of the file that extends at least to the given offset, mapping the file again if it has
+        grown since the current map was made. Arrays keep the map that they view alive.
+        """
+        with self._lock:
+            if self._mapping is None or len(self._mapping) < end:
+                if self._writable:
+                    self._file.flush()
+                self._mapping = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mappings.add(self._mapping)
+            return self._mapping
+
+    def _append(self, data, align=True):
+        """
+        Write the given bytes at the end of the file, preceded by zeros up to the next multiple of ALIGNMENT, and return
+        the offset at which they start.
+        """
+        end = self._file.seek(0, os.SEEK_END)
+        if align and end % self.ALIGNMENT:
+            self._file.write(b'\0' * (self.ALIGNMENT - end % self.ALIGNMENT))
+            end += self.ALIGNMENT - end % self.ALIGNMENT
+        self._file.write(data)
+        return end
+
+    def _read_footer(self):
+        """
+        Return the tree described by the last complete trailer in the file. If the file ends with an incomplete write,
+        earlier trailers are tried in turn.
+        """
+        size = self._file.seek(0, os.SEEK_END)
+        if size <= self.PREAMBLE.size:
+            return OrderedDict([(core.NODE_PATH_SEPARATOR, self._new_entry())])
+        mapping = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = size
+            while True:
+                position = mapping.rfind(self.MAGIC, self.PREAMBLE.size, end)
+                if position < 0:
+                    raise core.MeasurementError("No complete footer found in {}".format(self.root_path))
+                start = position + len(self.MAGIC) - self.TRAILER.size
+                end = position + len(self.MAGIC) - 1
+                if start < self.PREAMBLE.size:
+                    continue
+                offset, length, magic = self.TRAILER.unpack(mapping[start:start + self.TRAILER.size])
+                if offset + length != start:
+                    continue
+                try:
+                    footer = json.loads(mapping[offset:start].decode('utf-8'), object_pairs_hook=OrderedDict)
+                except ValueError:
+                    continue
+                if start + self.TRAILER.size < size:
+                    logger.warning("Ignoring {} bytes after the last footer of {}".format(
+                        size - start - self.TRAILER.size, self.root_path))
+                return footer['nodes']
+        finally:
+            mapping.close()
+
+    def _dumps_section(self, section):
+        try:
+            return json.dumps(section)
+        except TypeError:
+            for key, value in section.items():
+                self._dumps(key, value)  # This raises a ValueError that names the key.
+            raise
+
+    @staticmethod
+    def _dumps(key, value):
+        try:
+            return json.dumps(value)
+        except TypeError as e:
+            raise ValueError("json.dump({}) of {} ({}) failed: {}".format(key, value, repr(value), e))
@@ -0,0 +1,351 @@
+"""
+This module implements reading and writing of Measurements using a single SQLite database, which suits datasets with
+very many small nodes.
+
+The database has three tables:
+nodes, with one row per node: its id, node path, parent node path, name, and the class name stored in the node;
+others, with one row per value that is not an array: the node id, the key, and the value as JSON text;
+arrays, with one row per array: the node id, the key, the shape and dtype as JSON text, and the data as a blob in
+  C order.
+Rows are returned in the order in which they were written. The nodes table is indexed by path, parent, and class, so
+listing a node and finding the nodes of a class do not scan the table.
+
+Because values are stored as JSON, the SQLite JSON functions can query them without instantiating any Measurements,
+using execute(). For example, to find the paths of all FrequencySweeps measured above 100 mK:
+
+    io.execute("SELECT nodes.path FROM nodes JOIN others ON others.node = nodes.id "
+               "WHERE nodes.class = ? AND others.key = 'state' AND json_extract(others.value, '$.temperature') > ?",
+               ('FrequencySweep', 0.1))
+
+Each write() and each batch is a single transaction, so a failed write leaves the database unchanged. The database
+uses write-ahead logging, so readers in other processes are not blocked by a writer.
+
+Limitations and issues:
+-As in NpyJsonIO, values that are not arrays are stored as JSON, so tuples are read back as lists.
+-Arrays with dtype object cannot be stored.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from measurement import core
+
+
+class SqliteIO(core.IO):
+    # This can be used as a conventional extension for files created by this IO class, but it is not used or enforced
+    # anywhere internally.
+    EXTENSION = '.sqlite'
+
+    # This is the version of the schema, which is stored as the user_version of the database.
+    FORMAT = 1
+
+    SCHEMA = """
+        CREATE TABLE nodes (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, parent TEXT, name TEXT NOT NULL,
+                            class TEXT);
+        CREATE INDEX nodes_parent ON nodes (parent);
+        CREATE INDEX nodes_class ON nodes (class);
+        CREATE TABLE others (node INTEGER NOT NULL REFERENCES nodes (id) ON DELETE CASCADE, key TEXT NOT NULL,
+                             value TEXT, UNIQUE (node, key));
+        CREATE TABLE arrays (node INTEGER NOT NULL REFERENCES nodes (id) ON DELETE CASCADE, key TEXT NOT NULL,
+                             shape TEXT NOT NULL, dtype TEXT NOT NULL, data BLOB NOT NULL, UNIQUE (node, key));
+    """
+
+    def __init__(self, root_path, metadata=None, timeout=60):
+        """
+        Return a new SqliteIO instance.
+
+        :param root_path: the path to the database file.
+        :param metadata: a dict to write to the root node of a new database.
+        :param timeout: the number of seconds to wait for another connection to finish writing.
+        """
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        # This maps node path to the id of the node in the nodes table.
+        self._node_ids = {}
+        super(SqliteIO, self).__init__(root_path=os.path.abspath(os.path.expanduser(root_path)), metadata=metadata)
+
+    def _root_path_exists(self, root_path):
+        return os.path.isfile(root_path)
+
+    def _open_existing(self, root_path):
+        connection = self._connect(root_path)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version > self.FORMAT:
+            connection.close()
+            raise core.MeasurementError("Database {} has format {}, but this version reads format {} or lower.".format(
+                root_path, version, self.FORMAT))
+        return connection
+
+    def _create_new(self, root_path):
+        connection = self._connect(root_path)
+        connection.executescript('BEGIN;' + self.SCHEMA + 'PRAGMA user_version = {}; COMMIT;'.format(self.FORMAT))
+        connection.execute('INSERT INTO nodes (path, parent, name) VALUES (?, NULL, ?)', (core.NODE_PATH_SEPARATOR, ''))
+        return connection
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            if not self.closed:
+                self._root.close()
+                self._root = None
+                self._node_ids = {}
+
+    @property
+    def closed(self):
+        return self._root is None
+
+    def execute(self, sql, parameters=()):
+        """
+        Execute the given SQL statement with the given parameters and return a list of the resulting rows; see the
+        module docstring for the schema.
+        """
+        with self._lock:
+            return self._get_connection().execute(sql, parameters).fetchall()
+
+    def write(self, node, node_path=None, buffered=False):
+        with self._transaction():
+            super(SqliteIO, self).write(node, node_path=node_path, buffered=buffered)
+
+    def create_node(self, node_path):
+        node_path = self._normalize(node_path)
+        existing, new = core.split(node_path)
+        if not new:
+            raise core.MeasurementError("Cannot create root node.")
+        with self._lock:
+            self._node_id(existing)
+            self._insert_node(node_path, None)
+
+    def write_other(self, node_path, key, value):
+        node_path = self._normalize(node_path)
+        text = self._dumps(key, value)
+        with self._lock:
+            node_id = self._node_id(node_path)
+            try:
+                self._get_connection().execute('INSERT INTO others (node, key, value) VALUES (?, ?, ?)',
+                                               (node_id, key, text))
+            except sqlite3.IntegrityError:
+                raise RuntimeError("Value already exists: {}".format(core.join(node_path, key)))
+            if key == core.CLASS_NAME:
+                self._get_connection().execute('UPDATE nodes SET class = ? WHERE id = ?', (value, node_id))
+
+    def write_array(self, node_path, key, value, dimensions):
+        node_path = self._normalize(node_path)
+        with self._lock:
+            row = (self._node_id(node_path), key) + self._array_columns(node_path, key, value)
+            try:
+                self._get_connection().execute(
+                    'INSERT INTO arrays (node, key, shape, dtype, data) VALUES (?, ?, ?, ?, ?)', row)
+            except sqlite3.IntegrityError:
+                raise RuntimeError("Array already exists: {}".format(core.join(node_path, key)))
+
+    def read_array(self, node_path, key):
+        with self._lock:
+            row = self._get_connection().execute('SELECT shape, dtype, data FROM arrays WHERE node = ? AND key = ?',
+                                                 (self._node_id(self._normalize(node_path)), key)).fetchone()
+        if row is None:
+            raise ValueError("Array not found: {}".format(core.join(node_path, key)))
+        shape, dtype, data = row
+        return np.frombuffer(bytearray(data), dtype=self._loads_dtype(dtype)).reshape(json.loads(shape))
+
+    def read_array_slice(self, node_path, key, index):
+        """
+        Read only the rows along the first axis that contain the selected region, using incremental blob I/O where the
+        sqlite3 module supports it; elsewhere, the whole array is read.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            row = connection.execute('SELECT rowid, shape, dtype FROM arrays WHERE node = ? AND key = ?',
+                                     (self._node_id(self._normalize(node_path)), key)).fetchone()
+            if row is None:
+                raise ValueError("Array not found: {}".format(core.join(node_path, key)))
+            rowid, shape, dtype = row[0], tuple(json.loads(row[1])), self._loads_dtype(row[2])
+            split = core.bounding_box(index, shape)
+            if split is None or not shape or not hasattr(connection, 'blobopen'):
+                return self.read_array(node_path, key)[index]
+            box, local = split
+            (start, stop), rest = box[0], box[1:]
+            row_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+            data = bytearray()
+            if stop > start and row_bytes:
+                with connection.blobopen('arrays', 'data', rowid, readonly=True) as blob:
+                    blob.seek(start * row_bytes)
+                    data = bytearray(blob.read((stop - start) * row_bytes))
+        rows = np.frombuffer(data, dtype=dtype).reshape((stop - start,) + shape[1:])
+        return rows[(slice(None),) + tuple(slice(first, last) for first, last in rest)][local]
+
+    def read_lazy_array(self, node_path, key):
+        """
+        Return a LazyArray whose shape and dtype are read without reading the data.
+        """
+        with self._lock:
+            row = self._get_connection().execute('SELECT shape, dtype FROM arrays WHERE node = ? AND key = ?',
+                                                 (self._node_id(self._normalize(node_path)), key)).fetchone()
+        if row is None:
+            raise ValueError("Array not found: {}".format(core.join(node_path, key)))
+        return core.LazyArray(self, node_path, key, json.loads(row[0]), self._loads_dtype(row[1]))
+
+    def read_other(self, node_path, key):
+        with self._lock:
+            row = self._get_connection().execute('SELECT value FROM others WHERE node = ? AND key = ?',
+                                                 (self._node_id(self._normalize(node_path)), key)).fetchone()
+        if row is None:
+            raise ValueError("Name not found: {}".format(key))
+        return json.loads(row[0])
+
+    def node_names(self, node_path=core.NODE_PATH_SEPARATOR):
+        node_path = self._normalize(node_path)
+        with self._lock:
+            self._node_id(node_path)
+            rows = self._get_connection().execute('SELECT name FROM nodes WHERE parent = ? ORDER BY id',
+                                                  (node_path,)).fetchall()
+        return [row[0] for row in rows]
+
+    def array_names(self, node_path):
+        with self._lock:
+            rows = self._get_connection().execute('SELECT key FROM arrays WHERE node = ? ORDER BY rowid',
+                                                  (self._node_id(self._normalize(node_path)),)).fetchall()
+        return [row[0] for row in rows]
+
+    def other_names(self, node_path):
+        with self._lock:
+            rows = self._get_connection().execute('SELECT key FROM others WHERE node = ? ORDER BY rowid',
+                                                  (self._node_id(self._normalize(node_path)),)).fetchall()
+        return [row[0] for row in rows if not row[0].startswith('_')]
+
+    # Private methods.
+
+    def _commit(self, operations):
+        """
+        Insert the nodes one at a time, to learn their ids, then insert all the values and all the arrays using one
+        executemany() call each. Every value is serialized before anything is inserted.
+        """
+        classes = dict((operation[1], operation[3]) for operation in operations
+                       if operation[0] == 'write_other' and operation[2] == core.CLASS_NAME)
+        others = [(self._normalize(operation[1]), operation[2], self._dumps(operation[2], operation[3]))
+                  for operation in operations if operation[0] == 'write_other']
+        with self._lock:
+            for operation in operations:
+                if operation[0] == 'create_node':
+                    self._insert_node(self._normalize(operation[1]), classes.get(operation[1]))
+            connection = self._get_connection()
+            try:
+                connection.executemany('INSERT INTO others (node, key, value) VALUES (?, ?, ?)',
+                                       [(self._node_id(node_path), key, text) for node_path, key, text in others])
+            except sqlite3.IntegrityError as e:
+                raise RuntimeError("Value already exists: {}".format(e))
+            connection.executemany('INSERT INTO arrays (node, key, shape, dtype, data) VALUES (?, ?, ?, ?, ?)',
+                                   ((self._node_id(self._normalize(operation[1])), operation[2]) +
+                                    self._array_columns(operation[1], operation[2], operation[3])
+                                    for operation in operations if operation[0] == 'write_array'))
+
+    def _commit_batch(self, batch):
+        with self._transaction():
+            super(SqliteIO, self)._commit_batch(batch)
+
+    def _remove_node(self, node_path):
+        node_path = self._normalize(node_path)
+        prefix = node_path + core.NODE_PATH_SEPARATOR
+        with self._lock:
+            self._get_connection().execute('DELETE FROM nodes WHERE path = ? OR substr(path, 1, ?) = ?',
+                                           (node_path, len(prefix), prefix))
+            self._node_ids = {}
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Return a context manager that runs the enclosed statements in one transaction, which is committed when the
+        outermost such context exits normally and rolled back otherwise.
+        """
+        with self._lock:
+            connection = self._get_connection()
+            if self._transaction_depth == 0:
+                connection.execute('BEGIN IMMEDIATE')
+            self._transaction_depth += 1
+            try:
+                yield connection
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    connection.execute('ROLLBACK')
+                    self._node_ids = {}
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    connection.execute('COMMIT')
+
+    def _connect(self, root_path):
+        # Statements are committed explicitly by _transaction(), or immediately outside one.
+        connection = sqlite3.connect(root_path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+    def _get_connection(self):
+        if self.closed:
+            raise IOError("I/O operation on closed file")
+        return self._root
+
+    def _insert_node(self, node_path, class_name):
+        existing, name = core.split(node_path)
+        try:
+            cursor = self._get_connection().execute('INSERT INTO nodes (path, parent, name, class) VALUES (?, ?, ?, ?)',
+                                                    (node_path, existing, name, class_name))
+        except sqlite3.IntegrityError:
+            raise RuntimeError("Node already exists: {}".format(node_path))
+        self._node_ids[node_path] = cursor.lastrowid
+
+    def _node_id(self, node_path):
+        """
+        Return the id of the node with the given normalized node path; the caller holds the lock.
+        """
+        try:
+            return self._node_ids[node_path]
+        except KeyError:
+            pass
+        row = self._get_connection().execute('SELECT id FROM nodes WHERE path = ?', (node_path,)).fetchone()
+        if row is None:
+            raise ValueError("Invalid path: {}".format(node_path))
+        self._node_ids[node_path] = row[0]
+        return row[0]
+
+    @staticmethod
+    def _normalize(node_path):
+        return core.NODE_PATH_SEPARATOR + core.NODE_PATH_SEPARATOR.join(core.explode(node_path))
+
+    @staticmethod
+    def _array_columns(node_path, key, value):
+        """
+        Return the shape, dtype, and data columns for the given array.
+        """
+        value = np.asarray(value)
+        if value.dtype.hasobject:
+            raise core.MeasurementError("Cannot write an array with dtype object: {}".format(core.join(node_path, key)))
+        if not value.flags.c_contiguous:
+            value = value.copy(order='C')
+        return (json.dumps([int(length) for length in value.shape]),
+                json.dumps(np.lib.format.dtype_to_descr(value.dtype)),
+                sqlite3.Binary(value.data) if value.size else b'')
+
+    @staticmethod
+    def _loads_dtype(text):
+        descr = json.loads(text)
+        if isinstance(descr, list):  # JSON turns the tuples of a structured dtype into lists.
+            descr = [tuple(field) for field in descr]
+        return np.lib.format.descr_to_dtype(descr)
+
+    @staticmethod
+    def _dumps(key, value):
+        try:
+            return json.dumps(value)
+        except TypeError as e:
+            raise ValueError("json.dump({}) of {} ({}) failed: {}".format(key, value, repr(value), e))
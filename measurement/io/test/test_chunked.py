@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+from testfixtures import TempDirectory
+
+from measurement import core
+from measurement.test import utilities
+from measurement.io import chunked
+
+
+def test_read_write_measurement():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path)
+        original = utilities.CornerCases()
+        name = 'measurement'
+        io.write(original, name)
+        assert original == io.read(name)
+
+
+def test_read_write_sweep_stream():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path, workers=4)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        assert original == io.read(name)
+        io.close()
+
+
+def test_read_slice():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path, storage=core.StoragePolicy(chunks=(2, 100), checksum=True))
+        io.create_node('node')
+        original = np.random.randn(4, 1000) + 1j * np.random.randn(4, 1000)
+        io.write_array('node', 'data', original, ('channel', 'time'))
+        data = io.read_lazy_array('node', 'data')
+        assert isinstance(data, chunked.ChunkedArray)
+        opened = []
+        chunked.open = lambda filename, mode='r': opened.append(os.path.basename(filename)) or open(filename, mode)
+        try:
+            assert np.all(data[3, 250:420] == original[3, 250:420])
+        finally:
+            del chunked.open
+        assert sorted(opened) == ['1.2', '1.3', '1.4']
+        for index in [Ellipsis, 1, -1, (Ellipsis, 999), (slice(None), slice(998, None)), (slice(None, None, -1), 5),
+                      (2, slice(900, 100, -7)), (0, slice(5, 5)), (np.array([0, 2]),)]:
+            assert np.all(data[index] == original[index])
+        assert np.all(io.read_array('node', 'data') == original)
+        with pytest.raises(IndexError):
+            data[4]
+
+
+def test_append_array():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path, storage=core.StoragePolicy(chunks=(3,)))
+        original = utilities.fake_time_ordered_stream(num_samples=10)
+        io.write(utilities.fake_time_ordered_stream(num_samples=0), 'stream')
+        with io.open_array_writer('stream', 'time') as time, io.open_array_writer('stream', 'data') as data:
+            for start in range(0, 10, 4):
+                time.append(original.time[start:start + 4])
+                data.append(original.data[start:start + 4])
+        stream = io.read('stream')
+        assert np.all(stream.time == original.time)
+        assert np.all(stream.data == original.data)
+
+
+def test_index_direct_writes():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path)
+        io.create_node('/node')
+        io.write_array('/node', 'array', np.arange(3.), ('x',))
+        with pytest.raises(core.MeasurementError):
+            io.write_array('/node', 'objects', np.array([None]), ('y',))
+        assert io._index is not None
+        assert io.node_names() == ['node']
+        assert io.array_names('node') == ['array']
+
+
+def test_checksum():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path, storage=core.StoragePolicy(checksum=True))
+        io.write(utilities.fake_time_ordered_stream(), 'stream')
+        filename = os.path.join(directory.path, 'stream', 'data' + io.ARRAY_EXTENSION, '0')
+        with open(filename, 'r+b') as f:
+            f.write(b'\0')
+        with pytest.raises(core.MeasurementError):
+            io.read('stream')
+
+
+def test_from_series():
+    with TempDirectory() as directory:
+        io = chunked.ChunkedIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert core.from_series(original.to_dataframe(add_origin=True).iloc[0]) == original
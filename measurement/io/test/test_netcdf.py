@@ -1,7 +1,10 @@
 import os
 
+import numpy as np
+import pytest
 from testfixtures import TempDirectory
 
+from measurement import core, measurements
 from measurement.test import utilities
 from measurement.io import netcdf
 
@@ -92,3 +95,246 @@ def test_from_series():
         original.add_origin(df)
         assert original == core.from_series(df.iloc[0])
 """
+
+
+def test_read_lazy():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = utilities.fake_time_ordered_stream_array()
+        name = 'stream_array'
+        io.write(original, name)
+        lazy = io.read(name, lazy=True)
+        assert isinstance(lazy.data, netcdf.NetcdfArray)
+        assert lazy.data.shape == original.data.shape
+        assert lazy.data.dtype == original.data.dtype
+        assert np.all(lazy.data[1, 10:20] == original.data[1, 10:20])
+        assert np.all(lazy[2].data == original.data[2])
+        assert original == lazy
+
+
+def test_read_workers():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = core.MeasurementList([utilities.fake_sweep_stream() for _ in range(10)])
+        name = 'sweep_streams'
+        io.write(original, name)
+        io.close()
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        ml = io.read(name, workers=4)
+        assert len(ml) == len(original)
+        assert all(m == o for m, o in zip(ml, original))
+
+
+def test_read_workers_stress():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(root_path)
+        original = core.MeasurementList([measurements.TimeOrderedStream(time=np.arange(16.), data=np.ones(16, complex),
+                                                                         state={}) for _ in range(300)])
+        io.write(original, 'streams', buffered=True)
+        io.close()
+        io = netcdf.NetcdfIO(root_path)
+        # The netCDF libraries are not thread-safe, so these reads must be serial to avoid crashing the process.
+        assert not io._begin_parallel()
+        for _ in range(5):
+            assert io.read('streams', workers=8) == original
+        io.close()
+
+
+def test_batch():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name, buffered=True)
+        assert original == io.read(name)
+        corner_cases = utilities.CornerCases()
+        io.write(corner_cases, 'corner_cases', buffered=True)
+        assert corner_cases == io.read('corner_cases')
+
+
+def test_batch_rollback():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = utilities.fake_sweep_stream()
+
+        def fail(*args):
+            raise RuntimeError()
+
+        io._create_variable = fail
+        try:
+            io.write(original, 'sweep_stream', buffered=True)
+            raise AssertionError("The commit should have failed.")
+        except RuntimeError:
+            pass
+        assert not io.node_names()
+        del io._create_variable
+        io.write(original, 'sweep_stream')
+        assert original == io.read('sweep_stream')
+
+
+def test_index():
+    with TempDirectory() as directory:
+        filename = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(filename)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        io.close()
+        io = netcdf.NetcdfIO(filename)
+        assert io._index is not None
+        assert io.node_names() == [name]
+        assert sorted(io.node_names(name)) == ['stream', 'sweep']
+        assert sorted(io.array_names(core.join(name, 'sweep'))) == ['data', 'frequency']
+        assert original == io.read(name)
+
+
+def test_index_direct_writes():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        io.create_node('/node')
+        io.write_array('/node', 'array', np.arange(3.), ('x',))
+        io.write_other('/node', 'key', 1)
+        assert io._index is not None
+        assert io.node_names() == ['node']
+        assert io.array_names('node') == ['array']
+        assert io.other_names('node') == ['key']
+        io.close()
+
+
+def test_append_array():
+    with TempDirectory() as directory:
+        filename = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(filename)
+        io.write(utilities.fake_time_ordered_stream(num_samples=0), 'stream')
+        full = utilities.fake_time_ordered_stream(num_samples=100)
+        with io.open_array_writer('stream', 'time') as time_writer, io.open_array_writer('stream', 'data') as writer:
+            for start in range(0, 100, 25):
+                time_writer.append(full.time[start:start + 25])
+                writer.append(full.data[start:start + 25])
+        io.close()
+        io = netcdf.NetcdfIO(filename)
+        stream = io.read('stream')
+        assert np.all(stream.time == full.time)
+        assert np.all(stream.data == full.data)
+        assert io.read('stream', lazy=True).data.shape == full.data.shape
+
+
+def test_storage_policy():
+    with TempDirectory() as directory:
+        filename = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(filename, storage=core.StoragePolicy(compression=4, checksum=True))
+        original = utilities.fake_time_ordered_stream_array(num_channels=4, num_samples=2 ** 10)
+        io.write(original, 'stream_array')
+        data = io._get_node('/stream_array').variables['data']
+        assert data.chunking() == [1, 2 ** 10]
+        filters = data.filters()
+        assert filters['zlib'] and filters['complevel'] == 4 and filters['shuffle'] and filters['fletcher32']
+        time = io._get_node('/stream_array').variables['time']
+        assert time.filters()['zlib']
+        io.close()
+        io = netcdf.NetcdfIO(filename)
+        assert original == io.read('stream_array')
+
+
+def test_compound_types_at_root():
+    with TempDirectory() as directory:
+        filename = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(filename)
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert list(io._root.cmptypes) == ['complex128']
+        assert not io._get_node('/sweep_stream/sweep').cmptypes
+        io.close()
+        io = netcdf.NetcdfIO(filename)
+        read = io.read('sweep_stream')
+        assert read.stream.data.dtype == np.dtype('complex128')
+        assert type(read.stream.data) is np.ndarray
+        assert original == read
+
+
+def test_group_cache():
+    with TempDirectory() as directory:
+        filename = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(filename)
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert io._get_node('/sweep_stream/sweep') is io._root.groups['sweep_stream'].groups['sweep']
+        assert '/sweep_stream/sweep' in io._groups
+        groups = len(io._groups)
+        assert io._get_node('sweep_stream/sweep') is io._get_node('/sweep_stream/sweep')
+        assert io._get_node('') is io._get_node('/')
+        with pytest.raises(core.MeasurementError):
+            io._get_node('/sweep_stream/sweep/')
+        assert len(io._groups) == groups
+        io._remove_node('/sweep_stream')
+        assert not io._groups
+        io.close()
+        assert not io._groups
+
+
+def test_read_array_slice():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = utilities.fake_time_ordered_stream_array()
+        io.write(original, 'stream_array')
+        for index in [(2, slice(None)), (slice(None), slice(10, 20)), ([3, 1], slice(None, None, -3)),
+                      ([0, 2], [5, 7])]:
+            assert np.all(io.read_array_slice('stream_array', 'data', index) == original.data[index])
+        stream = utilities.fake_time_ordered_stream(num_samples=0)
+        io.write(stream, 'stream')
+        with io.open_array_writer('stream', 'time') as time, io.open_array_writer('stream', 'data') as data:
+            time.append(np.arange(5.))
+            data.append(np.arange(5.) + 0j)
+        assert np.all(io.read_array_slice('stream', 'data', slice(None)) == np.arange(5.))
+        assert np.all(io.read_array_slice('stream', 'data', -1) == 4)
+
+
+def test_fingerprint():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'))
+        original = core.MeasurementList([utilities.CornerCases(), utilities.fake_sweep_stream()])
+        io.write(original, 'stored')
+        io.store_fingerprints = False
+        io.write(original, 'hashed')
+        # Values read back with different types, such as a list of ints and floats, hash the same.
+        assert io.fingerprint('stored') == io.fingerprint('hashed') == original.fingerprint()
+        assert io.read('hashed', lazy=True).fingerprint() == original.fingerprint()
+
+
+def test_dedupe():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.nc')
+        io = netcdf.NetcdfIO(root_path, dedupe=True)
+        original = core.MeasurementList(utilities.fake_time_ordered_stream_array().iter_channels())
+        io.write(core.MeasurementList(original[:2]), 'first')
+        io.write(core.MeasurementList(original[2:]), 'second', buffered=True)
+        assert len(io._root.groups['measurement_blobs'].variables) == 5  # One time array and four data arrays.
+        assert all('measurement_reference' in variable.ncattrs()
+                   for variable in io._root['first/0'].variables.values() if variable.ndim == 0)
+        io.close()
+        io = netcdf.NetcdfIO(root_path)
+        assert io.node_names() == ['first', 'second']
+        assert core.MeasurementList(list(io.read('first')) + list(io.read('second', lazy=True))) == original
+        first = io.read('first')
+        assert first[0].time is first[1].time and not first[0].time.flags.writeable
+        assert np.all(io.read_array_slice('second/1', 'data', slice(5, 9)) == original[3].data[5:9])
+        assert io.fingerprint('first') == core.MeasurementList(original[:2]).fingerprint()
+        io.close()
+
+
+def test_dedupe_rollback():
+    with TempDirectory() as directory:
+        io = netcdf.NetcdfIO(os.path.join(directory.path, 'test.nc'), dedupe=True)
+        original = utilities.fake_time_ordered_stream()
+        # netCDF4 has no float16 type, so this fails after the Variable for the time array of the first node exists.
+        bad = utilities.fake_time_ordered_stream()
+        bad.time = bad.time.astype(np.float16)
+        with pytest.raises(TypeError):
+            with io.batch():
+                io.write(original, 'first')
+                io.write(bad, 'bad')
+        assert io.node_names() == []
+        io.write(original, 'second')
+        assert original == io.read('second')
+        io.close()
@@ -1,5 +1,11 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
 from testfixtures import TempDirectory
 
+from measurement import core, measurements
 from measurement.test import utilities
 from measurement.io import npyjson
 
@@ -56,3 +62,342 @@ def test_memmap():
         name = 'stream'
         io.write(original, name)
         assert original == io.read(name)
+
+
+def test_memmap_release():
+    with TempDirectory() as directory:
+        original = utilities.fake_time_ordered_stream()
+        with npyjson.NpyJsonIO(directory.path, memmap=True) as io:
+            io.write(original, 'stream')
+            stream = io.read('stream')
+            view = stream.data[1:]
+            assert not stream.data.flags.writeable
+            assert io.release_mappings() == 2
+            del stream
+            assert io.release_mappings() == 1
+            assert np.all(view == original.data[1:])
+        assert io.closed
+        del view
+        assert io.release_mappings() == 0
+
+
+def test_advise():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path, memmap=True, advice='random')
+        original = utilities.fake_time_ordered_stream()
+        io.write(original, 'stream')
+        with io.advise('sequential'):
+            assert io.advice == 'sequential'
+            assert original == io.read('stream')
+        assert io.advice == 'random'
+        with pytest.raises(ValueError):
+            with io.advise('backwards'):
+                pass
+        io.close()
+
+
+def test_read_lazy():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_time_ordered_stream_array()
+        name = 'stream_array'
+        io.write(original, name)
+        lazy = io.read(name, lazy=True)
+        assert isinstance(lazy.data, npyjson.NpyArray)
+        assert lazy.data.shape == original.data.shape
+        assert lazy.data.dtype == original.data.dtype
+        assert np.all(lazy.data[1, 10:20] == original.data[1, 10:20])
+        assert np.all(lazy[2].data == original.data[2])
+        assert original == lazy
+
+
+def test_read_exclude_does_not_touch_storage():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        shutil.rmtree(os.path.join(directory.path, name, 'stream'))
+        os.remove(os.path.join(directory.path, name, 'sweep', 'data' + npyjson.NpyJsonIO.ARRAY_EXTENSION))
+        ss = io.read(name, exclude=['stream', 'sweep/data'], force=True)
+        assert ss.stream is None
+        assert ss.sweep.data is None
+        assert np.all(ss.sweep.frequency == original.sweep.frequency)
+
+
+def test_read_workers():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = core.MeasurementList([utilities.fake_sweep_stream() for _ in range(10)])
+        name = 'sweep_streams'
+        io.write(original, name)
+        ml = io.read(name, workers=4)
+        assert len(ml) == len(original)
+        assert all(m == o for m, o in zip(ml, original))
+
+
+def test_batch():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name, buffered=True)
+        assert original == io.read(name)
+
+
+def test_batch_rollback():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+
+        def fail(*args):
+            raise RuntimeError()
+
+        io.write_array = fail
+        try:
+            io.write(utilities.fake_sweep_stream(), 'sweep_stream', buffered=True)
+            raise AssertionError("The commit should have failed.")
+        except RuntimeError:
+            pass
+        assert not io.node_names()
+        assert not os.path.exists(os.path.join(directory.path, 'sweep_stream'))
+
+
+def test_index():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        io.close()
+        io = npyjson.NpyJsonIO(directory.path)
+        assert io._index is not None
+        listdir = os.listdir
+        try:
+            os.listdir = None  # Reading should not list any directories.
+            assert original == io.read(name)
+        finally:
+            os.listdir = listdir
+        assert sorted(io.node_names(name)) == ['stream', 'sweep']
+        assert sorted(io.array_names(core.join(name, 'sweep'))) == ['data', 'frequency']
+
+
+def test_index_stale():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        with open(os.path.join(directory.path, core.INDEX), 'a') as f:
+            f.write('{"begin": true}\n')  # This simulates an interrupted write.
+        io.close()
+        io = npyjson.NpyJsonIO(directory.path)
+        assert io._index is None
+        assert original == io.read(name)
+
+
+def test_index_direct_writes():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        io.create_node('/node')
+        io.write_array('/node', 'array', np.arange(3.), ('x',))
+        io.write_other('/node', 'key', 1)
+        assert io._index is not None
+        assert io.node_names() == ['node']
+        assert io.array_names('node') == ['array']
+        assert io.other_names('node') == ['key']
+        io.close()
+        io = npyjson.NpyJsonIO(directory.path)
+        assert io._index is not None
+        assert io.node_names() == ['node']
+
+
+def test_index_refresh():
+    with TempDirectory() as directory:
+        writer = npyjson.NpyJsonIO(directory.path)
+        writer.write(utilities.fake_time_ordered_stream(), 'first')
+        reader = npyjson.NpyJsonIO(directory.path)
+        assert reader.node_names() == ['first']
+        writer.write(utilities.fake_time_ordered_stream(), 'second')
+        assert reader.node_names() == ['first', 'second']
+        assert reader._index is not None
+        # A read checks the length of the index once, however many nodes it lists.
+        writer.write(core.MeasurementList([utilities.fake_time_ordered_stream() for _ in range(3)]), 'list')
+        assert 'list' in reader.node_names()
+        lengths = []
+        index_log_length = reader._index_log_length
+        reader._index_log_length = lambda: lengths.append(None) or index_log_length()
+        assert len(reader.read('list')) == 3
+        assert len(lengths) == 1
+
+
+def test_read_trusted_state():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        calls = []
+        init = core.StateDict.__init__
+        validate_key = core.StateDict._validate_key
+        core.StateDict.__init__ = lambda self, *args, **kwargs: calls.append('init') or init(self, *args, **kwargs)
+        core.StateDict._validate_key = lambda self, key: calls.append(key) or validate_key(self, key)
+        try:
+            ss = io.read('sweep_stream')
+        finally:
+            core.StateDict.__init__ = init
+            core.StateDict._validate_key = validate_key
+        assert calls == []  # The state written to disk is not validated again on read.
+        assert ss == original
+        assert type(ss.stream.state) is core.StateDict
+        # An adopted state is an ordinary StateDict, so modifying and reusing it validates it.
+        ss.stream.state['with space'] = 1
+        try:
+            measurements.TimeOrderedStream(time=ss.stream.time, data=ss.stream.data, state=ss.stream.state)
+            raise AssertionError("The state should be invalid.")
+        except core.MeasurementError:
+            pass
+
+
+def test_read_cache_from_series():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        df = original.to_dataframe(add_origin=True)
+        cache = core.enable_read_cache(max_bytes=2 ** 30)
+        try:
+            ss = core.from_series(df.iloc[0])
+            assert ss == original
+            assert core.from_series(df.iloc[0]) is ss
+            assert io.read(core.join(name, 'stream')) is ss.stream
+            # The first call looks up the sweep stream before opening the root, and reading it looks up all three nodes.
+            assert cache.stats()['hits'] == 2
+            assert cache.stats()['misses'] == 4
+            ss._io.close()
+            assert core.from_series(df.iloc[0]) is not ss
+        finally:
+            core.disable_read_cache()
+
+
+def test_append_array():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.npj')
+        io = npyjson.NpyJsonIO(root_path)
+        io.write(utilities.fake_time_ordered_stream(num_samples=0), 'stream')
+        full = utilities.fake_time_ordered_stream(num_samples=100)
+        with io.open_array_writer('stream', 'time') as time_writer, io.open_array_writer('stream', 'data') as writer:
+            for start in range(0, 100, 25):
+                time_writer.append(full.time[start:start + 25])
+                writer.append(full.data[start:start + 25])
+        assert io.read_lazy_array('/stream', 'data').shape == (100,)
+        io.close()
+        io = npyjson.NpyJsonIO(root_path)
+        assert io._index is not None
+        stream = io.read('stream')
+        assert np.all(stream.time == full.time)
+        assert np.all(stream.data == full.data)
+
+
+def test_io_list_read():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(os.path.join(directory.path, 'test.npj'))
+        io_list = core.IOList()
+        io.write(io_list, 'io_list')
+        sweeps = [utilities.fake_frequency_sweep(num_frequencies=16) for _ in range(3)]
+        for number, sweep in enumerate(sweeps):
+            io_list.append(sweep)
+            assert len(io_list) == number + 1
+            assert io_list[number] == sweep
+        assert all(read == original for read, original in zip(io_list, sweeps))
+
+
+def test_consolidate():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.npj')
+        io = npyjson.NpyJsonIO(root_path, metadata={'experiment': 'test'}, consolidate=True)
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert sorted(os.listdir(os.path.join(root_path, 'sweep_stream'))) == ['_node.json', 'stream', 'sweep']
+        assert sorted(os.listdir(os.path.join(root_path, 'sweep_stream', 'stream'))) == ['_node.json', 'data.npy',
+                                                                                         'time.npy']
+        io.close()
+        io = npyjson.NpyJsonIO(root_path)
+        assert io.metadata == {'experiment': 'test'}
+        assert original == io.read('sweep_stream')
+        assert sorted(io.other_names('sweep_stream/stream')) == ['description', 'state']
+
+
+def test_consolidate_reads_one_file_per_key():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.npj')
+        io = npyjson.NpyJsonIO(root_path)
+        legacy = utilities.fake_sweep_stream()
+        io.write(legacy, 'legacy')
+        io.close()
+        io = npyjson.NpyJsonIO(root_path, consolidate=True)
+        consolidated = utilities.fake_sweep_stream()
+        io.write(consolidated, 'consolidated')
+        assert legacy == io.read('legacy')
+        assert consolidated == io.read('consolidated')
+        assert io.read('legacy').state == io.read('consolidated').state
+
+
+def test_listing_cache():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.npj')
+        io = npyjson.NpyJsonIO(root_path)
+        original = core.MeasurementList([utilities.fake_sweep_stream() for _ in range(3)])
+        io.write(original, 'list')
+        io.close()
+        os.remove(os.path.join(root_path, core.INDEX))
+        io = npyjson.NpyJsonIO(root_path)
+        scandir = os.scandir
+        scanned = []
+
+        def counting_scandir(path):
+            scanned.append(path)
+            return scandir(path)
+
+        os.scandir = counting_scandir
+        try:
+            assert original == io.read('list')
+        finally:
+            os.scandir = scandir
+        assert len(scanned) == len(set(scanned))
+        assert io._scans is None
+        io.write(core.Measurement(), 'new')
+        assert 'new' in io.node_names()
+
+
+def test_read_array_slice():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path)
+        original = utilities.fake_time_ordered_stream_array()
+        io.write(original, 'stream_array')
+        for index in [(2, slice(None)), (slice(None), slice(10, 20)), ([3, 1], slice(None, None, -3))]:
+            assert np.all(io.read_array_slice('stream_array', 'data', index) == original.data[index])
+        assert np.all(io.read('stream_array', lazy=True)[1].data == original.data[1])
+
+
+def test_dedupe():
+    with TempDirectory() as directory:
+        io = npyjson.NpyJsonIO(directory.path, dedupe=True)
+        original = core.MeasurementList(utilities.fake_time_ordered_stream_array().iter_channels())
+        io.write(original, 'streams')
+        assert len(os.listdir(os.path.join(directory.path, io.BLOBS))) == 5  # One time array and four data arrays.
+        assert sorted(os.listdir(os.path.join(directory.path, 'streams', '0'))) == [
+            '_class', '_fingerprint', '_version', 'data.ref', 'description', 'state', 'time.ref']
+        for memmap in (False, True):
+            reader = npyjson.NpyJsonIO(directory.path, memmap=memmap)
+            assert reader.node_names() == ['streams']
+            streams = reader.read('streams')
+            assert streams == original
+            assert streams[0].time is streams[3].time and not streams[0].time.flags.writeable
+            assert np.all(reader.read_array_slice('streams/2', 'data', slice(5, 9)) == original[2].data[5:9])
+            assert reader.fingerprint('streams') == original.fingerprint()
+        # Appending to an array that is shared gives the node its own copy.
+        with io.open_array_writer('streams/1', 'time') as time, io.open_array_writer('streams/1', 'data') as data:
+            time.append(np.ones(1))
+            data.append(np.ones(1, dtype='complex'))
+        assert io.read('streams/1').time.size == original[1].time.size + 1
+        assert io.read('streams/0') == original[0]
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+from testfixtures import TempDirectory
+
+from measurement import core
+from measurement.test import utilities
+from measurement.io import packed
+
+
+def test_read_write_measurement():
+    with TempDirectory() as directory:
+        io = packed.PackedIO(os.path.join(directory.path, 'test.pak'))
+        original = utilities.CornerCases()
+        name = 'measurement'
+        io.write(original, name)
+        assert original == io.read(name)
+        io.close()
+
+
+def test_read_write_sweep_stream():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.pak')
+        io = packed.PackedIO(root_path, metadata={'key': 'value'})
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name)
+        io.close()
+        io = packed.PackedIO(root_path)
+        assert io.metadata == {'key': 'value'}
+        assert io.node_names() == [name]
+        assert original == io.read(name)
+        assert original == io.read(name, lazy=True)
+        io.close()
+
+
+def test_zero_copy_views():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.pak')
+        io = packed.PackedIO(root_path)
+        original = utilities.fake_time_ordered_stream()
+        io.write(original, 'stream')
+        io.close()
+        io = packed.PackedIO(root_path)
+        data = io.read_array('stream', 'data')
+        assert not data.flags.owndata and not data.flags.writeable
+        assert data.ctypes.data % io.ALIGNMENT == 0
+        assert np.all(data == original.data)
+        io.close()
+        assert np.all(data == original.data)  # The mapping stays open while the array uses it.
+
+
+def test_append_only():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.pak')
+        io = packed.PackedIO(root_path)
+        first = utilities.fake_time_ordered_stream()
+        io.write(first, 'first')
+        io.close()
+        size = os.path.getsize(root_path)
+        io = packed.PackedIO(root_path)
+        second = utilities.fake_frequency_sweep()
+        io.write(second, 'second')
+        # A reader that opens the file while it is being written sees everything that has been flushed.
+        assert packed.PackedIO(root_path).node_names() == ['first', 'second']
+        io.close()
+        # An interrupted write leaves the last complete footer in place.
+        with open(root_path, 'ab') as f:
+            f.write(b'\0' * 100)
+        io = packed.PackedIO(root_path)
+        assert first == io.read('first')
+        assert second == io.read('second')
+        io.close()
+        with open(root_path, 'r+b') as f:
+            f.truncate(size + 10)
+        io = packed.PackedIO(root_path)
+        assert io.node_names() == ['first']
+        assert first == io.read('first')
+        io.close()
+
+
+def test_batch_rollback():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.pak')
+        io = packed.PackedIO(root_path)
+        with pytest.raises(ValueError):
+            with io.batch():
+                io.write(utilities.fake_time_ordered_stream(), 'stream')
+                io.write(utilities.CornerCases(), 'bad')
+                io.write_other('/bad', 'unserializable', object())
+        assert io.node_names() == []
+        io.close()
+        assert packed.PackedIO(root_path).node_names() == []
+
+
+def test_from_series():
+    with TempDirectory() as directory:
+        io = packed.PackedIO(os.path.join(directory.path, 'test.pak'))
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert core.from_series(original.to_dataframe(add_origin=True).iloc[0]) == original
+        io.close()
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+from testfixtures import TempDirectory
+
+from measurement import core
+from measurement.test import utilities
+from measurement.io import sqlite
+
+
+def test_read_write_measurement():
+    with TempDirectory() as directory:
+        io = sqlite.SqliteIO(os.path.join(directory.path, 'test.sqlite'))
+        original = utilities.CornerCases()
+        name = 'measurement'
+        io.write(original, name)
+        assert original == io.read(name)
+        io.close()
+
+
+def test_read_write_sweep_stream():
+    with TempDirectory() as directory:
+        root_path = os.path.join(directory.path, 'test.sqlite')
+        io = sqlite.SqliteIO(root_path, metadata={'key': 'value'})
+        original = utilities.fake_sweep_stream()
+        name = 'sweep_stream'
+        io.write(original, name, buffered=True)
+        io.close()
+        io = sqlite.SqliteIO(root_path)
+        assert io.metadata == {'key': 'value'}
+        assert io.execute('PRAGMA journal_mode') == [('wal',)]
+        assert original == io.read(name)
+        assert original == io.read(name, lazy=True)
+        io.close()
+
+
+def test_query_state():
+    with TempDirectory() as directory:
+        io = sqlite.SqliteIO(os.path.join(directory.path, 'test.sqlite'))
+        sweeps = core.MeasurementList()
+        for temperature in (0.05, 0.1, 0.2, 0.3):
+            sweep = utilities.fake_frequency_sweep()
+            sweep.state.temperature = temperature
+            sweeps.append(sweep)
+        io.write(sweeps, 'sweeps', buffered=True)
+        rows = io.execute("SELECT nodes.path FROM nodes JOIN others ON others.node = nodes.id "
+                          "WHERE nodes.class = ? AND others.key = 'state' AND "
+                          "json_extract(others.value, '$.temperature') > ? ORDER BY nodes.path",
+                          ('FrequencySweep', 0.15))
+        assert rows == [('/sweeps/2',), ('/sweeps/3',)]
+        assert np.all(io.read(rows[0][0]).frequency == sweeps[2].frequency)
+        io.close()
+
+
+def test_write_rollback():
+    with TempDirectory() as directory:
+        io = sqlite.SqliteIO(os.path.join(directory.path, 'test.sqlite'))
+        bad = utilities.CornerCases()
+        bad.unserializable = object()
+        for buffered in (False, True):
+            with pytest.raises(ValueError):
+                io.write(core.MeasurementList([utilities.fake_time_ordered_stream(), bad]), 'list', buffered=buffered)
+            assert io.node_names() == []
+            assert io.execute('SELECT count(*) FROM arrays') == [(0,)]
+        io.close()
+
+
+def test_from_series():
+    with TempDirectory() as directory:
+        io = sqlite.SqliteIO(os.path.join(directory.path, 'test.sqlite'))
+        original = utilities.fake_sweep_stream()
+        io.write(original, 'sweep_stream')
+        assert core.from_series(original.to_dataframe(add_origin=True).iloc[0]) == original
+        io.close()
+
+
+def test_read_array_slice():
+    with TempDirectory() as directory:
+        io = sqlite.SqliteIO(os.path.join(directory.path, 'test.sqlite'))
+        original = utilities.fake_time_ordered_stream_array()
+        io.write(original, 'stream_array')
+        for index in [(2, slice(None)), (slice(None), slice(10, 20)), ([3, 1], slice(None, None, -3)),
+                      (slice(2, 2),)]:
+            assert np.all(io.read_array_slice('stream_array', 'data', index) == original.data[index])
+        assert np.all(io.read('stream_array', lazy=True)[1].data == original.data[1])
+        io.close()
@@ -3,7 +3,7 @@ from collections import OrderedDict
 
 import numpy as np
 
-from measurement.core import Measurement
+from measurement.core import Dimensions, LazyArray, Measurement, Node
 
 
 class TimeOrderedStream(Measurement):
@@ -27,24 +27,127 @@ class TimeOrderedStreamArray(Measurement):
     """
 
     _version = 0
+    # Each channel is stored in its own chunks, so that reading one channel does not read the others.
     dimensions = OrderedDict([('time', ('time',)),
-                              ('data', ('num_channels', 'time'))])
+                              ('data', Dimensions(('num_channels', 'time'), chunks='auto'))])
 
     def __init__(self, time, data, state, description='TimeOrderedStreamArray', validate=True):
         self.time = time
         self.data = data
         super(TimeOrderedStreamArray, self).__init__(state=state, description=description, validate=validate)
 
+    @classmethod
+    def from_streams(cls, streams, state=None, description='TimeOrderedStreamArray'):
+        """
+        Return a new TimeOrderedStreamArray that stacks the data of the given TimeOrderedStreams, which must share the
+        same time array. If the data arrays are rows spaced evenly through one buffer, such as the channels of another
+        TimeOrderedStreamArray, the new data array is a view of that buffer and no data are copied.
+
+        :param streams: a sequence of TimeOrderedStreams, one per channel.
+        :param state: the state of the new instance; the default is the state of the first stream.
+        :param description: the description of the new instance.
+        :return: a new TimeOrderedStreamArray.
+        """
+        streams = list(streams)
+        if not streams:
+            raise ValueError("At least one stream is required.")
+        time = streams[0].time
+        for stream in streams[1:]:
+            if stream.time is not time and not np.array_equal(stream.time, time):
+                raise ValueError("All streams must have the same time array.")
+        if state is None:
+            state = streams[0].state
+        return cls(time=time, data=stack_rows([np.asarray(stream.data) for stream in streams]), state=state,
+                   description=description)
+
     @property
     def num_channels(self):
-        return np.arange(self.data.shape[0])
+        # This is accessed by every validation and channel read, so the array is created only when the length changes.
+        num_channels = self.__dict__.get('_num_channels')
+        if num_channels is None or num_channels.size != self.data.shape[0]:
+            num_channels = np.arange(self.data.shape[0])
+            num_channels.flags.writeable = False
+            self._num_channels = num_channels
+        return num_channels
 
     def __getitem__(self, number):
-        tod = TimeOrderedStream(time=self.time, data=self.data[int(number), :], state=self.state,
-                                description=self.description)
-        tod._io = self._io
-        tod._io_node_path = self._io_node_path
-        return tod
+        if isinstance(self.data, LazyArray):
+            # The data have not been read from disk, so read only this channel.
+            data = self.data.io.read_array_slice(self.data.node_path, self.data.key, (int(number), slice(None)))
+        else:
+            data = self.data[int(number), :]
+        return TimeOrderedStreamView(self, data)
+
+    def iter_channels(self):
+        """
+        Yield a TimeOrderedStreamView for each channel, in order. The views share the time array and state of this
+        instance, and their data arrays are views of its rows.
+        """
+        if isinstance(self.data, LazyArray):
+            for number in range(self.data.shape[0]):
+                yield self[number]
+        else:
+            for data in self.data:
+                yield TimeOrderedStreamView(self, data)
+
+    def map_channels(self, function, vectorized=False):
+        """
+        Apply a function to each channel and return the results as an array indexed by channel.
+
+        :param function: if vectorized is False, a function that takes a TimeOrderedStream; if vectorized is True, a
+          function that takes the two-dimensional data array and operates along its last axis, such as
+          lambda data: np.mean(data, axis=-1).
+        :param vectorized: if True, call the function once on the whole data array instead of once per channel.
+        :return: a numpy array whose first axis is the channel.
+        """
+        if vectorized:
+            return np.asarray(function(np.asarray(self.data)))
+        return np.array([function(channel) for channel in self.iter_channels()])
+
+
+class TimeOrderedStreamView(TimeOrderedStream):
+    """
+    This class is a TimeOrderedStream for one channel of a TimeOrderedStreamArray. It shares the time array, state, and
+    description of the array, and its data is normally a view of one row, so creating one copies nothing and skips the
+    validation that the array has already done. Changes to its state are changes to the state of the array.
+
+    It is written to disk as a TimeOrderedStream.
+    """
+
+    @classmethod
+    def class_name(cls):
+        return cls.__base__.__name__
+
+    def __init__(self, stream_array, data):
+        Node.__init__(self)
+        self.time = stream_array.time
+        self.data = data
+        self.state = stream_array.state
+        self.description = stream_array.description
+        self._io = stream_array._io
+        self._io_node_path = stream_array._io_node_path
+
+
+def stack_rows(rows):
+    """
+    Return the given one-dimensional arrays stacked as the rows of a two-dimensional array. If the rows have the same
+    shape, dtype, and strides and are spaced evenly through the same buffer, the return value is a view of that buffer;
+    otherwise, the rows are copied.
+
+    :param rows: a sequence of one-dimensional numpy arrays.
+    :return: a two-dimensional numpy array.
+    """
+    first = rows[0]
+    if first.ndim == 1 and first.base is not None and all(row.base is first.base and row.dtype == first.dtype and
+                                                          row.shape == first.shape and row.strides == first.strides
+                                                          for row in rows):
+        addresses = [row.__array_interface__['data'][0] for row in rows]
+        step = addresses[1] - addresses[0] if len(rows) > 1 else first.itemsize * first.size
+        if step and all(b - a == step for a, b in zip(addresses[:-1], addresses[1:])):
+            return np.lib.stride_tricks.as_strided(first, shape=(len(rows),) + first.shape,
+                                                   strides=(step,) + first.strides,
+                                                   writeable=all(row.flags.writeable for row in rows))
+    return np.stack(rows)
 
 
 class FrequencySweep(Measurement):
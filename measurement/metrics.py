@@ -0,0 +1,154 @@
+"""
+This module contains the IOMetrics class, which records the operations performed by IO objects. See IO.instrument().
+
+The recorded events can be summarized as a dict of call counts, wall times, and bytes moved per backend, per operation,
+and per node path, or exported in the Chrome trace event format: load the JSON file in chrome://tracing or
+https://ui.perfetto.dev to see the recursion of IO._read_node() and IO._write_node() as a flame chart.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import namedtuple
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# These are the IO methods that are timed when instrumentation is enabled.
+OPERATIONS = ('create_node', 'write_other', 'write_array', 'read_array', 'read_lazy_array', 'read_array_slice',
+              'read_other', 'node_names', 'array_names', 'other_names', '_read_node', '_write_node')
+
+# This records a single call to one of the above methods; times are in seconds from time.perf_counter().
+Event = namedtuple('Event', ('backend', 'operation', 'node_path', 'key', 'start', 'end', 'nbytes', 'thread'))
+
+
+class IOMetrics(object):
+    """
+    This class records the IO operations performed while it is installed by IO.instrument().
+
+    Subclasses, or any other object with a compatible record() method, can be used as hooks that do something else
+    with each event, such as logging it.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, event):
+        """
+        Record the given Event. This is called after every instrumented operation, from the thread that performed it.
+        """
+        self.events.append(event)
+
+    def summary(self):
+        """
+        Return a dict that maps backend class name to a dict with keys
+        'operations': a dict that maps operation name to a dict of 'calls', 'seconds', and 'bytes';
+        'node_paths': a dict that maps node path to a dict that maps operation name to a dict of the same form.
+        The times of _read_node() and _write_node() include the times of the operations that they contain.
+
+        Returns
+        -------
+        dict
+            The totals described above.
+        """
+        summary = {}
+        for event in self.events:
+            backend = summary.setdefault(event.backend, {'operations': {}, 'node_paths': {}})
+            node_path = backend['node_paths'].setdefault(event.node_path, {})
+            for totals in (backend['operations'].setdefault(event.operation, _empty_totals()),
+                           node_path.setdefault(event.operation, _empty_totals())):
+                totals['calls'] += 1
+                totals['seconds'] += event.end - event.start
+                totals['bytes'] += event.nbytes
+        return summary
+
+    def to_dict(self):
+        """
+        Return a dict containing the summary and a list of all events, each of which is a dict.
+        """
+        return {'summary': self.summary(),
+                'events': [event._asdict() for event in self.events]}
+
+    def to_chrome_trace(self):
+        """
+        Return a dict in the Chrome trace event format that contains a complete event for each operation.
+        """
+        pid = os.getpid()
+        origin = min([event.start for event in self.events] or [0])
+        trace_events = []
+        for event in self.events:
+            trace_events.append({'name': event.operation,
+                                 'cat': event.backend,
+                                 'ph': 'X',
+                                 'ts': 1e6 * (event.start - origin),
+                                 'dur': 1e6 * (event.end - event.start),
+                                 'pid': pid,
+                                 'tid': event.thread,
+                                 'args': {'node_path': event.node_path, 'key': event.key, 'bytes': event.nbytes}})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        """
+        Write the Chrome trace returned by to_chrome_trace() to the given file as JSON.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+def instrumented(io, operation, method, hooks):
+    """
+    Return a function that calls the given bound method of the given IO instance and passes an Event to the record()
+    method of each of the given hooks.
+    """
+    backend = io.__class__.__name__
+    node_path_index = 1 if operation == '_write_node' else 0
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        finally:
+            end = time.perf_counter()
+            if len(args) > node_path_index:
+                node_path = args[node_path_index]
+            else:
+                node_path = kwargs.get('node_path', '/')
+            if len(args) > node_path_index + 1 and operation != '_read_node':
+                key = args[node_path_index + 1]
+            else:
+                key = None
+            event = Event(backend=backend, operation=operation, node_path=node_path, key=key, start=start, end=end,
+                          nbytes=_nbytes(operation, args, result), thread=threading.current_thread().ident)
+            for hook in hooks:
+                hook.record(event)
+
+    return wrapper
+
+
+def _empty_totals():
+    return {'calls': 0, 'seconds': 0., 'bytes': 0}
+
+
+def _nbytes(operation, args, result):
+    """
+    Return the number of bytes moved by the given operation: the array size for arrays, or the length of the JSON
+    representation for other values, which is an estimate of the stored size.
+    """
+    if operation == 'write_array':
+        return args[2].nbytes
+    elif operation in ('read_array', 'read_array_slice'):
+        return getattr(result, 'nbytes', 0)
+    elif operation == 'write_other':
+        value = args[2]
+    elif operation == 'read_other':
+        value = result
+    else:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    try:
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return len(repr(value))
@@ -0,0 +1,29 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from measurement import benchmark
+from measurement.io import dictionary
+
+
+def test_compare():
+    baseline = {'results': {'a.read_seconds': 1., 'a.write_bytes_per_second': 100., 'a.other': 1.}}
+    current = {'results': {'a.read_seconds': 1.5, 'a.write_bytes_per_second': 50., 'a.other': 10.}}
+    regressions = benchmark.compare(baseline, current, threshold=0.2)
+    assert [name for name, _, _, _ in regressions] == ['a.read_seconds', 'a.write_bytes_per_second']
+    assert not benchmark.compare(baseline, baseline, threshold=0.2)
+
+
+def test_write_synthetic_dataset():
+    io = dictionary.Dictionary()
+    number = benchmark.write_synthetic_dataset(io, 'synthetic', total_bytes=3 * 2 * 16 * 2 ** 8, num_channels=2,
+                                               num_samples=2 ** 8)
+    assert number == 3
+    synthetic = io.read('synthetic')
+    assert len(synthetic) == 3
+    assert benchmark.nbytes(synthetic) == 3 * (2 * 2 ** 8 * 16 + 2 ** 8 * 8)
+
+
+def test_state_dict():
+    results = benchmark.state_dict(quick=True)
+    assert list(results) == ['{}_per_second'.format(name)
+                             for name in ('dict', 'state_dict', 'trusted', 'measurement', 'trusted_measurement')]
+    assert all(rate > 0 for rate in results.values())
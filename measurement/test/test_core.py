@@ -72,6 +72,34 @@ def test_state_dict():
     s.copy()
 
 
+def test_state_dict_fast_paths():
+    original = core.StateDict(utilities.corners)
+    for key in ('1st', 'class', 'len', 'with space'):
+        for _ in range(2):  # Invalid keys are never remembered as valid.
+            try:
+                core.StateDict({key: 1})
+                raise AssertionError("Key {!r} should be invalid.".format(key))
+            except core.MeasurementError:
+                pass
+    copied = core.StateDict(original)
+    assert copied == original
+    assert copied.list_dict is not original.list_dict and isinstance(copied.list_dict, core.StateDict)
+    assert copied.int_list is not original.int_list
+    original.added = {'pair': (1, 2)}  # Values added after construction are not validated until they are copied.
+    assert core.StateDict(original).added == {'pair': [1, 2]}
+    # A StateDict can be modified after construction, so copying it validates its contents again.
+    for key, value in (('with space', 1), ('objects', [object()])):
+        modified = core.StateDict(original)
+        modified[key] = value
+        try:
+            measurements.TimeOrderedStream(time=np.arange(2.), data=np.zeros(2, dtype=complex), state=modified)
+            raise AssertionError("The state should be invalid.")
+        except (core.MeasurementError, ValueError):
+            pass
+    trusted = core.StateDict.trusted({'outer': {'inner': {'value': 1}}})
+    assert isinstance(trusted.outer.inner, core.StateDict)
+
+
 def test_read_write():
     io = dictionary.Dictionary()
     original = utilities.CornerCases()
@@ -210,3 +238,439 @@ def test_sweep_stream_array_node_path():
     assert moved.stream_arrays[0].current_node_path == '/moved/stream_arrays/0'
     assert moved.stream_arrays[0].io_node_path == '/ssa/sweep_array/stream_arrays/0'
 """
+
+
+def test_read_lazy():
+    io = dictionary.Dictionary()
+    original = utilities.fake_time_ordered_stream_array()
+    name = 'stream_array'
+    io.write(original, name)
+    lazy = io.read(name, lazy=True)
+    assert isinstance(lazy.data, core.LazyArray)
+    assert lazy.data.shape == original.data.shape
+    assert lazy.data.dtype == original.data.dtype
+    assert np.all(lazy.data[1, 10:20] == original.data[1, 10:20])
+    assert original == lazy
+
+
+def test_read_exclude():
+    io = dictionary.Dictionary()
+    original = utilities.fake_sweep_stream()
+    name = 'sweep_stream'
+    io.write(original, name)
+    ss = io.read(name, exclude='stream', force=True)
+    assert ss.stream is None
+    assert ss.sweep == original.sweep
+    ss = io.read(name, exclude='sweep/data')
+    assert isinstance(ss.sweep.data, core.LazyArray)
+    assert np.all(ss.sweep.frequency == original.sweep.frequency)
+    ss = io.read(name, exclude='data', force=True)
+    assert ss.sweep.data is None
+    assert ss.stream.data is None
+
+
+def test_read_exclude_list_element():
+    io = dictionary.Dictionary()
+    original = core.MeasurementList([utilities.fake_time_ordered_stream() for _ in range(3)])
+    io.write(original, 'list')
+    try:
+        io.read('list', exclude='/1')
+        raise AssertionError("Skipping a list element should require force=True.")
+    except core.MeasurementError:
+        pass
+    partial = io.read('list', exclude='/1', force=True)
+    assert partial == core.MeasurementList([original[0], original[2]])
+    assert [m._io_node_path for m in partial] == ['/list/0', '/list/2']
+    assert io.read('list', exclude='/1/data', force=True)[1].data is None
+
+
+def test_read_include():
+    io = dictionary.Dictionary()
+    original = utilities.fake_sweep_stream()
+    name = 'sweep_stream'
+    io.write(original, name)
+    ss = io.read(name, include='/stream', force=True)
+    assert ss.sweep is None
+    assert ss.stream == original.stream
+    ss = io.read(name, include=['*/frequency'])
+    assert np.all(ss.sweep.frequency == original.sweep.frequency)
+    assert isinstance(ss.sweep.data, core.LazyArray)
+    assert isinstance(ss.stream.data, core.LazyArray)
+    assert ss == original
+
+
+def test_read_workers():
+    io = dictionary.Dictionary()
+    original = core.MeasurementList([utilities.fake_sweep_stream() for _ in range(10)])
+    name = 'sweep_streams'
+    io.write(original, name)
+    ml = io.read(name, workers=4)
+    assert len(ml) == len(original)
+    assert all(m == o for m, o in zip(ml, original))
+
+
+def test_batch():
+    io = dictionary.Dictionary()
+    sweep = utilities.fake_frequency_sweep()
+    stream = utilities.fake_time_ordered_stream()
+    with io.batch():
+        io.write(sweep)
+        io.write(stream)
+        assert not io.node_names()
+        assert sweep._io is None
+    assert sorted(io.node_names()) == ['FrequencySweep0', 'TimeOrderedStream1']
+    assert sweep._io is io
+    assert sweep == io.read('FrequencySweep0')
+    assert stream == io.read('TimeOrderedStream1')
+
+
+def test_batch_exception():
+    io = dictionary.Dictionary()
+    try:
+        with io.batch():
+            io.write(utilities.fake_frequency_sweep(), 'sweep')
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert not io.node_names()
+
+
+def test_batch_rollback():
+    io = dictionary.Dictionary()
+
+    def fail(*args):
+        raise RuntimeError()
+
+    io.write_array = fail
+    try:
+        io.write(utilities.fake_sweep_stream(), 'sweep_stream', buffered=True)
+        raise AssertionError("The commit should have failed.")
+    except RuntimeError:
+        pass
+    assert not io.node_names()
+
+
+def test_read_cache():
+    original = utilities.fake_sweep_stream()
+    name = 'sweep_stream'
+    io = dictionary.Dictionary(root_path=None)
+    io.write(original, name)
+    io.root_path = 'dictionary'  # Dictionary roots without a path string are never cached.
+    cache = core.enable_read_cache(max_bytes=2 ** 30)
+    try:
+        sweep = io.read(core.join(name, 'sweep'))
+        assert cache.stats()['misses'] == 1
+        ss = io.read(name)
+        assert ss.sweep is sweep
+        assert ss == original
+        assert cache.stats()['hits'] == 1
+        assert io.read(name) is ss
+        assert cache.stats()['entries'] == 3
+        assert cache.stats()['bytes'] == sum(a.nbytes for a in (original.sweep.frequency, original.sweep.data,
+                                                                  original.stream.time, original.stream.data))
+        io.write(utilities.CornerCases(), 'corner_cases')
+        assert cache.stats()['entries'] == 0
+    finally:
+        core.disable_read_cache()
+
+
+def test_read_cache_eviction():
+    io = dictionary.Dictionary()
+    io.root_path = 'dictionary'
+    streams = [utilities.fake_time_ordered_stream() for _ in range(3)]
+    for n, stream in enumerate(streams):
+        io.write(stream, 'stream{}'.format(n))
+    stream_bytes = streams[0].time.nbytes + streams[0].data.nbytes
+    cache = core.enable_read_cache(max_bytes=2 * stream_bytes)
+    try:
+        for n in range(3):
+            io.read('stream{}'.format(n))
+        assert cache.stats()['entries'] == 2
+        assert cache.stats()['evictions'] == 1
+        io.read('stream2')
+        assert cache.stats()['hits'] == 1
+        io.read('stream0')
+        assert cache.stats()['misses'] == 4
+    finally:
+        core.disable_read_cache()
+
+
+def test_read_cache_nested():
+    io = dictionary.Dictionary()
+    io.root_path = 'dictionary'
+    io.write(core.MeasurementList([utilities.fake_time_ordered_stream() for _ in range(2)]), 'list')
+    for name in ('first', 'second'):
+        io.write(utilities.fake_time_ordered_stream(), name)
+    stream_bytes = io.read('first').time.nbytes + io.read('first').data.nbytes
+    cache = core.enable_read_cache(max_bytes=3 * stream_bytes)
+    try:
+        io.read('list')
+        assert cache.stats()['entries'] == 3
+        assert cache.stats()['bytes'] == 2 * stream_bytes  # The list shares the arrays of its elements.
+        io.read('first')
+        # Evicting the first element also evicts the list, which would otherwise keep the element in memory.
+        io.read('second')
+        assert sorted(key[1] for key in cache._entries) == ['/first', '/list/1', '/second']
+        assert cache.stats()['bytes'] == 3 * stream_bytes
+        # A list larger than the budget is not cached, but its elements are cached within the budget.
+        cache.clear()
+        cache.max_bytes = stream_bytes
+        io.read('list')
+        assert [key[1] for key in cache._entries] == ['/list/1']
+        assert cache.stats()['bytes'] == stream_bytes
+    finally:
+        core.disable_read_cache()
+
+
+def test_read_cache_closed_io():
+    original = utilities.fake_sweep_stream()
+    name = 'sweep_stream'
+    first = dictionary.Dictionary()
+    first.root_path = 'dictionary'
+    first.write(original, name)
+    second = dictionary.Dictionary()
+    second.root_path = first.root_path
+    second._root = first._root
+    cache = core.enable_read_cache(max_bytes=2 ** 30)
+    try:
+        stream = first.read(core.join(name, 'stream'))
+        ss = second.read(name)
+        assert ss.stream is stream
+        assert second.read(name) is ss
+        first.close()
+        # The cached sweep stream contains a node read by the closed IO, so it is read again, reusing only the sweep.
+        reread = second.read(name)
+        assert reread is not ss
+        assert reread == original
+        assert reread.sweep is ss.sweep
+        assert reread.stream._io is second
+        assert cache.stats()['hits'] == 3
+    finally:
+        core.disable_read_cache()
+
+
+def test_resolve_class():
+    assert core.resolve_class('TimeOrderedStream', 0, {}) is measurements.TimeOrderedStream
+    translate = {'TimeOrderedStream': 'measurement.measurements.FrequencySweep'}
+    assert core.resolve_class('TimeOrderedStream', 0, translate) is measurements.FrequencySweep
+    assert core.resolve_class('TimeOrderedStream', 0, {}) is measurements.TimeOrderedStream
+
+
+def test_instantiate():
+    stream = utilities.fake_time_ordered_stream()
+    variables = dict((k, v) for k, v in stream.__dict__.items() if not k.startswith('_'))
+    assert core._instantiate(measurements.TimeOrderedStream, variables, force=False) == stream
+    del variables['data']
+    try:
+        core._instantiate(measurements.TimeOrderedStream, variables, force=False)
+        raise AssertionError("A missing required argument should have failed.")
+    except core.MeasurementError:
+        pass
+    variables['extra'] = 1
+    forced = core._instantiate(measurements.TimeOrderedStream, variables, force=True)
+    assert forced.data is None
+    assert forced.extra == 1
+
+
+def test_instrument():
+    io = dictionary.Dictionary()
+    original = utilities.fake_sweep_stream()
+    name = 'sweep_stream'
+    with io.instrument() as write_metrics:
+        io.write(original, name)
+    assert 'write_array' not in io.__dict__
+    with io.instrument() as read_metrics:
+        assert original == io.read(name)
+    operations = write_metrics.summary()['Dictionary']['operations']
+    assert operations['create_node']['calls'] == 3
+    assert operations['write_array']['calls'] == 4
+    assert operations['write_array']['bytes'] == sum(a.nbytes for a in (original.sweep.frequency, original.sweep.data,
+                                                                       original.stream.time, original.stream.data))
+    summary = read_metrics.summary()['Dictionary']
+    assert summary['operations']['_read_node']['calls'] == 3
+    assert summary['node_paths'][core.join('/', name, 'sweep')]['read_array']['calls'] == 2
+    trace = read_metrics.to_chrome_trace()
+    assert len(trace['traceEvents']) == len(read_metrics.events)
+    assert all(event['ph'] == 'X' for event in trace['traceEvents'])
+    with io.instrument() as slice_metrics:
+        assert np.all(io.read(name, lazy=True).stream.data[2:5] == original.stream.data[2:5])
+    summary = slice_metrics.summary()['Dictionary']
+    assert summary['operations']['read_array_slice']['calls'] == 1
+    assert summary['operations']['read_array_slice']['bytes'] == original.stream.data[2:5].nbytes
+    assert summary['node_paths'][core.join('/', name, 'stream')]['read_array_slice']['calls'] == 1
+
+
+def test_instrument_restores_attributes():
+    io = dictionary.Dictionary()
+    calls = []
+    read_array = io.read_array
+    io.read_array = lambda node_path, key: calls.append(key) or read_array(node_path, key)
+    patched = io.read_array
+    io.write(utilities.fake_time_ordered_stream(), 'stream')
+    with io.instrument() as io_metrics:
+        io.read('stream')
+        del io.read_array  # Removing the patch within the context does not break the exit.
+    assert io.read_array is patched
+    assert sorted(calls) == ['data', 'time']
+    assert io_metrics.summary()['Dictionary']['operations']['read_array']['calls'] == 2
+
+
+def test_append_array():
+    io = dictionary.Dictionary()
+    io.write(measurements.TimeOrderedStream(time=np.zeros(0), data=np.zeros(0, dtype='complex'), state={}), 'stream')
+    time = np.linspace(0, 1, 30)
+    data = np.exp(1j * time)
+    with io.open_array_writer('stream', 'time') as time_writer, io.open_array_writer('stream', 'data') as writer:
+        for start in range(0, 30, 10):
+            time_writer.append(time[start:start + 10])
+            writer.append(data[start:start + 10])
+    stream = io.read('stream')
+    assert np.all(stream.time == time)
+    assert np.all(stream.data == data)
+    try:
+        io.append_array('stream', 'time', np.zeros((1, 2)))
+        raise AssertionError("Appending a chunk with the wrong shape should fail.")
+    except ValueError:
+        pass
+
+
+def test_append_array_validates_dimensions():
+    io = dictionary.Dictionary()
+    io.write(measurements.TimeOrderedStream(time=np.zeros(0), data=np.zeros(0), state={}), 'stream')
+    writer = io.open_array_writer('stream', 'data')
+    writer.append(np.zeros(3))
+    # Validation waits until the last writer for the node closes.
+    io.append_array('stream', 'time', np.zeros(2))
+    try:
+        writer.close()
+        raise AssertionError("Closing the writer should have failed validation.")
+    except core.MeasurementError:
+        pass
+
+
+def test_io_list_read():
+    io = dictionary.Dictionary()
+    io_list = core.IOList()
+    io.write(io_list, 'io_list')
+    assert list(io_list) == []
+    streams = [utilities.fake_time_ordered_stream(num_samples=8) for _ in range(4)]
+    io_list.extend(streams)
+    assert len(io_list) == 4
+    assert io_list[1] == streams[1]
+    assert io_list[1] is not streams[1]
+    assert io_list[-1] == streams[3]
+    assert [stream.description for stream in io_list[1:3]] == [streams[1].description, streams[2].description]
+    assert all(read == original for read, original in zip(io_list, streams))
+    assert io.read('io_list') == core.MeasurementList(streams)
+    try:
+        io_list[4]
+        raise AssertionError("Indexing past the end should fail.")
+    except IndexError:
+        pass
+
+
+def test_io_list_window():
+    io = dictionary.Dictionary()
+    io_list = core.IOList(window=2)
+    io.write(io_list, 'io_list')
+    streams = [utilities.fake_time_ordered_stream(num_samples=8) for _ in range(3)]
+    io_list.extend(streams)
+    assert io_list[0] is not streams[0]
+    assert io_list[1] is streams[1]
+    assert io_list[2] is streams[2]
+
+
+def test_storage_policy():
+    io_policy = core.StoragePolicy(compression=4, checksum=True)
+    class_policy = core.StoragePolicy(chunks='auto', compression=1)
+    merged = io_policy.merge(class_policy)
+    assert merged == core.StoragePolicy(chunks='auto', compression=1, checksum=True)
+    assert io_policy.merge(None) is io_policy
+    dimensions = core.Dimensions(('num_channels', 'time'), chunks={'time': 100})
+    assert dimensions == ('num_channels', 'time')
+    assert dimensions.storage.chunk_shape((4, 1000), dimensions, 16) == (1, 100)
+    assert core.StoragePolicy(chunks='contiguous').chunk_shape((4, 1000), dimensions, 16) is None
+    assert core.auto_chunks((4, 2 ** 20), dimensions, 16, target_bytes=2 ** 20) == (1, 2 ** 16)
+    assert core.auto_chunks((0,), ('time',), 8, target_bytes=2 ** 10) == (2 ** 7,)
+
+
+def test_bounding_box():
+    array = np.arange(4 * 5 * 6).reshape(4, 5, 6)
+    for index in [Ellipsis, (), 1, -1, slice(None, None, -2), (1, 2, 3), (slice(1, 3), Ellipsis, 4),
+                  (Ellipsis, slice(5, 0, -2)), ([3, 0, 3], slice(None), [-1, 2, 0]), (np.array([[0], [2]]), 1),
+                  (slice(2, 2), [1]), (0, np.array([], dtype=int))]:
+        box, local = core.bounding_box(index, array.shape)
+        region = array[tuple(slice(start, stop) for start, stop in box)]
+        assert np.array_equal(region[local], array[index])
+    assert core.bounding_box((np.array([True, False, True, True]),), array.shape) is None
+    assert core.bounding_box((None, 1), array.shape) is None
+    for index in [(0, 5), ([0, 4],)]:
+        try:
+            core.bounding_box(index, array.shape)
+            assert False
+        except IndexError:
+            pass
+
+
+def test_read_array_slice():
+    io = dictionary.Dictionary()
+    original = utilities.fake_time_ordered_stream_array()
+    io.write(original, 'stream_array')
+    channel = io.read_array_slice('stream_array', 'data', (2, slice(None)))
+    assert np.all(channel == original.data[2])
+    assert np.shares_memory(channel, io.read_array('stream_array', 'data'))
+    lazy = io.read('stream_array', lazy=True)
+    assert np.all(lazy[3].data == original.data[3])
+
+
+def test_channel_views():
+    original = utilities.fake_time_ordered_stream_array()
+    assert original.num_channels is original.num_channels
+    channels = list(original.iter_channels())
+    assert [type(channel) for channel in channels] == [measurements.TimeOrderedStreamView] * 4
+    assert all(channel.time is original.time and channel.state is original.state for channel in channels)
+    assert np.shares_memory(channels[1].data, original.data)
+    assert np.all(original[-1].data == original.data[-1])
+    assert np.all(original.map_channels(lambda channel: channel.data.mean()) ==
+                  original.map_channels(lambda data: data.mean(axis=-1), vectorized=True))
+    stacked = measurements.TimeOrderedStreamArray.from_streams(channels[1:])
+    assert np.shares_memory(stacked.data, original.data)
+    assert np.all(stacked.data == original.data[1:])
+    reversed_ = measurements.TimeOrderedStreamArray.from_streams(channels[::-2])
+    assert np.all(reversed_.data == original.data[::-2])
+    copied = measurements.TimeOrderedStreamArray.from_streams([utilities.fake_time_ordered_stream(), channels[0]],
+                                                                state={})
+    assert not np.shares_memory(copied.data, original.data)
+    io = dictionary.Dictionary()
+    io.write(channels[0], 'channel')
+    assert io.read('channel').__class__ is measurements.TimeOrderedStream
+    assert io.read('channel') == channels[0]
+
+
+def test_fingerprint():
+    original = utilities.fake_sweep_stream()
+    stream = original.stream
+    same = measurements.TimeOrderedStream(time=stream.time.copy(), data=stream.data.copy(), state=dict(stream.state),
+                                          description=stream.description)
+    assert same.fingerprint() == stream.fingerprint()
+    same.state.temperature = 0.1
+    assert same.fingerprint() != stream.fingerprint()
+    del same.state.temperature
+    same.data[5] += 1
+    assert same.fingerprint() != stream.fingerprint()
+    io = dictionary.Dictionary()
+    io.write(original, 'sweep_stream')
+    io.read_array_slice = None  # The stored fingerprints are used, so no array data are read.
+    assert io.fingerprint('sweep_stream') == original.fingerprint()
+    assert io.read('sweep_stream').fingerprint() == original.fingerprint()
+    del io.read_array_slice
+    # Appending makes the stored fingerprints of the node and its parents stale.
+    with io.open_array_writer('sweep_stream/stream', 'time') as time_writer:
+        with io.open_array_writer('sweep_stream/stream', 'data') as writer:
+            time_writer.append(np.ones(1))
+            writer.append(np.ones(1, dtype='complex'))
+    assert io.fingerprint('sweep_stream') == io.read('sweep_stream').fingerprint() != original.fingerprint()
+    io_list = core.IOList()
+    io.write(io_list, 'io_list')
+    io_list.extend(original.stream for _ in range(2))
+    assert io.fingerprint('io_list') == core.MeasurementList([original.stream] * 2).fingerprint()